@@ -0,0 +1,78 @@
+# pylint: disable=g-bad-file-header
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Generate an offline image dataset from a Spriteworld task config.
+
+Scenes are sampled from the config's `init_sprites` and rendered with one of
+its renderers. Images, per-sprite masks and sprite factors are written into
+sharded .npy files, see spriteworld/datasets.py for the format:
+```bash
+python generate_dataset.py --config=$path_to_task_config$ \
+  --output_dir=/tmp/dataset --num_shards=100 --num_workers=8
+```
+
+Shards are seeded deterministically from --seed and their index, and running
+the same command again resumes any incomplete shards.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl import app
+from absl import flags
+from absl import logging
+from spriteworld import dataset_index
+from spriteworld import datasets
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string('config',
+                    'spriteworld.configs.cobra.goal_finding_new_position',
+                    'Module name of task config to use.')
+flags.DEFINE_string('mode', 'train', 'Task mode, "train" or "test"]')
+flags.DEFINE_string('output_dir', None, 'Directory to write the dataset to.')
+flags.DEFINE_integer('num_shards', 10, 'Number of shards.')
+flags.DEFINE_integer('shard_size', 1000, 'Number of samples per shard.')
+flags.DEFINE_integer('seed', 0, 'Dataset seed.')
+flags.DEFINE_integer('max_sprites', 8, 'Maximum number of sprites per scene.')
+flags.DEFINE_string('renderer', 'image',
+                    'Key of the config renderer producing the images.')
+flags.DEFINE_integer('num_workers', 1, 'Number of worker processes.')
+flags.DEFINE_boolean('build_index', True,
+                     'Whether to build the factor index of the dataset.')
+flags.mark_flag_as_required('output_dir')
+
+
+def main(argv):
+  del argv
+  num_generated = datasets.generate(
+      FLAGS.output_dir,
+      FLAGS.config,
+      FLAGS.num_shards,
+      mode=FLAGS.mode,
+      shard_size=FLAGS.shard_size,
+      seed=FLAGS.seed,
+      max_sprites=FLAGS.max_sprites,
+      renderer_name=FLAGS.renderer,
+      num_workers=FLAGS.num_workers)
+  logging.info('Generated %d samples in %s.', num_generated, FLAGS.output_dir)
+  if FLAGS.build_index:
+    num_rows = dataset_index.build_index(FLAGS.output_dir)
+    logging.info('Indexed %d sprites.', num_rows)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -66,9 +66,10 @@ class SelectMove(object):
     delta_pos = (action[2:] - 0.5) * self._scale
     return delta_pos
 
-  def apply_noise_to_action(self, action):
+  def apply_noise_to_action(self, action, rng=None):
     if self._noise_scale:
-      noise = np.random.normal(
+      rng = np.random if rng is None else rng
+      noise = rng.normal(
           loc=0.0, scale=self._noise_scale, size=action.shape)
       return action + noise
     else:
@@ -80,7 +81,7 @@ class SelectMove(object):
         return sprite
     return None
 
-  def step(self, action, sprites, keep_in_frame):
+  def step(self, action, sprites, keep_in_frame, rng=None):
     """Take an action and move the sprites.
 
     Args:
@@ -90,11 +91,13 @@ class SelectMove(object):
         the action, its position is updated.
       keep_in_frame: Bool. Whether to force sprites to stay in the frame by
         clipping their centers of mass to be in [0, 1].
+      rng: Random number generator for the action noise. If None, defaults to
+        np.random.
 
     Returns:
       Scalar cost of taking this action.
     """
-    noised_action = self.apply_noise_to_action(action)
+    noised_action = self.apply_noise_to_action(action, rng=rng)
     position = noised_action[:2]
     motion = self.get_motion(noised_action)
     clicked_sprite = self.get_sprite_from_position(position, sprites)
@@ -103,9 +106,10 @@ class SelectMove(object):
 
     return -self._motion_cost * np.linalg.norm(motion)
 
-  def sample(self):
+  def sample(self, rng=None):
     """Sample an action uniformly randomly."""
-    return np.random.uniform(0., 1., size=(4,))
+    rng = np.random if rng is None else rng
+    return rng.uniform(0., 1., size=(4,))
 
   def action_spec(self):
     return self._action_spec
@@ -184,7 +188,7 @@ class Embodied(object):
         return sprite
     return None
 
-  def step(self, action, sprites, keep_in_frame):
+  def step(self, action, sprites, keep_in_frame, rng=None):
     """Take an action and move the sprites.
 
     Args:
@@ -194,10 +198,13 @@ class Embodied(object):
         body.
       keep_in_frame: Bool. Whether to force sprites to stay in the frame by
         clipping their centers of mass to be in [0, 1].
+      rng: Unused random number generator, since this action space is
+        deterministic.
 
     Returns:
       Scalar cost of taking this action.
     """
+    del rng
 
     carry = action[0]
     motion = self.action_to_motion[action[1]]
@@ -213,9 +220,10 @@ class Embodied(object):
 
     return -self._motion_cost * self._step_size
 
-  def sample(self):
+  def sample(self, rng=None):
     """Sample an action uniformly randomly."""
-    return [np.random.randint(0, 2), np.random.randint(0, 4)]
+    rng = np.random if rng is None else rng
+    return [rng.choice(2), rng.choice(4)]
 
   def action_spec(self):
     return self._action_spec
@@ -55,7 +55,7 @@ def get_config(mode=None):
       distribs.Continuous('c1', 0.3, 1.),
       distribs.Continuous('c2', 0.9, 1.),
   ])
-  num_sprites = lambda: np.random.randint(1, 7)
+  num_sprites = lambda rng: rng.choice(np.arange(1, 7))
   sprite_gen = sprite_generators.generate_sprites(
       factors, num_sprites=num_sprites)
   task = tasks.NoReward()
@@ -134,7 +134,7 @@ def get_config(mode='train'):
     ])
     sprite_gen_list.append(
         sprite_generators.generate_sprites(
-            factors, num_sprites=lambda: np.random.randint(1, 3)))
+            factors, num_sprites=lambda rng: rng.choice(np.arange(1, 3))))
 
   # Create distractor sprite generator
   distractor_factors = distribs.Product([
@@ -145,8 +145,10 @@ def get_config(mode='train'):
       distribs.Continuous('c2', 64, 256, dtype='uint8'),
       distribs.Continuous('scale', 0.08, 0.12),
   ])
-  sprite_gen_list.append(sprite_generators.generate_sprites(
-      distractor_factors, num_sprites=lambda: np.random.randint(0, 3)))
+  sprite_gen_list.append(
+      sprite_generators.generate_sprites(
+          distractor_factors,
+          num_sprites=lambda rng: rng.choice(np.arange(0, 3))))
 
   # Concat clusters into single scene to generate
   sprite_gen = sprite_generators.chain_generators(*sprite_gen_list)
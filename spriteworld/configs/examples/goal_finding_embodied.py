@@ -34,8 +34,8 @@ from spriteworld import sprite_generators
 from spriteworld import tasks
 
 TERMINATE_DISTANCE = 0.075
-NUM_TARGETS = lambda: np.random.randint(1, 4)
-NUM_DISTRACTORS = lambda: np.random.randint(1, 4)
+NUM_TARGETS = lambda rng: rng.choice(np.arange(1, 4))
+NUM_DISTRACTORS = lambda rng: rng.choice(np.arange(1, 4))
 
 
 def get_config(mode=None):
@@ -0,0 +1,262 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Inverted index from sprite factor values to dataset sample indices.
+
+The index of a dataset generated by datasets.generate() lives in its index/
+subdirectory. Every sprite of every sample is a row, and the index stores:
+  * index.json: number of rows and the factors with bitmaps.
+  * sample_ids.npy, slots.npy: sample index and sprite slot of each row.
+  * values.npy: float32 array of shape [num_rows, num_factors] of factors.
+  * sorted_<factor>.npy, order_<factor>.npy: the sorted values of the factor
+      and the rows in that order.
+  * bitmap_values_<factor>.npy, bitmap_<factor>.npy: for factors with few
+      distinct values, e.g. shape, the distinct values and one packed bitmap of
+      the rows with each value.
+
+Queries are conjunctions of equality, membership and range conditions on the
+factors of a single sprite. The most selective condition is resolved by binary
+search on its sorted column, then the other conditions filter its rows. When no
+condition is selective, bitmaps of the discrete factors are intersected
+instead.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import numpy as np
+import six
+from spriteworld import constants
+from spriteworld import datasets
+
+INDEX_DIR = 'index'
+_INDEX_FILE = 'index.json'
+
+# Factors with at most this many distinct values get bitmaps.
+_MAX_BITMAP_VALUES = 64
+
+# Fraction of rows above which a condition is resolved with bitmaps.
+_SELECTIVITY = 1. / 8
+
+
+def build_index(directory, max_bitmap_values=_MAX_BITMAP_VALUES,
+                chunk_size=10000):
+  """Build the inverted index of a dataset.
+
+  Args:
+    directory: String. Dataset directory, as passed to datasets.generate().
+    max_bitmap_values: Int. Factors with at most this many distinct values get
+      one bitmap per value. Shape always gets bitmaps.
+    chunk_size: Int. Number of samples read at once.
+
+  Returns:
+    Int. Number of indexed sprite rows.
+  """
+  reader = datasets.DatasetReader(directory)
+  factor_names = reader.factor_names
+  values, sample_ids, slots = [], [], []
+  for start in range(0, len(reader), chunk_size):
+    indices = np.arange(start, min(start + chunk_size, len(reader)))
+    batch = reader.gather(indices, fields=('factors', 'num_sprites'))
+    valid = (np.arange(batch['factors'].shape[1]) <
+             batch['num_sprites'][:, None])
+    sample, slot = np.nonzero(valid)
+    values.append(batch['factors'][sample, slot])
+    sample_ids.append(indices[sample])
+    slots.append(slot)
+
+  index_dir = os.path.join(directory, INDEX_DIR)
+  if not os.path.isdir(index_dir):
+    os.makedirs(index_dir)
+  num_factors = len(factor_names)
+  values = np.concatenate(values or [np.zeros((0, num_factors))])
+  values = values.astype(np.float32)
+  np.save(os.path.join(index_dir, 'values.npy'), values)
+  np.save(os.path.join(index_dir, 'sample_ids.npy'),
+          np.concatenate(sample_ids or [[]]).astype(np.int64))
+  np.save(os.path.join(index_dir, 'slots.npy'),
+          np.concatenate(slots or [[]]).astype(np.int32))
+
+  bitmap_factors = []
+  for j, name in enumerate(factor_names):
+    order = np.argsort(values[:, j], kind='stable')
+    np.save(os.path.join(index_dir, 'sorted_{}.npy'.format(name)),
+            values[order, j])
+    np.save(os.path.join(index_dir, 'order_{}.npy'.format(name)), order)
+    distinct = np.unique(values[:, j])
+    if name == 'shape' or len(distinct) <= max_bitmap_values:
+      bitmaps = np.packbits(values[None, :, j] == distinct[:, None], axis=1)
+      np.save(os.path.join(index_dir, 'bitmap_values_{}.npy'.format(name)),
+              distinct)
+      np.save(os.path.join(index_dir, 'bitmap_{}.npy'.format(name)), bitmaps)
+      bitmap_factors.append(name)
+
+  with open(os.path.join(index_dir, _INDEX_FILE), 'w') as f:
+    json.dump({
+        'num_rows': len(values),
+        'factor_names': list(factor_names),
+        'bitmap_factors': bitmap_factors,
+    }, f, indent=2, sort_keys=True)
+  return len(values)
+
+
+def _encode(name, value):
+  """Encode a query value like the factors of sprite.sprites_to_array()."""
+  if name == 'shape' and isinstance(value, six.string_types):
+    return constants.ShapeType[value].value
+  return value
+
+
+class DatasetIndex(object):
+  """Queries over the inverted index of a dataset, see build_index()."""
+
+  def __init__(self, directory, mmap_mode='r'):
+    """Open the index of a dataset.
+
+    Args:
+      directory: String. Dataset directory.
+      mmap_mode: Memory-map mode passed to np.load.
+    """
+    self._dir = os.path.join(directory, INDEX_DIR)
+    with open(os.path.join(self._dir, _INDEX_FILE)) as f:
+      self._info = json.load(f)
+    self._mmap_mode = mmap_mode
+    self._factor_columns = {
+        name: j for j, name in enumerate(self._info['factor_names'])}
+    self._arrays = {}
+
+  def _load(self, name):
+    if name not in self._arrays:
+      self._arrays[name] = np.load(
+          os.path.join(self._dir, name + '.npy'), mmap_mode=self._mmap_mode)
+    return self._arrays[name]
+
+  def __len__(self):
+    return self._info['num_rows']
+
+  @property
+  def factor_names(self):
+    return tuple(self._info['factor_names'])
+
+  def _ranges(self, name, condition):
+    """List of [start, stop) ranges of the sorted column matching condition."""
+    sorted_values = self._load('sorted_' + name)
+    if isinstance(condition, tuple):
+      low, high = (np.float32(_encode(name, v)) for v in condition)
+      return [(np.searchsorted(sorted_values, low, side='left'),
+               np.searchsorted(sorted_values, high, side='right'))]
+    if not isinstance(condition, (list, set, frozenset, np.ndarray)):
+      condition = [condition]
+    ranges = []
+    for value in condition:
+      value = np.float32(_encode(name, value))
+      ranges.append((np.searchsorted(sorted_values, value, side='left'),
+                     np.searchsorted(sorted_values, value, side='right')))
+    return ranges
+
+  def _matches(self, name, condition, values):
+    """Boolean mask of the factor values matching condition."""
+    if isinstance(condition, tuple):
+      low, high = (np.float32(_encode(name, v)) for v in condition)
+      return (values >= low) & (values <= high)
+    if not isinstance(condition, (list, set, frozenset, np.ndarray)):
+      condition = [condition]
+    return np.isin(
+        values, np.array([_encode(name, v) for v in condition], np.float32))
+
+  def _bitmap(self, name, condition):
+    """Packed bitmap of the rows matching condition."""
+    bitmap_values = self._load('bitmap_values_' + name)
+    selected = self._matches(name, condition, bitmap_values)
+    bitmaps = self._load('bitmap_' + name)
+    return np.bitwise_or.reduce(bitmaps[selected], axis=0, initial=0)
+
+  def rows(self, **conditions):
+    """Indices of the sprite rows matching all conditions.
+
+    Args:
+      **conditions: Conditions keyed by factor name. A tuple (low, high) is an
+        inclusive range, a list or set a membership and any other value an
+        equality. Shapes may be given by name.
+
+    Returns:
+      Sorted int array of row indices.
+
+    Raises:
+      KeyError: If a factor is not indexed.
+      ValueError: If a membership condition is empty.
+    """
+    for name, condition in six.iteritems(conditions):
+      if name not in self._factor_columns:
+        raise KeyError('Factor {} is not indexed. Indexed factors are {}.'
+                       .format(name, self.factor_names))
+      if (isinstance(condition, (list, set, frozenset, np.ndarray)) and
+          len(condition) == 0):
+        raise ValueError('Empty membership condition on factor {}, which no '
+                         'row can match.'.format(name))
+    num_rows = len(self)
+    if not conditions:
+      return np.arange(num_rows)
+
+    ranges = {name: self._ranges(name, c)
+              for name, c in six.iteritems(conditions)}
+    counts = {name: sum(stop - start for start, stop in r)
+              for name, r in six.iteritems(ranges)}
+    best = min(counts, key=counts.get)
+    bitmap_factors = [name for name in conditions
+                      if name in self._info['bitmap_factors']]
+
+    if counts[best] > _SELECTIVITY * num_rows and bitmap_factors:
+      bitmap = self._bitmap(bitmap_factors[0], conditions[bitmap_factors[0]])
+      for name in bitmap_factors[1:]:
+        bitmap &= self._bitmap(name, conditions[name])
+      candidates = np.flatnonzero(
+          np.unpackbits(bitmap, count=num_rows).astype(bool))
+      remaining = [n for n in conditions if n not in bitmap_factors]
+    else:
+      order = self._load('order_' + best)
+      candidates = np.sort(np.concatenate(
+          [order[start:stop] for start, stop in ranges[best]]))
+      remaining = [n for n in conditions if n != best]
+
+    if remaining:
+      values = self._load('values')[candidates]
+      mask = np.ones(len(candidates), dtype=bool)
+      for name in remaining:
+        mask &= self._matches(
+            name, conditions[name], values[:, self._factor_columns[name]])
+      candidates = candidates[mask]
+    return candidates
+
+  def query(self, return_slots=False, **conditions):
+    """Indices of the samples with a sprite matching all conditions.
+
+    Args:
+      return_slots: Bool. If True, return one (sample, slot) pair per matching
+        sprite instead of unique sample indices.
+      **conditions: Conditions keyed by factor name, see rows().
+
+    Returns:
+      Sorted int array of sample indices, usable with datasets.DatasetReader,
+        or tuple of sample indices and sprite slots if return_slots.
+    """
+    rows = self.rows(**conditions)
+    samples = self._load('sample_ids')[rows]
+    if return_slots:
+      return samples, self._load('slots')[rows]
+    return np.unique(samples)
@@ -0,0 +1,429 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Offline generation and reading of sharded Spriteworld image datasets.
+
+A dataset is a directory containing a metadata.json file and one directory per
+shard. Each shard directory holds preallocated .npy files:
+  * images.npy: uint8 array of shape [shard_size, height, width, 3].
+  * masks.npy: bool array of shape [shard_size, max_sprites, height, width],
+      one mask per sprite, padded with empty masks.
+  * factors.npy: float32 array of shape [shard_size, max_sprites, num_factors],
+      see sprite.sprites_to_array(), padded with NaN rows.
+  * num_sprites.npy: int32 array of shape [shard_size].
+  * progress.json: number of samples written so far and the state of the shard
+      random number generator, used to resume interrupted shards.
+
+Each shard draws from its own np.random.Generator seeded with (seed,
+shard_index), so the content of a shard does not depend on the number of
+workers, the order in which shards are generated, or on interruptions.
+
+Datasets are read back with DatasetReader, which memory-maps the shard files.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import importlib
+import json
+import multiprocessing
+import os
+import numpy as np
+from spriteworld import sprite as sprite_lib
+from spriteworld import sprite_generators
+
+METADATA_FILE = 'metadata.json'
+PROGRESS_FILE = 'progress.json'
+FIELDS = ('images', 'masks', 'factors', 'num_sprites')
+
+
+def shard_dir(directory, shard_index):
+  return os.path.join(directory, 'shard_{:05d}'.format(shard_index))
+
+
+def last_render(output):
+  """Full image of a renderer output.
+
+  PILRenderer returns per-sprite renders followed by the full image, so its
+  output changes shape with the number of sprites.
+
+  Args:
+    output: Output of renderer.render().
+
+  Returns:
+    The last element of output if it is a list, else output.
+  """
+  if isinstance(output, list):
+    return output[-1]
+  return output
+
+
+def render_scene(renderer, sprites, max_sprites):
+  """Render the image and per-sprite masks of a scene.
+
+  Args:
+    renderer: Renderer producing RGB images with a black background, e.g.
+      renderers.PILRenderer. If it returns a list, the last element is the
+      image and the others are renders of the individual sprites.
+    sprites: List of sprites.
+    max_sprites: Int. Number of masks, padded with empty masks.
+
+  Returns:
+    image: Uint8 array of shape [height, width, 3].
+    masks: Bool array of shape [max_sprites, height, width].
+  """
+  output = renderer.render(sprites=sprites, global_state={})
+  image = np.asarray(last_render(output))
+  if isinstance(output, list) and len(output) == len(sprites) + 1:
+    sprite_renders = output[:-1]
+  else:
+    sprite_renders = [
+        last_render(renderer.render(sprites=[s], global_state={}))
+        for s in sprites
+    ]
+  masks = np.zeros((max_sprites,) + image.shape[:2], dtype=np.bool_)
+  for i, sprite_render in enumerate(sprite_renders):
+    masks[i] = np.any(np.asarray(sprite_render) > 0, axis=-1)
+  return image, masks
+
+
+def _field_specs(image_shape, max_sprites, num_factors):
+  """Dict of field name to (sample shape, dtype)."""
+  return {
+      'images': (tuple(image_shape), np.uint8),
+      'masks': ((max_sprites,) + tuple(image_shape[:2]), np.bool_),
+      'factors': ((max_sprites, num_factors), np.float32),
+      'num_sprites': ((), np.int32),
+  }
+
+
+def load_config(config_name, mode):
+  """Import config module config_name and return its config for mode."""
+  return importlib.import_module(config_name).get_config(mode)
+
+
+def _read_progress(path):
+  if not os.path.exists(path):
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+
+def _write_progress(path, progress):
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(progress, f)
+  os.rename(tmp_path, path)  # Atomic, so progress is never half-written.
+
+
+def generate_shard(directory,
+                   shard_index,
+                   config_name,
+                   mode='train',
+                   shard_size=1000,
+                   seed=0,
+                   max_sprites=8,
+                   renderer_name='image',
+                   checkpoint_every=100):
+  """Generate one shard of a dataset, resuming it if partially complete.
+
+  Args:
+    directory: String. Dataset directory.
+    shard_index: Int. Index of the shard.
+    config_name: String. Module name of the task config providing
+      'init_sprites' and 'renderers'.
+    mode: String. Mode passed to the config get_config().
+    shard_size: Int. Number of samples in the shard.
+    seed: Int. Dataset seed, combined with shard_index to seed the shard.
+    max_sprites: Int. Maximum number of sprites per scene.
+    renderer_name: String. Key of the config renderer producing the images.
+    checkpoint_every: Int. Number of samples between progress checkpoints.
+
+  Returns:
+    Int. Number of samples generated by this call.
+  """
+  path = shard_dir(directory, shard_index)
+  progress_path = os.path.join(path, PROGRESS_FILE)
+  progress = _read_progress(progress_path)
+  if progress is not None and progress['num_done'] == shard_size:
+    return 0
+
+  config = load_config(config_name, mode)
+  init_sprites = sprite_generators.with_rng(config['init_sprites'])
+  renderer = config['renderers'][renderer_name]
+  rng = np.random.default_rng([seed, shard_index])
+
+  arrays = {}
+  if progress is None:
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    num_done = 0
+  else:
+    num_done = progress['num_done']
+    rng.bit_generator.state = progress['rng_state']
+    for name in FIELDS:
+      arrays[name] = np.load(
+          os.path.join(path, name + '.npy'), mmap_mode='r+')
+
+  def _checkpoint():
+    for array in arrays.values():
+      array.flush()
+    _write_progress(progress_path, {
+        'num_done': num_done,
+        'shard_size': shard_size,
+        'rng_state': rng.bit_generator.state,
+    })
+
+  start = num_done
+  while num_done < shard_size:
+    sprites = init_sprites(rng)
+    image, masks = render_scene(renderer, sprites, max_sprites)
+    factors = sprite_lib.sprites_to_array(sprites, num_rows=max_sprites)
+    if not arrays:
+      specs = _field_specs(image.shape, max_sprites, factors.shape[1])
+      for name, (shape, dtype) in specs.items():
+        arrays[name] = np.lib.format.open_memmap(
+            os.path.join(path, name + '.npy'),
+            mode='w+',
+            dtype=dtype,
+            shape=(shard_size,) + shape)
+    arrays['images'][num_done] = image
+    arrays['masks'][num_done] = masks
+    arrays['factors'][num_done] = factors
+    arrays['num_sprites'][num_done] = len(sprites)
+    num_done += 1
+    if num_done % checkpoint_every == 0 or num_done == shard_size:
+      _checkpoint()
+  return num_done - start
+
+
+def _generate_shard_kwargs(kwargs):
+  return generate_shard(**kwargs)
+
+
+def generate(directory,
+             config_name,
+             num_shards,
+             mode='train',
+             shard_size=1000,
+             seed=0,
+             max_sprites=8,
+             renderer_name='image',
+             num_workers=1,
+             checkpoint_every=100):
+  """Generate a sharded dataset, resuming any incomplete shards.
+
+  Args:
+    directory: String. Dataset directory, created if it does not exist.
+    config_name: String. Module name of the task config providing
+      'init_sprites' and 'renderers'.
+    num_shards: Int. Number of shards.
+    mode: String. Mode passed to the config get_config().
+    shard_size: Int. Number of samples per shard.
+    seed: Int. Dataset seed.
+    max_sprites: Int. Maximum number of sprites per scene.
+    renderer_name: String. Key of the config renderer producing the images.
+    num_workers: Int. Number of worker processes. If 1, shards are generated in
+      the calling process.
+    checkpoint_every: Int. Number of samples between progress checkpoints.
+
+  Returns:
+    Int. Number of samples generated by this call.
+  """
+  metadata = {
+      'config': config_name,
+      'mode': mode,
+      'num_shards': num_shards,
+      'shard_size': shard_size,
+      'seed': seed,
+      'max_sprites': max_sprites,
+      'renderer': renderer_name,
+      'factor_names': list(sprite_lib.FACTOR_NAMES),
+  }
+  metadata_path = os.path.join(directory, METADATA_FILE)
+  if os.path.exists(metadata_path):
+    with open(metadata_path) as f:
+      existing = json.load(f)
+    if existing != metadata:
+      raise ValueError(
+          'Directory {} contains a dataset generated with different '
+          'parameters: {}.'.format(directory, existing))
+  else:
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    with open(metadata_path, 'w') as f:
+      json.dump(metadata, f, indent=2, sort_keys=True)
+
+  shard_kwargs = [
+      dict(directory=directory,
+           shard_index=i,
+           config_name=config_name,
+           mode=mode,
+           shard_size=shard_size,
+           seed=seed,
+           max_sprites=max_sprites,
+           renderer_name=renderer_name,
+           checkpoint_every=checkpoint_every) for i in range(num_shards)
+  ]
+  if num_workers == 1:
+    return sum(_generate_shard_kwargs(kwargs) for kwargs in shard_kwargs)
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    return sum(pool.imap_unordered(_generate_shard_kwargs, shard_kwargs))
+  finally:
+    pool.close()
+    pool.join()
+
+
+class DatasetReader(object):
+  """Random access to a dataset generated by generate().
+
+  Shard files are memory-mapped read-only, so samples are read straight from
+  the page cache without decoding any Python objects, and any number of reader
+  processes can share a dataset. Memory maps are opened lazily in each process,
+  so a reader can be created before forking DataLoader or multiprocessing
+  workers.
+
+  Incomplete shards contribute the samples written so far.
+  """
+
+  def __init__(self, directory):
+    """Open dataset.
+
+    Args:
+      directory: String. Dataset directory.
+    """
+    self._directory = directory
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+      self._metadata = json.load(f)
+    self._shard_size = self._metadata['shard_size']
+
+    sizes = []
+    for shard_index in range(self._metadata['num_shards']):
+      progress = _read_progress(
+          os.path.join(shard_dir(directory, shard_index), PROGRESS_FILE))
+      sizes.append(0 if progress is None else progress['num_done'])
+    self._shard_indices = np.array(
+        [i for i, size in enumerate(sizes) if size], dtype=np.int64)
+    sizes = np.array([s for s in sizes if s], dtype=np.int64)
+    self._offsets = np.concatenate([[0], np.cumsum(sizes)])
+    self._uniform = bool(np.all(sizes == self._shard_size))
+    self._arrays = None
+    self._pid = None
+    self._specs = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    # Memory maps are not pickled into e.g. DataLoader workers, but reopened
+    # lazily by each copy.
+    state['_arrays'] = None
+    state['_pid'] = None
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+
+  def _shard_arrays(self):
+    """Per-shard dict of memory-mapped arrays, opened once per process."""
+    if self._arrays is None or self._pid != os.getpid():
+      self._arrays = [{
+          name: np.load(
+              os.path.join(shard_dir(self._directory, i), name + '.npy'),
+              mmap_mode='r') for name in FIELDS
+      } for i in self._shard_indices]
+      self._pid = os.getpid()
+    return self._arrays
+
+  def __len__(self):
+    return int(self._offsets[-1])
+
+  @property
+  def metadata(self):
+    return self._metadata
+
+  @property
+  def factor_names(self):
+    return tuple(self._metadata['factor_names'])
+
+  def _field_specs(self):
+    """Dict of field name to (sample shape, dtype)."""
+    if self._specs is None:
+      arrays = self._shard_arrays()
+      if arrays:
+        image_shape = arrays[0]['images'].shape[1:]
+      else:
+        # No sample was written, so render an empty scene to get the shapes.
+        renderer = load_config(
+            self._metadata['config'],
+            self._metadata['mode'])['renderers'][self._metadata['renderer']]
+        image, _ = render_scene(renderer, [], self._metadata['max_sprites'])
+        image_shape = image.shape
+      self._specs = _field_specs(image_shape, self._metadata['max_sprites'],
+                                 len(self._metadata['factor_names']))
+    return self._specs
+
+  def _locate(self, indices):
+    """Map global indices to (shard position, row) arrays."""
+    indices = np.asarray(indices, dtype=np.int64)
+    if np.any(indices < 0) or np.any(indices >= len(self)):
+      raise IndexError('Indices must be in [0, {}).'.format(len(self)))
+    if self._uniform:
+      return np.divmod(indices, self._shard_size)
+    shards = np.searchsorted(self._offsets, indices, side='right') - 1
+    return shards, indices - self._offsets[shards]
+
+  def __getitem__(self, index):
+    """Return dict of field name to memory-mapped sample, without copying."""
+    shard, row = self._locate(index)
+    arrays = self._shard_arrays()[int(shard)]
+    return {name: arrays[name][int(row)] for name in FIELDS}
+
+  def gather(self, indices, fields=FIELDS, out=None):
+    """Gather a batch of samples by fancy indexing the memory maps.
+
+    Args:
+      indices: Int array of global sample indices.
+      fields: Iterable of field names to gather.
+      out: None or dict of field name to preallocated output array with
+        len(indices) rows. Reusing output buffers avoids any allocation.
+
+    Returns:
+      Dict of field name to batch array. Arrays have no rows if indices is
+        empty.
+    """
+    indices = np.asarray(indices, dtype=np.int64).reshape((-1,))
+    shards, rows = self._locate(indices)
+    arrays = self._shard_arrays()
+    if out is None:
+      out = {}
+    for name in fields:
+      if name not in out:
+        shape, dtype = self._field_specs()[name]
+        out[name] = np.empty((len(indices),) + shape, dtype=dtype)
+    for shard in np.unique(shards):
+      in_shard = np.nonzero(shards == shard)[0]
+      for name in fields:
+        out[name][in_shard] = arrays[shard][name][rows[in_shard]]
+    return out
+
+  def contiguous(self, start, stop):
+    """Return zero-copy views of samples [start, stop) within one shard."""
+    shard, row = self._locate(start)
+    if stop - start > self._offsets[shard + 1] - self._offsets[shard] - row:
+      raise ValueError('Slice [{}, {}) spans more than one shard.'.format(
+          start, stop))
+    arrays = self._shard_arrays()[int(shard)]
+    return {name: arrays[name][row:row + stop - start] for name in FIELDS}
@@ -19,9 +19,112 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import dm_env
 import numpy as np
 import six
+from six.moves import collections_abc
+from spriteworld import scene_pool
+from spriteworld import sprite as sprite_lib
+from spriteworld import sprite_generators
+
+# Placeholder for observation entries that have not been rendered yet.
+_PENDING = object()
+
+
+class LazyObservation(collections_abc.MutableMapping):
+  """Observation dict that renders each entry on first access.
+
+  Keys are the names of the environment renderers. A renderer is only invoked
+  the first time its key is read, after which the result is cached. Entries can
+  be overwritten or deleted like in a regular dict (e.g. by
+  GymWrapper._process_obs).
+
+  The environment calls detach() before it mutates the sprites, so entries
+  first accessed after the environment has stepped are still rendered from the
+  state of the step that produced this observation. detach() only keeps the
+  sprite factors, and sprites are rebuilt from them if a pending entry is read.
+  """
+
+  def __init__(self, renderers, state_fn):
+    """Construct lazy observation.
+
+    Args:
+      renderers: Dict where values are renderers and keys are names.
+      state_fn: Callable returning the kwargs for renderer.render(), i.e. a
+        dict with keys 'sprites' and 'global_state'. Called at most once.
+    """
+    self._renderers = renderers
+    self._state_fn = state_fn
+    self._state = None
+    self._values = collections.OrderedDict(
+        (name, _PENDING) for name in renderers)
+
+  def _get_state(self):
+    if self._state is None:
+      self._state = self._state_fn()
+    return self._state
+
+  def __getitem__(self, name):
+    value = self._values[name]
+    if value is _PENDING:
+      value = self._renderers[name].render(**self._get_state())
+      self._values[name] = value
+    return value
+
+  def __setitem__(self, name, value):
+    self._values[name] = value
+
+  def __delitem__(self, name):
+    del self._values[name]
+
+  def __iter__(self):
+    return iter(self._values)
+
+  def __len__(self):
+    return len(self._values)
+
+  def __repr__(self):
+    return 'LazyObservation({})'.format(
+        {k: ('<pending>' if v is _PENDING else v)
+         for k, v in six.iteritems(self._values)})
+
+  @property
+  def pending(self):
+    """Names of the entries that have not been rendered yet."""
+    return [k for k, v in six.iteritems(self._values) if v is _PENDING]
+
+  @property
+  def global_state(self):
+    """Global state of the step that produced this observation.
+
+    Raises:
+      ValueError: If the state was first requested after the environment
+        stepped with no entry left pending, so that it was not kept.
+    """
+    if self._state is None and self._state_fn is None:
+      raise ValueError('The global state of this observation was not kept.')
+    return self._get_state()['global_state']
+
+  def detach(self):
+    """Snapshot the state needed by pending entries.
+
+    After this call the observation no longer depends on the live sprites, so
+    the environment is free to mutate them. This is a no-op if every entry has
+    already been rendered, and global_state is then only available if it was
+    read before.
+    """
+    if not self.pending:
+      self._state_fn = None
+      return
+    state = self._get_state()
+    factors = [s.factors for s in state['sprites']]
+    global_state = dict(state['global_state'])
+    self._state = None
+    self._state_fn = lambda: {
+        'sprites': [sprite_lib.Sprite(**f) for f in factors],
+        'global_state': global_state,
+    }
 
 
 class Environment(dm_env.Environment):
@@ -38,74 +141,194 @@ class Environment(dm_env.Environment):
                init_sprites,
                keep_in_frame=True,
                max_episode_length=1000,
-               metadata=None):
+               metadata=None,
+               action_repeat=1,
+               seed=None,
+               recorder=None,
+               prefetch_scenes=0,
+               prerender=()):
     """Construct Spriteworld environment.
 
     Args:
       task: Object with methods:
           - reward: sprites -> float.
           - success: sprites -> bool.
+          - (optional) evaluate: sprites -> (reward, success).
       action_space: Action space with methods:
-          - step: action, sprites, keep_in_frame -> reward.
+          - step: action, sprites, keep_in_frame, (optional) rng -> reward.
           - action_spec: Callable returning ArraySpec or list/dict of such.
       renderers: Dict where values are renderers and keys are names, reflected
         in the keys of the observation.
       init_sprites: Callable returning iterable of sprites, called upon
-        environment reset.
+        environment reset. If it accepts an `rng` argument, the random number
+        generator of the environment is passed to it.
       keep_in_frame: Bool. Whether to keep sprites in frame when they move. This
         prevents episodes from terminating frequently when an agent moves a
         sprite out of frame.
       max_episode_length: Maximum number of steps beyond which episode will be
         terminated.
       metadata: Optional object to be added to the global_state.
+      action_repeat: Int. Number of times each action is applied per call to
+        step(), like frame-skip in Atari. Sprite positions, rewards and
+        termination are updated after every repeat, but the observation is
+        only rendered once at the end. The repeat stops early if the episode
+        terminates. max_episode_length counts calls to step(), not repeats.
+      seed: None or int. Seed of the np.random.Generator owned by this
+        environment, from which all sprite sampling and action noise is drawn.
+      recorder: None or object with method record: timestep, action, sprites,
+        e.g. a recorder.TrajectoryRecorder. Called with every timestep returned
+        by reset() and step().
+      prefetch_scenes: Int. If positive, initial sprites are sampled ahead of
+        time by a scene_pool.ScenePool holding up to this many scenes, so that
+        reset() only pops the next scene. Scenes are then drawn from their own
+        sequence, seeded with `seed`, instead of from the environment's random
+        number generator.
+      prerender: Iterable of renderer names. With prefetch_scenes, the initial
+        observations of these renderers are also rendered ahead of time. Their
+        renderers must not depend on the global state.
     """
+    if action_repeat < 1:
+      raise ValueError(
+          'action_repeat must be at least 1, but is {}.'.format(action_repeat))
     self._task = task
     self._action_space = action_space
+    # Whether these accept an rng is decided once, not on every call.
+    self._action_space_step = sprite_generators.with_rng(action_space.step)
     self._renderers = renderers
-    self._init_sprites = init_sprites
+    self._init_sprites = sprite_generators.with_rng(init_sprites)
     self._keep_in_frame = keep_in_frame
     self._max_episode_length = max_episode_length
-    self._sprites = self._init_sprites()
+    self._rng = np.random.default_rng(seed)
+    self._scene_pool = None
+    if prefetch_scenes > 0:
+      self._scene_pool = scene_pool.ScenePool(
+          init_sprites,
+          capacity=prefetch_scenes,
+          seed=seed,
+          renderers={name: renderers[name] for name in prerender})
+    self._prerendered = {}
+    self._sprites = self._sample_sprites()
     self._step_count = 0
     self._reset_next_step = True
     self._renderers_initialized = False
     self._metadata = metadata
+    self._action_repeat = action_repeat
+    self._recorder = recorder
+    self._last_observation = None
+    self._state_version = 0
+    self._task_evaluation = {}
+
+  def _detach_observation(self):
+    """Make the last observation independent of the sprites about to change."""
+    if self._last_observation is not None:
+      self._last_observation.detach()
+      self._last_observation = None
+
+  def _sprites_changed(self):
+    """Invalidate everything cached for the previous sprite state."""
+    self._state_version += 1
+    self._task_evaluation = {}
+
+  def _evaluate_task(self):
+    """Return (reward, success) of the task, evaluated once per state."""
+    if 'reward' not in self._task_evaluation:
+      if hasattr(self._task, 'evaluate'):
+        reward, success = self._task.evaluate(self._sprites)
+      else:
+        reward = self._task.reward(self._sprites)
+        success = self._task_evaluation.get('success')
+        if success is None:
+          success = self._task.success(self._sprites)
+      self._task_evaluation['reward'] = reward
+      self._task_evaluation['success'] = success
+    return self._task_evaluation['reward'], self._task_evaluation['success']
+
+  def _sample_sprites(self):
+    if self._scene_pool is None:
+      return self._init_sprites(self._rng)
+    scene = self._scene_pool.get()
+    self._prerendered = scene.observations
+    return scene.sprites
 
-  def reset(self):
-    self._sprites = self._init_sprites()
+  def reset(self, seed=None):
+    """Start a new episode.
+
+    Args:
+      seed: None or int. If not None, re-seed the random number generator of
+        the environment before sampling the initial sprites. With
+        prefetch_scenes, the scene pool is restarted from this seed.
+
+    Returns:
+      dm_env.TimeStep of the first step of the episode.
+    """
+    if seed is not None:
+      self._rng = np.random.default_rng(seed)
+      if self._scene_pool is not None:
+        self._scene_pool.restart(seed)
+    self._detach_observation()
+    self._sprites = self._sample_sprites()
+    self._sprites_changed()
     self._step_count = 0
     self._reset_next_step = False
-    return dm_env.restart(self.observation())
+    observation = self.observation()
+    observation.update(self._prerendered)
+    return self._record(dm_env.restart(observation), None)
 
   def success(self):
-    return self._task.success(self._sprites)
+    """Return task success, evaluated at most once per sprite state."""
+    if 'success' not in self._task_evaluation:
+      self._task_evaluation['success'] = self._task.success(self._sprites)
+    return self._task_evaluation['success']
+
+  @property
+  def state_version(self):
+    """Int incremented every time the sprites may have changed."""
+    return self._state_version
+
+  def _task_terminated(self):
+    out_of_frame = any([sprite.out_of_frame for sprite in self._sprites])
+    return self.success() or out_of_frame
 
   def should_terminate(self):
     timeout = self._step_count >= self._max_episode_length
-    out_of_frame = any([sprite.out_of_frame for sprite in self._sprites])
-    return self.success() or out_of_frame or timeout
+    return self._task_terminated() or timeout
 
   def step(self, action):
     """Step the environment with an action."""
     if self._reset_next_step:
       return self.reset()
 
+    self._detach_observation()
     self._step_count += 1
-    reward = self._action_space.step(
-        action, self._sprites, keep_in_frame=self._keep_in_frame)
+    reward = 0.
+    for _ in range(self._action_repeat):
+      reward += self._action_space_step(
+          self._rng, action, self._sprites, keep_in_frame=self._keep_in_frame)
+
+      # Update sprite positions from their velocities
+      for sprite in self._sprites:
+        sprite.update_position(keep_in_frame=self._keep_in_frame)
+      self._sprites_changed()
 
-    # Update sprite positions from their velocities
-    for sprite in self._sprites:
-      sprite.update_position(keep_in_frame=self._keep_in_frame)
+      reward += self._evaluate_task()[0]
+      terminated = self._task_terminated()
+      if terminated:
+        break
 
-    reward += self._task.reward(self._sprites)
     observation = self.observation()
 
-    if self.should_terminate():
+    # Same as should_terminate(), without scanning the sprites again.
+    if terminated or self._step_count >= self._max_episode_length:
       self._reset_next_step = True
-      return dm_env.termination(reward=reward, observation=observation)
+      timestep = dm_env.termination(reward=reward, observation=observation)
     else:
-      return dm_env.transition(reward=reward, observation=observation)
+      timestep = dm_env.transition(reward=reward, observation=observation)
+    return self._record(timestep, action)
+
+  def _record(self, timestep, action):
+    if self._recorder is not None:
+      self._recorder.record(timestep, action, self._sprites)
+    return timestep
 
   def sample_contained_position(self):
     """Sample a random position contained in a sprite.
@@ -122,8 +345,8 @@ class Environment(dm_env.Environment):
       Float numpy array of shape (2,) in [0, 1]. Position contained in one of
           the sprites.
     """
-    sprite = self._sprites[np.random.randint(len(self._sprites))]
-    return sprite.sample_contained_position()
+    sprite = self._sprites[self._rng.choice(len(self._sprites))]
+    return sprite.sample_contained_position(rng=self._rng)
 
   def state(self):
     global_state = {
@@ -134,17 +357,15 @@ class Environment(dm_env.Environment):
     return {'sprites': self._sprites, 'global_state': global_state}
 
   def observation(self):
-    state = self.state()
-    observation = {
-        name: renderer.render(**state)
-        for name, renderer in six.iteritems(self._renderers)
-    }
+    """Return a LazyObservation rendering the current state on access."""
+    observation = LazyObservation(self._renderers, self.state)
+    self._last_observation = observation
     return observation
 
   def observation_spec(self):
     if not self._renderers_initialized:
       # Force a rendering so that the sizes of observeration_specs are correct.
-      self.observation()
+      dict(self.observation())
       self._renderers_initialized = True
 
     renderer_spec = {
@@ -156,6 +377,16 @@ class Environment(dm_env.Environment):
   def action_spec(self):
     return self._action_space.action_spec()
 
+  def close(self):
+    """Stop the scene pool, if any."""
+    if self._scene_pool is not None:
+      self._scene_pool.close()
+
   @property
   def action_space(self):
     return self._action_space
+
+  @property
+  def rng(self):
+    """The np.random.Generator owned by this environment."""
+    return self._rng
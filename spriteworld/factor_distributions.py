@@ -25,7 +25,12 @@ names used by Spriteworld sprites.
 All distributions inherit from AbstractDistribution. They have a "sample()"
 method, which returns a spec. The keys of this spec can be accessed by the
 "keys" property. Distributions also have a "contains(spec)" method, which checks
-if the argument "spec" is in the support of the distribution.
+if the argument "spec" is in the support of the distribution. Many specs can be
+sampled at once with "sample_batch(n)", which returns a dictionary of length-n
+column arrays instead of n dictionaries, and checked at once with
+"contains_batch(columns)", which returns a boolean mask. Distribution trees can
+be simplified into faster equivalent trees with compile_distribution(), and
+sampled at evenly spread quasi-random points with sample_quasi_random().
 """
 
 from __future__ import absolute_import
@@ -34,33 +39,207 @@ from __future__ import print_function
 
 import abc
 import functools
+import warnings
 import numpy as np
-import torch
-from torch.distributions.beta import Beta as beta_dist
 import six
-from scipy.stats import beta
 
 # Maximum number of tries used for rejection sampling from Intersection and
 # SetMinus distributions
 _MAX_TRIES = int(1e5)
 
+# Maximum number of candidates proposed at once by rejection sampling.
+_MAX_BLOCK_SIZE = 2**16
+
+# Factor by which rejection sampling oversamples the expected number of
+# candidates needed, so that most blocks fill all pending rows at once.
+_OVERSAMPLING = 1.2
+
+# Affine maps applied to Beta samples in [0, 1], as (scale, offset) per key.
+_BETA_AFFINE = {
+    'x': (0.55, .2),
+    'y': (0.55, .2),
+    'scale': (0.09, .11),
+    'angle': (360., 0.),
+}
+
+# Column of the copula uniforms used by non-identifiable Beta distributions.
+_COPULA_COLUMNS = {'x': 0, 'y': 1, 'scale': 2, 'c0': 3, 'angle': 4}
+
+# Cache of inverse-CDF tables of Beta distributions, see _beta_ppf_table().
+_PPF_TABLES = {}
+
+# Maximum number of nodes of an inverse-CDF table.
+_MAX_PPF_NODES = 2**20
+
+
+def _take(columns, indices):
+  """Select rows of a dictionary of column arrays."""
+  return {k: v[indices] for k, v in six.iteritems(columns)}
+
+
+def _take_uniform(uniform, indices):
+  return None if uniform is None else uniform[indices]
+
+
+def _scatter(batches, positions, n, keys):
+  """Merge column batches whose rows belong at the given output positions.
+
+  Args:
+    batches: List of dictionaries of column arrays.
+    positions: List of int arrays, the output rows of each batch.
+    n: Int. Number of output rows.
+    keys: Iterable of column names.
+
+  Returns:
+    Dictionary of column arrays of length n.
+  """
+  positions = np.concatenate(positions)
+  columns = {}
+  for k in keys:
+    values = np.concatenate([b[k] for b in batches])
+    columns[k] = np.empty((n,) + values.shape[1:], dtype=values.dtype)
+    columns[k][positions] = values
+  return columns
+
+
+def _beta_ppf_table(alpha, b, tolerance):
+  """Piecewise linear inverse-CDF table of a Beta distribution.
+
+  The table is refined by bisecting every interval whose midpoint is off by
+  more than tolerance / 2 from the exact inverse CDF, which keeps the error of
+  linear interpolation below tolerance in practice. Tables are cached.
+
+  Args:
+    alpha: Positive scalar. First concentration parameter.
+    b: Positive scalar. Second concentration parameter.
+    tolerance: Positive scalar. Maximum absolute interpolation error.
+
+  Returns:
+    Tuple (u, x) of increasing arrays, x = ppf(u), with u[0] = 0 and u[-1] = 1.
+  """
+  cache_key = (alpha, b, tolerance)
+  if cache_key not in _PPF_TABLES:
+    # scipy is slow to import, so it is only imported when needed.
+    from scipy.stats import beta  # pylint: disable=g-import-not-at-top
+    # Start from nodes evenly spaced in both probability and value.
+    grid = np.linspace(0., 1., 129)
+    u = np.unique(np.concatenate([grid, beta.cdf(grid, alpha, b)]))
+    x = beta.ppf(u, alpha, b)
+    while u.size < _MAX_PPF_NODES:
+      u_mid = (u[:-1] + u[1:]) / 2
+      x_mid = beta.ppf(u_mid, alpha, b)
+      # Intervals at the resolution of floats cannot be split further.
+      refine = ((np.abs(x_mid - (x[:-1] + x[1:]) / 2) > tolerance / 2) &
+                (u_mid > u[:-1]) & (u_mid < u[1:]))
+      if not np.any(refine):
+        break
+      u = np.concatenate([u, u_mid[refine]])
+      x = np.concatenate([x, x_mid[refine]])
+      order = np.argsort(u)
+      u, x = u[order], x[order]
+    _PPF_TABLES[cache_key] = (u, np.maximum.accumulate(x))
+  return _PPF_TABLES[cache_key]
+
+
+def _inverse_cdf_indices(u, probs, num_candidates):
+  """Map values in [0, 1) to candidate indices with the given probabilities."""
+  if probs is None:
+    indices = np.floor(u * num_candidates).astype(int)
+  else:
+    indices = np.searchsorted(np.cumsum(probs), u, side='right')
+  return np.minimum(indices, num_candidates - 1)
+
+
+def _num_rows(columns):
+  return len(next(iter(six.itervalues(columns))))
+
+
+def _column(columns, key):
+  """Get column key as an array, raising KeyError if it is missing."""
+  if key not in columns:
+    raise KeyError('key {} is not in columns {}, but must be to evaluate '
+                   'containment.'.format(key, list(columns)))
+  return np.asarray(columns[key])
+
+
+def _cast_in_range(values, minval, maxval, dtype):
+  """Cast values in [minval, maxval) to dtype, keeping them in that range.
+
+  Rounding to a float dtype narrower than the samples, e.g. float32, can map
+  values just below maxval to maxval itself, which contains() then rejects.
+  """
+  values = np.asarray(values).astype(dtype)
+  if np.dtype(dtype).kind != 'f':
+    return values
+  low = np.asarray(minval, dtype=dtype)
+  if low < minval:
+    low = np.nextafter(low, np.asarray(np.inf, dtype=dtype))
+  high = np.nextafter(
+      np.asarray(maxval, dtype=dtype), np.asarray(-np.inf, dtype=dtype))
+  return np.asarray(np.clip(values, low, high))
+
 
 @six.add_metaclass(abc.ABCMeta)
 class AbstractDistribution(object):
   """Abstract class from which all distributions should inherit."""
 
   @abc.abstractmethod
-  def sample(self,n,rng=None):
+  def sample(self, uniform=None, n=None, rng=None):
     """Sample a spec from this distribution. Returns a dictionary.
     Args:
-      rng: Random number generator. Fed into self._get_rng(), if None defaults
-        to np.random.
+      uniform: None or array of shape [1, num_factors] of copula uniforms. Only
+        used by non-identifiable Beta distributions.
+      n: None or int. Index of the sprite being sampled within its scene.
+      rng: Random number generator, either np.random or an instance of
+        np.random.Generator/np.random.RandomState. Fed into self._get_rng(), if
+        None defaults to np.random.
+    """
+
+  @abc.abstractmethod
+  def sample_batch(self, n, rng=None, uniform=None):
+    """Sample n specs from this distribution at once.
+    Args:
+      n: Int. Number of specs to sample.
+      rng: Random number generator, as in self.sample().
+      uniform: None or array of shape [n, num_factors] of copula uniforms, one
+        row per spec. Only used by non-identifiable Beta distributions.
+    Returns:
+      Dictionary from keys to arrays of length n, one row per spec.
+    """
+
+  @abc.abstractproperty
+  def num_dimensions(self):
+    """Number of unit-cube dimensions consumed by self.transform_batch()."""
+
+  @abc.abstractmethod
+  def transform_batch(self, points, rng=None, uniform=None):
+    """Map points of the unit cube to specs, through inverse CDFs.
+    Evenly spread points, e.g. from a low-discrepancy sequence, are mapped to
+    evenly spread specs, see sample_quasi_random().
+    Args:
+      points: Array of shape [n, self.num_dimensions] with values in [0, 1).
+      rng: Random number generator. Only used to replace candidates rejected
+        by Intersection, SetMinus and Selection distributions, which have no
+        inverse CDF.
+      uniform: None or array of shape [n, num_factors] of copula uniforms.
+    Returns:
+      Dictionary from keys to arrays of length n, one row per point.
     """
 
   @abc.abstractmethod
   def contains(self, spec):
     """Return whether distribution contains spec dictionary."""
 
+  @abc.abstractmethod
+  def contains_batch(self, columns):
+    """Vectorized contains() over many specs.
+    Args:
+      columns: Dictionary from keys to arrays of the same length, one row per
+        spec, e.g. as returned by self.sample_batch().
+    Returns:
+      Boolean array, whether each spec is contained in the distribution.
+    """
+
   @abc.abstractmethod
   def to_str(self, indent):
     """Recursive string description of this distribution."""
@@ -93,13 +272,30 @@ class Continuous(AbstractDistribution):
     self.maxval = maxval
     self.dtype = dtype
 
-  def sample(self,uniform, n=None, rng=None):
+  def sample(self, uniform=None, n=None, rng=None):
     """Sample value in [self.minval, self.maxval) and return dict."""
     rng = self._get_rng(rng)
     out = rng.uniform(low=self.minval, high=self.maxval)
-    out = np.cast[self.dtype](out)
+    out = _cast_in_range(out, self.minval, self.maxval, self.dtype)
     return {self.key: out}
 
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    out = rng.uniform(low=self.minval, high=self.maxval, size=n)
+    return {
+        self.key: _cast_in_range(out, self.minval, self.maxval, self.dtype)
+    }
+
+  @property
+  def num_dimensions(self):
+    return 1
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    out = self.minval + points[:, 0] * (self.maxval - self.minval)
+    return {
+        self.key: _cast_in_range(out, self.minval, self.maxval, self.dtype)
+    }
+
   def contains(self, spec):
     """Check if spec[self.key] is in [self.minval, self.maxval)."""
     if self.key not in spec:
@@ -108,6 +304,10 @@ class Continuous(AbstractDistribution):
     else:
       return spec[self.key] >= self.minval and spec[self.key] < self.maxval
 
+  def contains_batch(self, columns):
+    values = _column(columns, self.key)
+    return (values >= self.minval) & (values < self.maxval)
+
   def to_str(self, indent):
     s = '<Continuous: key={}, mival={}, maxval={}, dtype={}>'.format(
         self.key, self.minval, self.maxval, self.dtype)
@@ -119,70 +319,76 @@ class Continuous(AbstractDistribution):
 
 
 class Beta(AbstractDistribution):
-  """Continuous 1-dimensional uniform distribution."""
+  """Beta distribution, affinely mapped to the range of its factor.
 
-  def __init__(self, key, alpha, beta, non_ident=False, dtype='float32'):
-    """Construct continuous 1-dimensional uniform distribution.
+  Samples of keys 'x' and 'y' are mapped to [0.2, 0.75], of 'scale' to
+  [0.11, 0.2] and of 'angle' to [0, 360]. Other keys are left in [0, 1].
+  """
+
+  def __init__(self, key, alpha, beta, non_ident=False, dtype='float32',
+               ppf_tolerance=1e-5):
+    """Construct Beta distribution.
     Args:
       key: String factor name. self.sample() returns {key: _}.
-      minval: Scalar minimum value.
-      maxval: Scalar maximum value.
+      alpha: Positive scalar. First concentration parameter.
+      beta: Positive scalar. Second concentration parameter.
+      non_ident: Bool. If True, samples are not drawn independently but
+        computed from the copula uniforms passed to self.sample(), which makes
+        the factors of a sprite correlated.
       dtype: String numpy dtype.
+      ppf_tolerance: None or positive scalar. If non_ident, the inverse CDF of
+        the Beta distribution is interpolated from a cached table with this
+        maximum absolute error, before the affine map. If None, the exact
+        inverse CDF is computed for every sample, which is much slower.
     """
     self.key = key
     self.alpha = alpha
     self.beta = beta
     self.non_ident = non_ident
     self.dtype = dtype
+    self.ppf_tolerance = ppf_tolerance
 
-  def sample(self,uniform,n=None,rng=None):
-    """Sample value in [self.minval, self.maxval) and return dict."""
+  def sample(self, uniform=None, n=None, rng=None):
+    return _take(self.sample_batch(1, rng=rng, uniform=uniform), 0)
 
-    if self.non_ident == False:
-      '''
-      if self.key == 'x' and n == 0:
-        self.alpha = 2.
-        self.beta = 18.
-      elif self.key == 'x' and n == 1:
-        self.alpha = 18.
-        self.beta = 18.
-      elif self.key == 'x' and n == 2:
-        self.alpha = 18.
-        self.beta = 2.
-      '''
-      out = beta_dist(torch.tensor([self.alpha]), torch.tensor([self.beta])).sample()
-      if self.key == 'x':
-        out = out*0.55 + .2
-      elif self.key == 'y':
-        out = out*0.55 + .2
-      elif self.key == 'scale':
-        out = out*0.09 + .11
-      elif self.key == 'angle':
-        out *= 360
+  def sample_batch(self, n, rng=None, uniform=None):
+    if self.non_ident:
+      out = self._ppf(uniform[:, _COPULA_COLUMNS[self.key]])
     else:
-      if self.key == 'x':
-        out = beta.ppf(uniform[:,0], self.alpha, self.beta)
-        out = out*0.55 + .2
-      elif self.key == 'y':
-        out = beta.ppf(uniform[:,1], self.alpha, self.beta)
-        out = out*0.55 + .2
-      elif self.key == 'scale':
-        out = beta.ppf(uniform[:,2], self.alpha, self.beta)
-        out = out*0.09 + .11
-      elif self.key == 'c0':
-        out = beta.ppf(uniform[:,3], self.alpha, self.beta)
-      elif self.key == 'angle':
-        out = beta.ppf(uniform[:,4], self.alpha, self.beta)
-        out *= 360
-
-    out = np.cast[self.dtype](out)
-    return {self.key: out}
+      rng = self._get_rng(rng)
+      out = rng.beta(self.alpha, self.beta, size=n)
+    return self._affine(out)
+
+  @property
+  def num_dimensions(self):
+    # Non-identifiable samples are fully determined by the copula uniforms.
+    return 0 if self.non_ident else 1
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    if self.non_ident:
+      return self.sample_batch(len(points), uniform=uniform)
+    return self._affine(self._ppf(points[:, 0]))
+
+  def _ppf(self, u):
+    """Inverse CDF of the Beta distribution, before the affine map."""
+    if self.ppf_tolerance is None:
+      from scipy.stats import beta  # pylint: disable=g-import-not-at-top
+      return beta.ppf(u, self.alpha, self.beta)
+    return np.interp(
+        u, *_beta_ppf_table(self.alpha, self.beta, self.ppf_tolerance))
+
+  def _affine(self, out):
+    scale, offset = _BETA_AFFINE.get(self.key, (1., 0.))
+    return {self.key: (out * scale + offset).astype(self.dtype)}
 
   def contains(self, spec):
     return True
 
+  def contains_batch(self, columns):
+    return np.ones(_num_rows(columns), dtype=bool)
+
   def to_str(self, indent):
-    s = '<Continuous: key={}, alpha={}, beta={}, dtype={}>'.format(
+    s = '<Beta: key={}, alpha={}, beta={}, dtype={}>'.format(
         self.key, self.alpha, self.beta, self.dtype)
     return indent * '  ' + s
 
@@ -206,7 +412,7 @@ class Discrete(AbstractDistribution):
     self.key = key
     self.probs = probs
 
-  def sample(self, uniform, n, rng=None):
+  def sample(self, uniform=None, n=None, rng=None):
     '''
     if n == 0:
       out = "triangle"
@@ -219,6 +425,20 @@ class Discrete(AbstractDistribution):
     out = self.candidates[rng.choice(len(self.candidates), p=self.probs)]
     return {self.key: out}
 
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    indices = rng.choice(len(self.candidates), size=n, p=self.probs)
+    return {self.key: np.asarray(self.candidates)[indices]}
+
+  @property
+  def num_dimensions(self):
+    return 1
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    indices = _inverse_cdf_indices(points[:, 0], self.probs,
+                                   len(self.candidates))
+    return {self.key: np.asarray(self.candidates)[indices]}
+
   def contains(self, spec):
     if self.key not in spec:
       raise KeyError('key {} is not in spec {}, but must be to evaluate '
@@ -226,6 +446,9 @@ class Discrete(AbstractDistribution):
     else:
       return spec[self.key] in self.candidates
 
+  def contains_batch(self, columns):
+    return np.isin(_column(columns, self.key), self.candidates)
+
   def to_str(self, indent):
     s = '<Discrete: key={}, candidates={}, probs={}>'.format(
         self.key, self.candidates, self.probs)
@@ -262,15 +485,52 @@ class Mixture(AbstractDistribution):
             'All components must have the same key sets. However detected key '
             'sets {} and {}'.format(self._keys, c.keys))
 
-  def sample(self,uniform, n=None, rng=None):
+  def sample(self, uniform=None, n=None, rng=None):
     rng = self._get_rng(rng)
     sample_index = rng.choice(len(self.components), p=self.probs)
-    sample = self.components[sample_index].sample(uniform,rng=rng)
+    sample = self.components[sample_index].sample(uniform, n=n, rng=rng)
     return sample
 
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    assignments = rng.choice(len(self.components), size=n, p=self.probs)
+    batches, positions = [], []
+    for i, c in enumerate(self.components):
+      indices = np.flatnonzero(assignments == i)
+      batches.append(
+          c.sample_batch(
+              indices.size, rng=rng, uniform=_take_uniform(uniform, indices)))
+      positions.append(indices)
+    return _scatter(batches, positions, n, self.keys)
+
+  @property
+  def num_dimensions(self):
+    # The first dimension selects the component, the others are passed to it.
+    return 1 + max(c.num_dimensions for c in self.components)
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    assignments = _inverse_cdf_indices(points[:, 0], self.probs,
+                                       len(self.components))
+    batches, positions = [], []
+    for i, c in enumerate(self.components):
+      indices = np.flatnonzero(assignments == i)
+      batches.append(
+          c.transform_batch(
+              points[indices, 1:1 + c.num_dimensions],
+              rng=rng,
+              uniform=_take_uniform(uniform, indices)))
+      positions.append(indices)
+    return _scatter(batches, positions, len(points), self.keys)
+
   def contains(self, spec):
     return any(c.contains(spec) for c in self.components)
 
+  def contains_batch(self, columns):
+    mask = self.components[0].contains_batch(columns)
+    for c in self.components[1:]:
+      mask |= c.contains_batch(columns)
+    return mask
+
   def to_str(self, indent):
     components_strings = [x.to_str(indent + 2) for x in self.components]
     s = (indent * '  ' + '<Mixture:\n' +
@@ -285,7 +545,90 @@ class Mixture(AbstractDistribution):
     return self._keys
 
 
-class Intersection(AbstractDistribution):
+class _RejectionDistribution(AbstractDistribution):
+  """Base class for distributions sampled by rejection.
+
+  Subclasses implement _proposal and _accept_batch(). Candidates are
+  proposed in vectorized blocks. The first block has one candidate per
+  pending row, and later blocks are sized from the acceptance rate seen so far
+  in the same call, so that samples only depend on the random number
+  generator and not on the sampling history of the distribution.
+  Each pending row keeps the first accepted candidate proposed for it, and
+  candidates are independent, so samples follow exactly the same distribution
+  as sampling one candidate at a time.
+  """
+
+  @abc.abstractproperty
+  def _proposal(self):
+    """Distribution from which candidates are sampled."""
+
+  @abc.abstractmethod
+  def _accept_batch(self, columns, n):
+    """Boolean mask of the n candidates in columns that are accepted."""
+
+  def _block_size(self, num_pending, num_proposed, num_accepted):
+    if not num_proposed:
+      return num_pending
+    # Laplace-smoothed estimate, so that the rate is never zero.
+    rate = (num_accepted + 1.) / (num_proposed + 2.)
+    block_size = int(np.ceil(_OVERSAMPLING * num_pending / rate))
+    return max(num_pending, min(block_size, _MAX_BLOCK_SIZE))
+
+  def sample(self, uniform=None, n=None, rng=None):
+    return _take(self.sample_batch(1, rng=rng, uniform=uniform), 0)
+
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    pending = np.arange(n)
+    batches, positions = [], []
+    num_proposed = 0
+    num_accepted = 0
+    while pending.size:
+      if num_proposed >= _MAX_TRIES * (n - pending.size + 1):
+        raise ValueError('Maximum number of tried exceeded when trying to '
+                         'sample from {}.'.format(str(self)))
+      block_size = self._block_size(pending.size, num_proposed, num_accepted)
+      # Candidate i is proposed for pending row targets[i].
+      targets = np.resize(pending, block_size)
+      candidates = self._proposal.sample_batch(
+          block_size, rng=rng, uniform=_take_uniform(uniform, targets))
+      accepted = np.flatnonzero(self._accept_batch(candidates, block_size))
+      num_proposed += block_size
+      num_accepted += accepted.size
+
+      filled, first = np.unique(targets[accepted], return_index=True)
+      batches.append(_take(candidates, accepted[first]))
+      positions.append(filled)
+      pending = np.setdiff1d(pending, filled, assume_unique=True)
+    if not batches:
+      return self._proposal.sample_batch(0, rng=rng, uniform=uniform)
+    return _scatter(batches, positions, n, self.keys)
+
+  @property
+  def num_dimensions(self):
+    return self._proposal.num_dimensions
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    """Transform points through the proposal, resampling rejected rows.
+
+    Accepted rows keep the even spread of the points, while rejected rows are
+    replaced by random samples.
+    """
+    n = len(points)
+    candidates = self._proposal.transform_batch(
+        points, rng=rng, uniform=uniform)
+    accepted = self._accept_batch(candidates, n)
+    if np.all(accepted):
+      return candidates
+    rejected = np.flatnonzero(~accepted)
+    replacements = self.sample_batch(
+        rejected.size, rng=rng, uniform=_take_uniform(uniform, rejected))
+    accepted = np.flatnonzero(accepted)
+    return _scatter([_take(candidates, accepted), replacements],
+                    [accepted, rejected], n, self.keys)
+
+
+class Intersection(_RejectionDistribution):
   """Intersection of component distributions."""
 
   def __init__(self, components, index_for_sampling=0):
@@ -311,20 +654,26 @@ class Intersection(AbstractDistribution):
             'All components must have the same key sets. However detected key '
             'sets {} and {}'.format(self._keys, c.keys))
 
-  def sample(self,uniform,n=None, rng=None):
-    rng = self._get_rng(rng)
-    tries = 0
-    while tries < _MAX_TRIES:
-      tries += 1
-      sample = self.components[self.index_for_sampling].sample(uniform,rng=rng)
-      if all(c.contains(sample) for c in self.components):
-        return sample
-    raise ValueError('Maximum number of tried exceeded when trying to sample '
-                     'from {}.'.format(str(self)))
+  @property
+  def _proposal(self):
+    return self.components[self.index_for_sampling]
+
+  def _accept_batch(self, columns, n):
+    mask = np.ones(n, dtype=bool)
+    for i, c in enumerate(self.components):
+      if i != self.index_for_sampling:
+        mask &= c.contains_batch(columns)
+    return mask
 
   def contains(self, spec):
     return all(c.contains(spec) for c in self.components)
 
+  def contains_batch(self, columns):
+    mask = self.components[0].contains_batch(columns)
+    for c in self.components[1:]:
+      mask &= c.contains_batch(columns)
+    return mask
+
   def to_str(self, indent):
     components_strings = [x.to_str(indent + 2) for x in self.components]
     s = (indent * '  ' + '<Intersection:\n' +
@@ -359,16 +708,43 @@ class Product(AbstractDistribution):
           'All components must have different keys, yet there are {} '
           'overlapping keys.'.format(num_keys - len(self._keys)))
 
-  def sample(self,uniform,n=None, rng=None):
+  def sample(self, uniform=None, n=None, rng=None):
     rng = self._get_rng(rng)
     sample = {}
     for c in self.components:
-      sample.update(c.sample(uniform,n=n,rng=rng))
+      sample.update(c.sample(uniform, n=n, rng=rng))
+    return sample
+
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    sample = {}
+    for c in self.components:
+      sample.update(c.sample_batch(n, rng=rng, uniform=uniform))
+    return sample
+
+  @property
+  def num_dimensions(self):
+    return sum(c.num_dimensions for c in self.components)
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    sample = {}
+    start = 0
+    for c in self.components:
+      stop = start + c.num_dimensions
+      sample.update(
+          c.transform_batch(points[:, start:stop], rng=rng, uniform=uniform))
+      start = stop
     return sample
 
   def contains(self, spec):
     return all(c.contains(spec) for c in self.components)
 
+  def contains_batch(self, columns):
+    mask = self.components[0].contains_batch(columns)
+    for c in self.components[1:]:
+      mask &= c.contains_batch(columns)
+    return mask
+
   def to_str(self, indent):
     components_strings = [x.to_str(indent + 2) for x in self.components]
     s = (indent * '  ' + '<Product:\n' +
@@ -382,7 +758,7 @@ class Product(AbstractDistribution):
     return self._keys
 
 
-class SetMinus(AbstractDistribution):
+class SetMinus(_RejectionDistribution):
   """Setminus of distributions."""
 
   def __init__(self, base, hold_out):
@@ -402,20 +778,20 @@ class SetMinus(AbstractDistribution):
           'distribution.'
           .format(hold_out.keys, base.keys))
 
-  def sample(self,uniform,n=None, rng=None):
-    rng = self._get_rng(rng)
-    tries = 0
-    while tries < _MAX_TRIES:
-      tries += 1
-      sample = self.base.sample(uniform,rng=rng)
-      if not self.hold_out.contains(sample):
-        return sample
-    raise ValueError('Maximum number of tried exceeded when trying to sample '
-                     'from {}.'.format(str(self)))
+  @property
+  def _proposal(self):
+    return self.base
+
+  def _accept_batch(self, columns, n):
+    return ~self.hold_out.contains_batch(columns)
 
   def contains(self, spec):
     return self.base.contains(spec) and not self.hold_out.contains(spec)
 
+  def contains_batch(self, columns):
+    return (self.base.contains_batch(columns) &
+            ~self.hold_out.contains_batch(columns))
+
   def to_str(self, indent):
     s = (indent * '  ' + '<SetMinus:\n' +
          (indent + 1) * '  ' + 'base=\n{},\n' +
@@ -428,7 +804,7 @@ class SetMinus(AbstractDistribution):
     return self._keys
 
 
-class Selection(AbstractDistribution):
+class Selection(_RejectionDistribution):
   """Filter a source distribution."""
 
   def __init__(self, base, filtering):
@@ -452,21 +828,20 @@ class Selection(AbstractDistribution):
           'Keys {} of filtering is not a subset of keys {} of Selection base '
           'distribution.'.format(filtering.keys, base.keys))
 
-  def sample(self,uniform,n=None, rng=None):
-    rng = self._get_rng(rng)
-    tries = 0
-    while tries < _MAX_TRIES:
-      tries += 1
-      sample = self.base.sample(uniform,rng=rng)
-      if self.filtering.contains(sample):
-        return sample
-    raise ValueError(
-        'Maximum number of tried exceeded when trying to sample from {}.'
-        .format(str(self)))
+  @property
+  def _proposal(self):
+    return self.base
+
+  def _accept_batch(self, columns, n):
+    return self.filtering.contains_batch(columns)
 
   def contains(self, spec):
     return self.base.contains(spec) and self.filtering.contains(spec)
 
+  def contains_batch(self, columns):
+    return (self.base.contains_batch(columns) &
+            self.filtering.contains_batch(columns))
+
   def to_str(self, indent):
     s = (indent * '  ' + '<Selection:\n' + (indent + 1) * '  ' +
          'base=\n{},\n' + (indent + 1) * '  ' + 'filtering=\n{}>').format(
@@ -476,3 +851,326 @@ class Selection(AbstractDistribution):
   @property
   def keys(self):
     return self._keys
+
+
+class Box(AbstractDistribution):
+  """Uniform distribution over an axis-aligned box of continuous factors.
+
+  This is equivalent to a Product of Continuous distributions, but samples all
+  factors with a single call to the random number generator. Boxes are mostly
+  produced by compile_distribution().
+  """
+
+  def __init__(self, bounds, dtypes=None):
+    """Construct box distribution.
+    Args:
+      bounds: Dictionary from keys to (minval, maxval) pairs.
+      dtypes: None or dictionary from keys to string numpy dtypes. Missing keys
+        default to 'float32'.
+    """
+    self.bounds = dict(bounds)
+    dtypes = dtypes or {}
+    self.dtypes = {k: dtypes.get(k, 'float32') for k in self.bounds}
+    self._key_order = sorted(self.bounds)
+    self._minvals = np.array([self.bounds[k][0] for k in self._key_order])
+    self._maxvals = np.array([self.bounds[k][1] for k in self._key_order])
+
+  def sample(self, uniform=None, n=None, rng=None):
+    return _take(self.sample_batch(1, rng=rng), 0)
+
+  def sample_batch(self, n, rng=None, uniform=None):
+    rng = self._get_rng(rng)
+    out = rng.uniform(low=self._minvals, high=self._maxvals,
+                      size=(n, len(self._key_order)))
+    return self._columns(out)
+
+  @property
+  def num_dimensions(self):
+    return len(self._key_order)
+
+  def transform_batch(self, points, rng=None, uniform=None):
+    return self._columns(
+        self._minvals + points * (self._maxvals - self._minvals))
+
+  def _columns(self, out):
+    return {
+        k: _cast_in_range(out[:, i], self.bounds[k][0], self.bounds[k][1],
+                          self.dtypes[k])
+        for i, k in enumerate(self._key_order)
+    }
+
+  def contains(self, spec):
+    for k, (minval, maxval) in six.iteritems(self.bounds):
+      if k not in spec:
+        raise KeyError('key {} is not in spec {}, but must be to evaluate '
+                       'containment.'.format(k, spec))
+      if not minval <= spec[k] < maxval:
+        return False
+    return True
+
+  def contains_batch(self, columns):
+    mask = np.ones(_num_rows(columns), dtype=bool)
+    for k, (minval, maxval) in six.iteritems(self.bounds):
+      values = _column(columns, k)
+      mask &= (values >= minval) & (values < maxval)
+    return mask
+
+  def volume(self):
+    return float(np.prod(self._maxvals - self._minvals))
+
+  def to_str(self, indent):
+    s = '<Box: bounds={}, dtypes={}>'.format(
+        {k: self.bounds[k] for k in self._key_order}, self.dtypes)
+    return indent * '  ' + s
+
+  @property
+  def keys(self):
+    return set(self.bounds)
+
+
+def _as_box(distribution):
+  """Return distribution as a Box if it is a uniform box, else None."""
+  if isinstance(distribution, Box):
+    return distribution
+  if (isinstance(distribution, Continuous) and
+      np.dtype(distribution.dtype).kind == 'f'):
+    return Box({distribution.key: (distribution.minval, distribution.maxval)},
+               {distribution.key: distribution.dtype})
+  return None
+
+
+def _make_box(bounds, dtypes):
+  """Box with the given bounds, as a Continuous if it has a single key."""
+  if len(bounds) == 1:
+    (key, (minval, maxval)), = bounds.items()
+    return Continuous(key, minval, maxval, dtype=dtypes[key])
+  return Box(bounds, dtypes)
+
+
+def _split_box(distribution, keys):
+  """Split out a box component covering keys from a compiled distribution.
+
+  Args:
+    distribution: Compiled distribution.
+    keys: Set of keys.
+
+  Returns:
+    Tuple (box, rebuild) where box is a Box covering keys and rebuild(d) returns
+      distribution with box replaced by d, or (None, None) if distribution has
+      no such box component.
+  """
+  box = _as_box(distribution)
+  if box is not None:
+    return (box, lambda d: d) if keys <= box.keys else (None, None)
+  if isinstance(distribution, Product):
+    for i, c in enumerate(distribution.components):
+      box = _as_box(c)
+      if box is not None and keys <= box.keys:
+        others = list(distribution.components)
+
+        def rebuild(d, i=i, others=others):
+          others[i] = d
+          return _compile_product(others)
+
+        return box, rebuild
+  return None, None
+
+
+def _intersect_bounds(bounds, other_bounds):
+  """Intersect box bounds, returning None if the intersection is empty."""
+  bounds = dict(bounds)
+  for k, (minval, maxval) in six.iteritems(other_bounds):
+    minval = max(bounds[k][0], minval)
+    maxval = min(bounds[k][1], maxval)
+    if minval >= maxval:
+      return None
+    bounds[k] = (minval, maxval)
+  return bounds
+
+
+def _subtract_bounds(bounds, hole):
+  """Decompose a box minus a hole into disjoint boxes.
+
+  Args:
+    bounds: Dictionary from keys to (minval, maxval) pairs.
+    hole: Dictionary from a subset of the keys of bounds to (minval, maxval)
+      pairs.
+
+  Returns:
+    List of bounds dictionaries of disjoint boxes whose union is the box minus
+      the hole.
+  """
+  if _intersect_bounds(bounds, hole) is None:
+    return [bounds]
+  pieces = []
+  current = dict(bounds)
+  for k in sorted(hole):
+    minval, maxval = current[k]
+    hole_min, hole_max = max(hole[k][0], minval), min(hole[k][1], maxval)
+    for piece in ((minval, hole_min), (hole_max, maxval)):
+      if piece[0] < piece[1]:
+        pieces.append(dict(current))
+        pieces[-1][k] = piece
+    current[k] = (hole_min, hole_max)
+  return pieces
+
+
+def _compile_product(components):
+  """Flatten nested products and merge their box components."""
+  flat = []
+  for c in components:
+    flat.extend(c.components if isinstance(c, Product) else [c])
+  bounds, dtypes, others = {}, {}, []
+  for c in flat:
+    box = _as_box(c)
+    if box is None:
+      others.append(c)
+    else:
+      bounds.update(box.bounds)
+      dtypes.update(box.dtypes)
+  if bounds:
+    others.insert(0, _make_box(bounds, dtypes))
+  return others[0] if len(others) == 1 else Product(others)
+
+
+def _compile_mixture(mixture):
+  """Flatten nested mixtures, multiplying their probabilities."""
+  components, probs = [], []
+  for c, p in zip(mixture.components, mixture.probs):
+    c = compile_distribution(c)
+    if isinstance(c, Mixture):
+      components.extend(c.components)
+      probs.extend(p * c.probs)
+    else:
+      components.append(c)
+      probs.append(p)
+  if len(components) == 1:
+    return components[0]
+  return Mixture(components, probs=probs)
+
+
+def _compile_intersection(intersection):
+  components = [compile_distribution(c) for c in intersection.components]
+  boxes = [_as_box(c) for c in components]
+  if all(b is not None for b in boxes):
+    sampler = boxes[intersection.index_for_sampling]
+    bounds = sampler.bounds
+    for b in boxes:
+      bounds = bounds and _intersect_bounds(bounds, b.bounds)
+    if bounds:
+      return _make_box(bounds, sampler.dtypes)
+  return Intersection(components, intersection.index_for_sampling)
+
+
+def _compile_selection(selection):
+  base = compile_distribution(selection.base)
+  filtering = compile_distribution(selection.filtering)
+  filter_box = _as_box(filtering)
+  if filter_box is not None:
+    box, rebuild = _split_box(base, filter_box.keys)
+    if box is not None:
+      bounds = _intersect_bounds(box.bounds, filter_box.bounds)
+      if bounds is not None:
+        return rebuild(_make_box(bounds, box.dtypes))
+  return Selection(base, filtering)
+
+
+def _compile_set_minus(set_minus):
+  base = compile_distribution(set_minus.base)
+  hold_out = compile_distribution(set_minus.hold_out)
+  hole = _as_box(hold_out)
+  if hole is not None:
+    box, rebuild = _split_box(base, hole.keys)
+    if box is not None:
+      pieces = [Box(bounds, box.dtypes)
+                for bounds in _subtract_bounds(box.bounds, hole.bounds)]
+      volumes = np.array([p.volume() for p in pieces])
+      if pieces and np.sum(volumes) > 0:
+        if len(pieces) == 1:
+          return rebuild(_make_box(pieces[0].bounds, box.dtypes))
+        pieces = [_make_box(p.bounds, box.dtypes) for p in pieces]
+        return rebuild(Mixture(pieces, probs=volumes / np.sum(volumes)))
+  return SetMinus(base, hold_out)
+
+
+def compile_distribution(distribution):
+  """Compile a distribution tree into a simpler, faster equivalent tree.
+
+  The compiled distribution samples from the same distribution and has the same
+  support as the original one, but:
+    * Nested products and mixtures are flattened.
+    * Float Continuous components of products are merged into a single Box,
+      sampled with one call to the random number generator.
+    * Intersections and selections of boxes are replaced by the box bounding
+      their intersection, so need no rejection.
+    * Boxes minus a box hold-out are decomposed into a mixture of disjoint
+      boxes weighted by volume, so need no rejection either.
+  Other nodes are compiled recursively and kept as they are.
+
+  The compiled tree does not track later changes to the original one, so
+  compile once when the original is final and reuse the result.
+
+  Args:
+    distribution: Distribution to compile.
+
+  Returns:
+    Compiled distribution.
+  """
+  if isinstance(distribution, Product):
+    return _compile_product(
+        [compile_distribution(c) for c in distribution.components])
+  if isinstance(distribution, Mixture):
+    return _compile_mixture(distribution)
+  if isinstance(distribution, Intersection):
+    return _compile_intersection(distribution)
+  if isinstance(distribution, Selection):
+    return _compile_selection(distribution)
+  if isinstance(distribution, SetMinus):
+    return _compile_set_minus(distribution)
+  return distribution
+
+
+def sample_quasi_random(distribution, n, start=0, seed=0, method='sobol',
+                        rng=None, uniform=None):
+  """Sample specs at the points of a scrambled low-discrepancy sequence.
+
+  Points start to start + n - 1 of the sequence are mapped to specs by
+  distribution.transform_batch(), so specs cover the support of the
+  distribution much more evenly than independent samples. Shards generated in
+  parallel should use the same seed and method, and consecutive start offsets
+  (e.g. start = shard_index * shard_size), so that together they cover a
+  single sequence.
+
+  Args:
+    distribution: Distribution to sample from.
+    n: Int. Number of specs.
+    start: Int. Index of the first point in the sequence.
+    seed: Int. Seed of the scrambling of the sequence.
+    method: String. Either 'sobol' or 'halton'. Sobol sequences are best used
+      with n and start multiples of a large power of 2.
+    rng: Random number generator, used to replace candidates rejected by
+      Intersection, SetMinus and Selection distributions.
+    uniform: None or array of shape [n, num_factors] of copula uniforms.
+
+  Returns:
+    Dictionary from keys to arrays of length n, one row per spec.
+  """
+  from scipy.stats import qmc  # pylint: disable=g-import-not-at-top
+  num_dimensions = distribution.num_dimensions
+  if method == 'sobol':
+    engine_class = qmc.Sobol
+  elif method == 'halton':
+    engine_class = qmc.Halton
+  else:
+    raise ValueError('Unknown quasi-random method {}.'.format(method))
+  if num_dimensions:
+    engine = engine_class(num_dimensions, scramble=True, seed=seed)
+    if start:
+      engine.fast_forward(start)
+    with warnings.catch_warnings():
+      # Sobol warns about sizes that are not powers of 2.
+      warnings.simplefilter('ignore', UserWarning)
+      points = engine.random(n)
+  else:
+    points = np.zeros((n, 0))
+  return distribution.transform_batch(points, rng=rng, uniform=uniform)
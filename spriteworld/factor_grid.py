@@ -0,0 +1,325 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Exhaustive enumeration of discretized factor distributions.
+
+A FactorGrid enumerates every combination of the discretized factors of a
+factor distribution, like the dSprites dataset does, without materializing the
+combinations. Integer indices are mapped to specs, and specs back to indices,
+by mixed-radix arithmetic on per-factor value tables. Exclusions made by
+SetMinus, Selection and Intersection distributions are precomputed as a mask
+and rank table over the product of the factors they constrain only.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import abc
+import numpy as np
+import six
+from spriteworld import factor_distributions as distribs
+
+
+@six.add_metaclass(abc.ABCMeta)
+class _Grid(object):
+  """Node of an enumerated grid."""
+
+  @abc.abstractproperty
+  def size(self):
+    """Number of specs in the grid."""
+
+  @abc.abstractproperty
+  def keys(self):
+    """The set of keys of the specs."""
+
+  @abc.abstractmethod
+  def rows(self, indices):
+    """Dictionary of column arrays of the specs at int array indices."""
+
+  @abc.abstractmethod
+  def lookup(self, columns):
+    """Int array of the indices of the specs in columns, -1 if not found."""
+
+
+class _LeafGrid(_Grid):
+  """Grid of the values of a single factor."""
+
+  def __init__(self, key, values):
+    self._key = key
+    self._values = np.asarray(values)
+    self._order = np.argsort(self._values, kind='stable')
+    self._sorted = self._values[self._order]
+
+  @property
+  def size(self):
+    return len(self._values)
+
+  @property
+  def keys(self):
+    return set([self._key])
+
+  def rows(self, indices):
+    return {self._key: self._values[indices]}
+
+  def lookup(self, columns):
+    values = np.asarray(columns[self._key])
+    positions = np.clip(
+        np.searchsorted(self._sorted, values), 0, len(self._sorted) - 1)
+    found = self._sorted[positions] == values
+    return np.where(found, self._order[positions], -1)
+
+
+class _ProductGrid(_Grid):
+  """Cartesian product of grids with disjoint keys, the last varying fastest."""
+
+  def __init__(self, children):
+    self._children = list(children)
+    sizes = [c.size for c in self._children]
+    self._size = int(np.prod(sizes, dtype=np.int64))
+    self._strides = np.cumprod([1] + sizes[:0:-1], dtype=np.int64)[::-1]
+
+  @property
+  def size(self):
+    return self._size
+
+  @property
+  def children(self):
+    return self._children
+
+  @property
+  def keys(self):
+    return set().union(*[c.keys for c in self._children])
+
+  def rows(self, indices):
+    columns = {}
+    for child, stride in zip(self._children, self._strides):
+      columns.update(child.rows((indices // stride) % child.size))
+    return columns
+
+  def lookup(self, columns):
+    indices = 0
+    found = True
+    for child, stride in zip(self._children, self._strides):
+      child_indices = child.lookup(columns)
+      found = found & (child_indices >= 0)
+      indices = indices + child_indices * stride
+    return np.where(found, indices, -1)
+
+
+class _ConcatGrid(_Grid):
+  """Concatenation of grids with the same keys."""
+
+  def __init__(self, children):
+    self._children = list(children)
+    self._offsets = np.cumsum([0] + [c.size for c in self._children])
+
+  @property
+  def size(self):
+    return int(self._offsets[-1])
+
+  @property
+  def keys(self):
+    return self._children[0].keys
+
+  def rows(self, indices):
+    child_indices = np.searchsorted(self._offsets, indices, side='right') - 1
+    batches, positions = [], []
+    for i, child in enumerate(self._children):
+      selected = np.flatnonzero(child_indices == i)
+      batches.append(child.rows(indices[selected] - self._offsets[i]))
+      positions.append(selected)
+    positions = np.concatenate(positions)
+    columns = {}
+    for k in self.keys:
+      values = np.concatenate([b[k] for b in batches])
+      columns[k] = np.empty(len(indices), dtype=values.dtype)
+      columns[k][positions] = values
+    return columns
+
+  def lookup(self, columns):
+    # Specs in several children are found in the first one.
+    indices = None
+    for child, offset in zip(self._children, self._offsets):
+      child_indices = child.lookup(columns)
+      if indices is None:
+        indices = -np.ones_like(child_indices)
+      found = (indices < 0) & (child_indices >= 0)
+      indices[found] = child_indices[found] + offset
+    return indices
+
+
+class _FilteredGrid(_Grid):
+  """Subset of a grid, given by a boolean mask over its indices."""
+
+  def __init__(self, child, mask):
+    self._child = child
+    self._valid = np.flatnonzero(mask)
+    self._ranks = np.where(mask, np.cumsum(mask) - 1, -1)
+
+  @property
+  def size(self):
+    return len(self._valid)
+
+  @property
+  def keys(self):
+    return self._child.keys
+
+  def rows(self, indices):
+    return self._child.rows(self._valid[indices])
+
+  def lookup(self, columns):
+    child_indices = self._child.lookup(columns)
+    return np.where(child_indices >= 0, self._ranks[child_indices], -1)
+
+
+def _filter(grid, predicate, predicate_keys):
+  """Filter grid by predicate, a function of the columns of predicate_keys.
+
+  If grid is a product, only the product of the children with keys in
+  predicate_keys is masked, so the mask is usually much smaller than the grid.
+  """
+  if isinstance(grid, _ProductGrid):
+    constrained = [c for c in grid.children if c.keys & predicate_keys]
+    free = [c for c in grid.children if not c.keys & predicate_keys]
+    if free:
+      constrained = _ProductGrid(constrained)
+      return _ProductGrid(
+          [_filter(constrained, predicate, predicate_keys)] + free)
+  mask = predicate(grid.rows(np.arange(grid.size)))
+  return _FilteredGrid(grid, mask)
+
+
+def _num_values(resolution, key):
+  if isinstance(resolution, dict):
+    resolution = resolution.get(key)
+  if resolution is None:
+    raise ValueError('A resolution is needed to enumerate continuous factor '
+                     '{}.'.format(key))
+  return resolution
+
+
+def _build(distribution, resolution):
+  """Build the grid of a distribution."""
+  if isinstance(distribution, distribs.Discrete):
+    return _LeafGrid(distribution.key, distribution.candidates)
+  if isinstance(distribution, (distribs.Continuous, distribs.Beta)):
+    if isinstance(distribution, distribs.Beta):
+      # Quantiles of the marginal, also for non-identifiable distributions.
+      distribution = distribs.Beta(
+          distribution.key, distribution.alpha, distribution.beta,
+          dtype=distribution.dtype, ppf_tolerance=distribution.ppf_tolerance)
+    num_values = _num_values(resolution, distribution.key)
+    bins = (np.arange(num_values) + 0.5) / num_values
+    values = distribution.transform_batch(bins[:, None])[distribution.key]
+    # Integer dtypes may map several bins to the same value.
+    return _LeafGrid(distribution.key, np.unique(values))
+  if isinstance(distribution, distribs.Box):
+    return _ProductGrid([
+        _build(distribs.Continuous(k, minval, maxval, distribution.dtypes[k]),
+               resolution)
+        for k, (minval, maxval) in sorted(distribution.bounds.items())
+    ])
+  if isinstance(distribution, distribs.Product):
+    return _ProductGrid([_build(c, resolution)
+                         for c in distribution.components])
+  if isinstance(distribution, distribs.Mixture):
+    return _ConcatGrid([_build(c, resolution)
+                        for c in distribution.components])
+  if isinstance(distribution, distribs.SetMinus):
+    hold_out = distribution.hold_out
+    return _filter(
+        _build(distribution.base, resolution),
+        lambda columns: ~hold_out.contains_batch(columns), hold_out.keys)
+  if isinstance(distribution, distribs.Selection):
+    filtering = distribution.filtering
+    return _filter(
+        _build(distribution.base, resolution), filtering.contains_batch,
+        filtering.keys)
+  if isinstance(distribution, distribs.Intersection):
+    components = distribution.components
+    sampler = components[distribution.index_for_sampling]
+
+    def _contained(columns):
+      mask = np.ones(len(next(iter(columns.values()))), dtype=bool)
+      for c in components:
+        if c is not sampler:
+          mask &= c.contains_batch(columns)
+      return mask
+
+    return _filter(_build(sampler, resolution), _contained, sampler.keys)
+  raise ValueError('Cannot enumerate distribution {}.'.format(distribution))
+
+
+class FactorGrid(object):
+  """Lazily indexed grid of every combination of discretized factors.
+
+  Discrete factors take each of their candidates. Continuous and Beta factors
+  take `resolution` values at the centers of equal-probability bins. Products
+  enumerate all combinations, with their last component varying fastest, and
+  mixtures concatenate the grids of their components, so specs in several
+  components are enumerated once per component. Specs excluded by SetMinus,
+  Selection and Intersection distributions are skipped. Enumerate original
+  rather than compiled distributions, since compilation splits continuous
+  ranges into pieces that would be discretized separately.
+
+  Only per-factor value tables and the masks of the exclusions are stored, so
+  specs can be generated or looked up in parallel, by index, in constant time
+  with respect to the size of the grid.
+  """
+
+  def __init__(self, distribution, resolution=None):
+    """Construct factor grid.
+
+    Args:
+      distribution: Factor distribution to enumerate.
+      resolution: None, int, or dictionary from keys to ints. Number of values
+        of continuous factors. Required if the distribution has any.
+    """
+    self._grid = _build(distribution, resolution)
+
+  def __len__(self):
+    return self._grid.size
+
+  @property
+  def keys(self):
+    return self._grid.keys
+
+  def rows(self, indices):
+    """Specs at int array indices, as a dictionary of column arrays."""
+    indices = np.asarray(indices, dtype=np.int64)
+    if np.any(indices < 0) or np.any(indices >= len(self)):
+      raise IndexError('Indices must be in [0, {}).'.format(len(self)))
+    return self._grid.rows(indices)
+
+  def __getitem__(self, index):
+    columns = self.rows(np.array([index]))
+    return {k: v[0] for k, v in six.iteritems(columns)}
+
+  def indices(self, columns):
+    """Indices of the specs given as a dictionary of column arrays.
+
+    Raises:
+      KeyError: If any spec is not in the grid.
+    """
+    indices = self._grid.lookup(columns)
+    if np.any(indices < 0):
+      raise KeyError('Specs {} are not in the grid.'.format(
+          {k: np.asarray(v)[indices < 0] for k, v in six.iteritems(columns)}))
+    return indices
+
+  def index(self, spec):
+    """Index of a spec dictionary."""
+    return int(self.indices({k: [spec[k]] for k in self.keys})[0])
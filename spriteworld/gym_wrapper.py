@@ -108,14 +108,18 @@ class GymWrapper(object):
     info = {'discount': time_step.discount}
     return obs, reward, done, info
 
-  def reset(self):
+  def reset(self, seed=None):
     """Reset environment.
 
+    Args:
+      seed: None or int. If not None, re-seed the environment random number
+        generator.
+
     Returns:
       obs: dict of observations. Follows from the 'renderers' configuration
         provided as parameters to Spriteworld.
     """
-    time_step = self._env.reset()
+    time_step = self._env.reset(seed=seed)
     return self._process_obs(time_step.observation)
 
   def render(self, mode='rgb_array'):
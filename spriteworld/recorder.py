@@ -0,0 +1,307 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Trajectory recorder streaming rollouts to chunked memory-mapped files.
+
+A recording is a directory containing:
+  * metadata.json: chunk size, number of recorded steps and episodes, and
+      field specs.
+  * chunk_XXXXX/<field>.npy: one preallocated .npy file per field and chunk,
+      each with chunk_size rows.
+
+Every environment timestep is one row. The fields are:
+  * episode: index of the episode the step belongs to.
+  * step_type, reward, discount: from the dm_env.TimeStep.
+  * action: the action passed to Environment.step(), zeros on the first step.
+  * factors: factor matrix of the sprites, see sprite.sprites_to_array().
+  * num_sprites: number of non-padding rows of the factor matrix.
+  * obs_<key>: observation entries, for each recorded observation key. Lists
+      of per-sprite renders followed by the full image, as returned by
+      PILRenderer, are recorded as the full image only.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import numpy as np
+import six
+from spriteworld import datasets
+from spriteworld import sprite as sprite_lib
+
+_METADATA_FILE = 'metadata.json'
+_OBSERVATION_PREFIX = 'obs_'
+
+
+def _chunk_dir(directory, chunk_index):
+  return os.path.join(directory, 'chunk_{:05d}'.format(chunk_index))
+
+
+class TrajectoryRecorder(object):
+  """Streams environment timesteps into chunked memory-mapped numpy files.
+
+  Each field is written into preallocated memory-mapped chunks of chunk_size
+  rows, so the cost of recording a step is constant and memory usage stays flat
+  regardless of the length of the run.
+
+  Pass an instance as the `recorder` argument of environment.Environment, or
+  call record() manually. Call close() when done to finalize the recording.
+  """
+
+  def __init__(self,
+               directory,
+               chunk_size=1000,
+               observation_keys=None,
+               max_sprites=16,
+               factor_names=sprite_lib.FACTOR_NAMES,
+               factors_dtype=np.float32):
+    """Construct trajectory recorder.
+
+    Args:
+      directory: String. Directory to write the recording to. Created if it
+        does not exist, and must not already contain a recording.
+      chunk_size: Int. Number of steps per chunk file.
+      observation_keys: None or iterable of strings. Observation keys to
+        record. If None, all keys are recorded. Only these keys are rendered by
+        the recorder. Recorded entries must be arrays of fixed shape and
+        non-object dtype.
+      max_sprites: Int. Number of rows of the recorded factor matrices.
+      factor_names: Iterable of strings. Columns of the factor matrices.
+      factors_dtype: Numpy float dtype of the factor matrices.
+    """
+    if os.path.exists(os.path.join(directory, _METADATA_FILE)):
+      raise ValueError('Directory {} already contains a recording.'.format(
+          directory))
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self._directory = directory
+    self._chunk_size = chunk_size
+    self._observation_keys = observation_keys
+    self._max_sprites = max_sprites
+    self._factor_names = tuple(factor_names)
+    self._factors_dtype = np.dtype(factors_dtype)
+
+    self._field_specs = {}
+    self._chunk_index = -1
+    self._chunk = {}
+    self._row = chunk_size
+    self._num_steps = 0
+    self._num_episodes = 0
+    self._last_action = None
+    self._closed = False
+
+  def _new_chunk(self):
+    """Flush the current chunk and preallocate the next one."""
+    self._flush_chunk()
+    self._chunk_index += 1
+    self._chunk = {}
+    self._row = 0
+    os.makedirs(_chunk_dir(self._directory, self._chunk_index))
+    for name in self._field_specs:
+      self._open_field(name)
+    self._write_metadata()
+
+  def _open_field(self, name, chunk_index=None):
+    """Preallocate a zero-filled chunk file for field name."""
+    shape, dtype = self._field_specs[name]
+    if chunk_index is None:
+      chunk_index = self._chunk_index
+    path = os.path.join(_chunk_dir(self._directory, chunk_index),
+                        name + '.npy')
+    array = np.lib.format.open_memmap(
+        path, mode='w+', dtype=dtype, shape=(self._chunk_size,) + shape)
+    if chunk_index == self._chunk_index:
+      self._chunk[name] = array
+    return array
+
+  def _flush_chunk(self):
+    for array in six.itervalues(self._chunk):
+      array.flush()
+
+  def _write(self, name, value):
+    """Write value in the current row of field name."""
+    value = np.asarray(value)
+    if name not in self._field_specs:
+      if value.dtype == np.object_:
+        raise ValueError(
+            'Cannot record field {} of object dtype. Restrict the recorded '
+            'observation_keys to array-valued observations.'.format(name))
+      self._field_specs[name] = (value.shape, value.dtype)
+      # Fields first written after the start of the recording (e.g. the
+      # action, which is None on the first step) are zero-filled before.
+      for chunk_index in range(self._chunk_index):
+        self._open_field(name, chunk_index=chunk_index).flush()
+      self._open_field(name)
+    elif value.shape != self._field_specs[name][0]:
+      raise ValueError(
+          'Field {} has shape {}, but shape {} was recorded before.'.format(
+              name, value.shape, self._field_specs[name][0]))
+    self._chunk[name][self._row] = value
+
+  def record(self, timestep, action, sprites):
+    """Record one environment timestep.
+
+    Args:
+      timestep: dm_env.TimeStep returned by the environment.
+      action: Action passed to Environment.step() that produced timestep, or
+        None on the first step of an episode.
+      sprites: Iterable of sprites of the state of timestep.
+    """
+    if self._closed:
+      raise ValueError('Cannot record to a closed TrajectoryRecorder.')
+    if self._row == self._chunk_size:
+      self._new_chunk()
+
+    if timestep.first():
+      self._num_episodes += 1
+    elif not self._num_episodes:
+      raise ValueError('The first recorded timestep must start an episode.')
+    self._write('episode', np.int64(self._num_episodes - 1))
+
+    if action is None:
+      if self._last_action is not None:
+        action = np.zeros_like(self._last_action)
+    else:
+      action = np.asarray(action)
+      self._last_action = action
+    if action is not None:
+      self._write('action', action)
+
+    self._write('step_type', np.int8(timestep.step_type))
+    self._write('reward', np.float32(timestep.reward or 0.))
+    self._write('discount', np.float32(
+        1. if timestep.discount is None else timestep.discount))
+    sprites = list(sprites)
+    self._write('num_sprites', np.int32(len(sprites)))
+    self._write(
+        'factors',
+        sprite_lib.sprites_to_array(
+            sprites,
+            num_rows=self._max_sprites,
+            factor_names=self._factor_names,
+            dtype=self._factors_dtype))
+
+    keys = self._observation_keys
+    if keys is None:
+      keys = timestep.observation.keys()
+    for key in keys:
+      self._write(_OBSERVATION_PREFIX + key,
+                  datasets.last_render(timestep.observation[key]))
+
+    self._row += 1
+    self._num_steps += 1
+
+  def _write_metadata(self):
+    metadata = {
+        'chunk_size': self._chunk_size,
+        'num_steps': self._num_steps,
+        'num_episodes': self._num_episodes,
+        'factor_names': list(self._factor_names),
+        'fields': {
+            name: {'shape': list(shape), 'dtype': dtype.str}
+            for name, (shape, dtype) in six.iteritems(self._field_specs)
+        },
+    }
+    with open(os.path.join(self._directory, _METADATA_FILE), 'w') as f:
+      json.dump(metadata, f, indent=2, sort_keys=True)
+
+  def flush(self):
+    """Flush written rows and the metadata to disk."""
+    self._flush_chunk()
+    self._write_metadata()
+
+  def close(self):
+    """Finalize the recording."""
+    if not self._closed:
+      self.flush()
+      self._chunk = {}
+      self._closed = True
+
+  @property
+  def num_steps(self):
+    return self._num_steps
+
+  @property
+  def num_episodes(self):
+    return self._num_episodes
+
+
+class Trajectories(object):
+  """Read-only access to a recording made by TrajectoryRecorder."""
+
+  def __init__(self, directory, mmap_mode='r'):
+    """Open a recording.
+
+    Args:
+      directory: String. Directory of the recording.
+      mmap_mode: Memory-map mode passed to np.load.
+    """
+    with open(os.path.join(directory, _METADATA_FILE)) as f:
+      self._metadata = json.load(f)
+    self._chunk_size = self._metadata['chunk_size']
+    self._num_steps = self._metadata['num_steps']
+    num_chunks = -(-self._num_steps // self._chunk_size)
+    self._chunks = [{
+        name: np.load(
+            os.path.join(_chunk_dir(directory, i), name + '.npy'),
+            mmap_mode=mmap_mode) for name in self._metadata['fields']
+    } for i in range(num_chunks)]
+    # Episode indices are non-decreasing, so episode boundaries are found by
+    # binary search.
+    self._episode_ids = np.zeros([0], dtype=np.int64)
+    if self._num_steps:
+      self._episode_ids = self.get('episode', 0, self._num_steps)
+
+  def __len__(self):
+    return self._num_steps
+
+  @property
+  def fields(self):
+    return sorted(self._metadata['fields'])
+
+  @property
+  def factor_names(self):
+    return tuple(self._metadata['factor_names'])
+
+  @property
+  def num_episodes(self):
+    return self._metadata['num_episodes']
+
+  def get(self, name, start, stop):
+    """Rows [start, stop) of field name, as a single array."""
+    stop = min(stop, self._num_steps)
+    pieces = []
+    while start < stop:
+      chunk, row = divmod(start, self._chunk_size)
+      n = min(stop - start, self._chunk_size - row)
+      pieces.append(self._chunks[chunk][name][row:row + n])
+      start += n
+    if not pieces:
+      spec = self._metadata['fields'][name]
+      return np.zeros([0] + spec['shape'], dtype=spec['dtype'])
+    if len(pieces) == 1:
+      return pieces[0]
+    return np.concatenate(pieces)
+
+  def episode(self, index):
+    """Dict of field name to array with the rows of an episode."""
+    if index < 0:
+      index += self.num_episodes
+    if not 0 <= index < self.num_episodes:
+      raise IndexError('Episode index {} out of range.'.format(index))
+    start, stop = np.searchsorted(self._episode_ids, [index, index + 1])
+    return {name: self.get(name, start, stop) for name in self.fields}
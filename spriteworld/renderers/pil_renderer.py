@@ -19,13 +19,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import copy
 from dm_env import specs
 import numpy as np
 from PIL import Image
 from PIL import ImageDraw
-import torch
 from spriteworld.renderers import abstract_renderer
-from matplotlib import pyplot as plt
 
 
 class PILRenderer(abstract_renderer.AbstractRenderer):
@@ -102,3 +101,12 @@ class PILRenderer(abstract_renderer.AbstractRenderer):
 
   def observation_spec(self):
     return self._observation_spec
+
+  def __deepcopy__(self, memo):
+    """Copy renderer with its own canvas, e.g. to render in another thread."""
+    del memo
+    result = copy.copy(self)
+    result._canvas_bg = self._canvas_bg.copy()
+    result._canvas = self._canvas.copy()
+    result._draw = ImageDraw.Draw(result._canvas)
+    return result
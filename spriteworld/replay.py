@@ -0,0 +1,233 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Replay buffer storing sprite factors and rendering observations on demand.
+
+A Spriteworld scene is fully defined by the factors of its sprites, so instead
+of storing rendered images the replay buffer stores per-step factor matrices
+(see sprite.sprites_to_array()), actions and rewards. Observations are
+re-rendered from the factors when they are requested, through any renderer, and
+cached in a bounded LRU cache.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import numpy as np
+import six
+from spriteworld import sprite as sprite_lib
+
+
+def _stack(values):
+  """Stack renderer outputs into a batch, or return a list if not stackable."""
+  try:
+    return np.stack([np.asarray(v) for v in values])
+  except ValueError:
+    return list(values)
+
+
+class FactorReplay(object):
+  """Ring buffer of transitions whose observations are rendered from factors.
+
+  FactorReplay has the same record() method as recorder.TrajectoryRecorder, so
+  it can be passed as the `recorder` argument of environment.Environment.
+  """
+
+  def __init__(self,
+               capacity,
+               renderers,
+               max_sprites=16,
+               factor_names=sprite_lib.FACTOR_NAMES,
+               factors_dtype=np.float32,
+               record_success=False,
+               cache_size=1024):
+    """Construct replay buffer.
+
+    Args:
+      capacity: Int. Maximum number of stored steps. The oldest steps are
+        overwritten first.
+      renderers: Dict where values are renderers and keys are names, like the
+        renderers of environment.Environment.
+      max_sprites: Int. Maximum number of sprites per step.
+      factor_names: Iterable of strings. Factors to store. Must contain every
+        factor needed by the renderers, the others take their Sprite default.
+      factors_dtype: Numpy float dtype of the stored factors.
+      record_success: Bool. Whether to store the task success of every step,
+        passed to the renderers as global_state['success']. It is read from
+        the global state of the recorded observations, as evaluated by the
+        environment, so the task is not evaluated again.
+      cache_size: Int. Maximum number of rendered observations to cache.
+    """
+    self._capacity = capacity
+    self._renderers = renderers
+    self._max_sprites = max_sprites
+    self._factor_names = tuple(factor_names)
+    self._record_success = record_success
+    self._cache_size = cache_size
+    self._cache = collections.OrderedDict()
+
+    self._factors = np.full(
+        (capacity, max_sprites, len(self._factor_names)),
+        np.nan,
+        dtype=factors_dtype)
+    self._num_sprites = np.zeros(capacity, dtype=np.int32)
+    self._step_type = np.zeros(capacity, dtype=np.int8)
+    self._reward = np.zeros(capacity, dtype=np.float32)
+    self._discount = np.zeros(capacity, dtype=np.float32)
+    self._success = np.zeros(capacity, dtype=np.bool_)
+    self._action = None
+    # Number of steps ever added when each slot was written, used to
+    # invalidate cached renders of overwritten slots.
+    self._write_ids = -np.ones(capacity, dtype=np.int64)
+    self._num_added = 0
+
+  def __len__(self):
+    return min(self._num_added, self._capacity)
+
+  def record(self, timestep, action, sprites):
+    """Add one environment timestep.
+
+    Args:
+      timestep: dm_env.TimeStep returned by the environment. Its observation is
+        not stored. With record_success, it must be an
+        environment.LazyObservation.
+      action: Action passed to Environment.step() that produced timestep, or
+        None on the first step of an episode.
+      sprites: Iterable of sprites of the state of timestep.
+    """
+    slot = self._num_added % self._capacity
+    sprites = list(sprites)
+    self._factors[slot] = sprite_lib.sprites_to_array(
+        sprites,
+        num_rows=self._max_sprites,
+        factor_names=self._factor_names,
+        dtype=self._factors.dtype)
+    self._num_sprites[slot] = len(sprites)
+    self._step_type[slot] = timestep.step_type
+    self._reward[slot] = timestep.reward or 0.
+    self._discount[slot] = (
+        1. if timestep.discount is None else timestep.discount)
+    if self._record_success:
+      self._success[slot] = timestep.observation.global_state['success']
+
+    if action is not None:
+      action = np.asarray(action)
+      if self._action is None:
+        self._action = np.zeros((self._capacity,) + action.shape,
+                                dtype=action.dtype)
+      self._action[slot] = action
+    elif self._action is not None:
+      self._action[slot] = 0
+
+    self._write_ids[slot] = self._num_added
+    self._num_added += 1
+
+  def _check_indices(self, indices):
+    indices = np.asarray(indices)
+    if np.any(indices < 0) or np.any(indices >= len(self)):
+      raise IndexError('Indices must be in [0, {}).'.format(len(self)))
+    return indices
+
+  def _slots(self, indices):
+    """Map indices, 0 being the oldest stored step, to buffer slots."""
+    oldest = max(self._num_added - self._capacity, 0)
+    return (oldest + self._check_indices(indices)) % self._capacity
+
+  def sample_indices(self, batch_size, rng=None):
+    """Sample indices of stored steps uniformly at random."""
+    rng = np.random if rng is None else rng
+    return rng.choice(len(self), size=batch_size)
+
+  def get(self, indices):
+    """Return a batch of stored transitions, without observations.
+
+    Args:
+      indices: Int array. Indices of stored steps, 0 being the oldest.
+
+    Returns:
+      Dict with keys 'factors', 'num_sprites', 'step_type', 'reward',
+        'discount', 'success' and 'action', each a batch of values.
+    """
+    slots = self._slots(indices)
+    batch = {
+        'factors': self._factors[slots],
+        'num_sprites': self._num_sprites[slots],
+        'step_type': self._step_type[slots],
+        'reward': self._reward[slots],
+        'discount': self._discount[slots],
+        'success': self._success[slots],
+    }
+    if self._action is not None:
+      batch['action'] = self._action[slots]
+    return batch
+
+  def sprites(self, index):
+    """Reconstruct the sprites of a stored step."""
+    slot = self._slots(index)
+    return sprite_lib.array_to_sprites(
+        self._factors[slot, :self._num_sprites[slot]], self._factor_names)
+
+  def _render(self, slot, names):
+    """Render observation entries names of a slot, using the cache."""
+    write_id = self._write_ids[slot]
+    outputs = {}
+    state = None
+    for name in names:
+      cache_key = (name, write_id)
+      if cache_key in self._cache:
+        self._cache[cache_key] = self._cache.pop(cache_key)  # Mark as recent.
+        outputs[name] = self._cache[cache_key]
+        continue
+      if state is None:
+        sprites = sprite_lib.array_to_sprites(
+            self._factors[slot, :self._num_sprites[slot]], self._factor_names)
+        global_state = {}
+        if self._record_success:
+          global_state['success'] = bool(self._success[slot])
+        state = {'sprites': sprites, 'global_state': global_state}
+      outputs[name] = self._renderers[name].render(**state)
+      if self._cache_size:
+        self._cache[cache_key] = outputs[name]
+        while len(self._cache) > self._cache_size:
+          self._cache.popitem(last=False)
+    return outputs
+
+  def observations(self, indices, names=None):
+    """Render the observations of a batch of stored steps.
+
+    Args:
+      indices: Int array. Indices of stored steps, 0 being the oldest.
+      names: None or iterable of renderer names. If None, all renderers are
+        used.
+
+    Returns:
+      Dict from renderer name to batch of rendered observations. Outputs are
+        stacked into an array if their shapes agree, otherwise returned as a
+        list.
+    """
+    if names is None:
+      names = list(self._renderers)
+    rendered = [self._render(slot, names) for slot in self._slots(indices)]
+    return {name: _stack([r[name] for r in rendered]) for name in names}
+
+  def sample(self, batch_size, rng=None, names=None):
+    """Sample a batch of transitions with rendered observations."""
+    indices = self.sample_indices(batch_size, rng=rng)
+    batch = self.get(indices)
+    for name, value in six.iteritems(self.observations(indices, names=names)):
+      batch['obs_' + name] = value
+    return batch
@@ -0,0 +1,161 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Pool of initial scenes sampled ahead of time in a background thread.
+
+Sampling the initial sprites of an episode, and rendering them, happens on
+every environment reset. A ScenePool moves this work off the reset path: a
+daemon thread keeps a bounded queue of scenes filled, and reset only pops the
+next one. Scene k is sampled from np.random.default_rng([seed, k]), so the
+sequence of scenes only depends on the seed, not on thread timing.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import copy
+import sys
+import threading
+import numpy as np
+import six
+from six.moves import queue as queue_lib
+from spriteworld import sprite_generators
+
+# How often, in seconds, a blocked worker checks whether it should stop.
+_POLL_INTERVAL = 0.1
+
+Scene = collections.namedtuple('Scene', ['index', 'sprites', 'observations'])
+Scene.__doc__ = """Prefetched scene.
+
+Attributes:
+  index: Int. Sequence number of the scene since the pool was (re)started.
+  sprites: List of sprites.
+  observations: Dict from renderer names to pre-rendered observations.
+"""
+
+# Error raised while making a scene, holding the output of sys.exc_info().
+_Failure = collections.namedtuple('_Failure', ['exc_info'])
+
+
+class ScenePool(object):
+  """Bounded queue of initial scenes filled by a background thread.
+
+  The worker is a thread rather than a process, so sprite generators and
+  renderers need not be picklable. It overlaps scene sampling with whatever
+  releases the GIL in the meantime, e.g. rendering, agent inference or other
+  environments of a vectorized environment.
+  """
+
+  def __init__(self, init_sprites, capacity=8, seed=None, renderers=None):
+    """Construct scene pool and start its worker.
+
+    Args:
+      init_sprites: Callable returning iterable of sprites. If it accepts an
+        `rng` argument, the random number generator of each scene is passed to
+        it.
+      capacity: Int. Maximum number of scenes sampled ahead.
+      seed: None or int. Seed of the sequence of scenes. If None, fresh entropy
+        is used.
+      renderers: None or dict where values are renderers and keys are names.
+        Scenes are pre-rendered with copies of these renderers, called with an
+        empty global state, so they must only depend on the sprites.
+    """
+    if capacity < 1:
+      raise ValueError(
+          'capacity must be at least 1, but is {}.'.format(capacity))
+    self._init_sprites = sprite_generators.with_rng(init_sprites)
+    self._capacity = capacity
+    # Renderers are not thread-safe, so the worker uses its own.
+    self._renderers = copy.deepcopy(renderers or {})
+    self._worker = None
+    self.restart(seed)
+
+  def _make_scene(self, seed, index):
+    rng = np.random.default_rng([seed, index])
+    sprites = list(self._init_sprites(rng))
+    observations = {
+        name: renderer.render(sprites=sprites, global_state={})
+        for name, renderer in six.iteritems(self._renderers)
+    }
+    return Scene(index, sprites, observations)
+
+  def _run(self, seed, scenes, stop):
+    index = 0
+    while not stop.is_set():
+      try:
+        item = self._make_scene(seed, index)
+      except Exception:  # pylint: disable=broad-except
+        # Re-raised by get() in the main thread.
+        item = _Failure(sys.exc_info())
+      while not stop.is_set():
+        try:
+          scenes.put(item, timeout=_POLL_INTERVAL)
+          break
+        except queue_lib.Full:
+          pass
+      if isinstance(item, _Failure):
+        return
+      index += 1
+
+  def restart(self, seed=None):
+    """Discard the prefetched scenes and restart the sequence from seed."""
+    self.close()
+    if seed is None:
+      seed = np.random.SeedSequence().entropy
+    self._seed = seed
+    self._scenes = queue_lib.Queue(maxsize=self._capacity)
+    self._stop = threading.Event()
+    self._worker = threading.Thread(
+        target=self._run, args=(seed, self._scenes, self._stop))
+    self._worker.daemon = True
+    self._worker.start()
+
+  @property
+  def seed(self):
+    return self._seed
+
+  def get(self, timeout=None):
+    """Pop the next scene, waiting for it if the pool is empty.
+
+    Args:
+      timeout: None or float. Maximum number of seconds to wait.
+
+    Returns:
+      Scene.
+
+    Raises:
+      queue.Empty: If no scene is available after timeout seconds.
+      Exception: Any error raised by init_sprites or the renderers.
+    """
+    item = self._scenes.get(timeout=timeout)
+    if isinstance(item, _Failure):
+      # The worker has stopped, so later calls raise the same error.
+      self._scenes.put(item)
+      six.reraise(*item.exc_info)
+    return item
+
+  def __call__(self, rng=None):
+    """Sprites of the next scene, so that the pool can act as init_sprites."""
+    del rng
+    return self.get().sprites
+
+  def close(self):
+    """Stop the worker."""
+    if self._worker is not None:
+      self._stop.set()
+      self._worker.join()
+      self._worker = None
@@ -21,8 +21,6 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
-from matplotlib import path as mpl_path
-from matplotlib import transforms as mpl_transforms
 import numpy as np
 from spriteworld import constants
 
@@ -43,6 +41,100 @@ FACTOR_NAMES = (
 _MAX_TRIES = int(1e6)
 
 
+def sprites_to_array(sprites, num_rows=None, factor_names=FACTOR_NAMES,
+                     dtype=np.float32):
+  """Convert sprites to a factor matrix.
+
+  Shapes are encoded by their constants.ShapeType value.
+
+  Args:
+    sprites: Iterable of Sprite instances.
+    num_rows: None or int. If not None, the matrix is padded with NaN rows to
+      num_rows rows.
+    factor_names: Iterable of strings. Factors forming the matrix columns.
+    dtype: Numpy float dtype of the matrix.
+
+  Returns:
+    Array of shape [num_rows or len(sprites), len(factor_names)].
+  """
+  sprites = list(sprites)
+  if num_rows is None:
+    num_rows = len(sprites)
+  elif len(sprites) > num_rows:
+    raise ValueError('Cannot fit {} sprites in a factor matrix with {} '
+                     'rows.'.format(len(sprites), num_rows))
+  array = np.full((num_rows, len(factor_names)), np.nan, dtype=dtype)
+  for i, s in enumerate(sprites):
+    for j, name in enumerate(factor_names):
+      value = getattr(s, name)
+      if name == 'shape':
+        value = constants.ShapeType[value].value
+      array[i, j] = value
+  return array
+
+
+def sprites_to_columns(sprites, factor_names=FACTOR_NAMES):
+  """Convert sprites to a dictionary of factor columns.
+
+  The result can be passed to the contains_batch() method of factor
+  distributions.
+
+  Args:
+    sprites: Iterable of Sprite instances.
+    factor_names: Iterable of strings. Factors to include.
+
+  Returns:
+    Dictionary from factor name to array of length len(sprites).
+  """
+  sprites = list(sprites)
+  return {
+      name: np.array([getattr(s, name) for s in sprites])
+      for name in factor_names
+  }
+
+
+def array_to_sprites(array, factor_names=FACTOR_NAMES):
+  """Convert a factor matrix, as made by sprites_to_array(), to sprites.
+
+  Rows of NaNs (i.e. padding) are skipped. Integral color components are
+  converted back to ints, since renderers without a color map expect integer
+  RGB values.
+
+  Args:
+    array: Array of shape [num_rows, len(factor_names)].
+    factor_names: Iterable of strings. Factors of the matrix columns.
+
+  Returns:
+    List of Sprite instances.
+  """
+  sprites = []
+  for row in np.asarray(array):
+    if np.all(np.isnan(row)):
+      continue
+    factors = {}
+    for name, value in zip(factor_names, row):
+      if name == 'shape':
+        value = constants.ShapeType(int(value)).name
+      elif name in ('c0', 'c1', 'c2') and float(value).is_integer():
+        value = int(value)
+      else:
+        value = float(value)
+      factors[name] = value
+    sprites.append(Sprite(**factors))
+  return sprites
+
+
+def _matplotlib():
+  """Modules matplotlib.path and matplotlib.transforms.
+
+  matplotlib is slow to import, so it is only imported when the first sprite is
+  made rather than with this module.
+  """
+  from matplotlib import path  # pylint: disable=g-import-not-at-top
+  from matplotlib import transforms  # pylint: disable=g-import-not-at-top
+  return path, transforms
+
+
 class Sprite(object):
   """Sprite class.
   Sprites are simple shapes parameterized by a few factors (position, shape,
@@ -91,6 +183,7 @@ class Sprite(object):
     self._reset_centered_path()
 
   def _reset_centered_path(self):
+    mpl_path, mpl_transforms = _matplotlib()
     path = mpl_path.Path(constants.SHAPES[self._shape])
     scale_rotate = (
         mpl_transforms.Affine2D().scale(self._scale) +
@@ -111,12 +204,13 @@ class Sprite(object):
     """Check if the point is contained in the Sprite."""
     return self._centered_path.contains_point(point - self.position)
 
-  def sample_contained_position(self):
+  def sample_contained_position(self, rng=None):
     """Sample random position uniformly within sprite."""
+    rng = np.random if rng is None else rng
     low = np.min(self._centered_path.vertices, axis=0)
     high = np.max(self._centered_path.vertices, axis=0)
     for _ in range(_MAX_TRIES):
-      sample = self._position + np.random.uniform(low, high)
+      sample = self._position + rng.uniform(low, high)
       if self.contains_point(sample):
         return sample
     raise ValueError('max_tries exceeded. There is almost surely an error in '
@@ -125,6 +219,7 @@ class Sprite(object):
   @property
   def vertices(self):
     """Numpy array of vertices of the shape."""
+    _, mpl_transforms = _matplotlib()
     transform = mpl_transforms.Affine2D().translate(*self._position)
     path = transform.transform_path(self._centered_path)
     return path.vertices
@@ -157,6 +252,7 @@ class Sprite(object):
 
   @angle.setter
   def angle(self, a):
+    _, mpl_transforms = _matplotlib()
     rotate = mpl_transforms.Affine2D().rotate_deg(a - self._angle)
     self._centered_path = rotate.transform_path(self._centered_path)
     self._angle = a
@@ -167,6 +263,7 @@ class Sprite(object):
 
   @scale.setter
   def scale(self, s):
+    _, mpl_transforms = _matplotlib()
     rescale = mpl_transforms.Affine2D().scale(s - self._scale)
     self._centered_path = rescale.transform_path(self._centered_path)
     self._scale = s
@@ -13,42 +13,185 @@
 # limitations under the License.
 # ============================================================================
 # python2 python3
-"""Generators for producing lists of sprites based on factor distributions."""
+"""Generators for producing lists of sprites based on factor distributions.
+
+Each generator also has a batch counterpart, e.g. generate_sprites_batch() for
+generate_sprites(), producing many scenes at once as a SceneBatch of padded
+factor arrays instead of one list of sprites per call.
+"""
 
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import inspect
 import itertools
 import numpy as np
-import torch
+import six
+from spriteworld import constants
+from spriteworld import factor_distributions
 from spriteworld import sprite
-from scipy.stats import norm
-import scipy
 
-def generate_sprites(factor_dist, num_sprites=1):
+# Distance from the center to the farthest vertex of each shape at unit scale.
+_SHAPE_RADII = {
+    name: float(np.max(np.linalg.norm(vertices, axis=1)))
+    for name, vertices in six.iteritems(constants.SHAPES)
+}
+
+# Random sequential placement of equal discs jams at this covered fraction.
+_JAMMING_DENSITY = 0.547
+
+# Number of candidate specs sampled at once when resampling colliding sprites.
+_CANDIDATE_BLOCK = 32
+
+
+def _get_rng(rng=None):
+  """Get random number generator, defaulting to np.random."""
+  return np.random if rng is None else rng
+
+
+def accepts_rng(fn):
+  """Whether fn accepts a keyword argument `rng`."""
+  try:
+    params = inspect.signature(fn).parameters
+  except (TypeError, ValueError):
+    return False
+  return 'rng' in params or any(
+      p.kind == inspect.Parameter.VAR_KEYWORD for p in params.values())
+
+
+def with_rng(fn):
+  """Wrap fn to take a random number generator, passed on only if accepted.
+
+  This allows sprite generators, num_sprites callables and action spaces to
+  draw from an explicit random number generator, while plain callables such as
+  `lambda: [sprite.Sprite()]` keep working. The signature of fn is inspected
+  once here, so wrap callables where they are stored rather than where they
+  are called.
+
+  Args:
+    fn: Callable.
+
+  Returns:
+    Callable taking rng followed by the arguments of fn, and calling fn with
+      them, also passing rng=rng if fn accepts it.
+  """
+  if accepts_rng(fn):
+    return lambda rng, *args, **kwargs: fn(*args, rng=rng, **kwargs)
+  return lambda rng, *args, **kwargs: fn(*args, **kwargs)
+
+
+def call_with_rng(fn, rng, *args, **kwargs):
+  """Call fn(*args, **kwargs), also passing rng=rng if fn accepts it.
+
+  This inspects the signature of fn on every call, see with_rng() for
+  callables called repeatedly.
+
+  Args:
+    fn: Callable.
+    rng: Random number generator to pass as keyword argument `rng`.
+    *args: Positional arguments for fn.
+    **kwargs: Keyword arguments for fn.
+
+  Returns:
+    Output of fn.
+  """
+  return with_rng(fn)(rng, *args, **kwargs)
+
+
+class GaussianCopula(object):
+  """Gaussian copula producing correlated uniforms for factor distributions.
+
+  Samples are standard normal vectors with the given correlation matrix,
+  mapped to [0, 1] by the standard normal CDF. They are the `uniform` argument
+  consumed by non-identifiable Beta distributions.
+  """
+
+  def __init__(self, correlation=None):
+    """Construct Gaussian copula.
+
+    Args:
+      correlation: None or symmetric positive-definite array of shape
+        [num_factors, num_factors] with unit diagonal. Defaults to 4 factors
+        with pairwise correlation 0.7.
+    """
+    if correlation is None:
+      correlation = 0.3 * np.eye(4) + 0.7
+    correlation = np.array(correlation, dtype=np.float64)
+    if (correlation.ndim != 2 or
+        correlation.shape[0] != correlation.shape[1] or
+        not np.allclose(correlation, correlation.T) or
+        not np.allclose(np.diag(correlation), 1.)):
+      raise ValueError('Copula correlation must be a symmetric matrix with '
+                       'unit diagonal, but is {}.'.format(correlation))
+    try:
+      self._cholesky = np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+      raise ValueError('Copula correlation {} is not positive-definite.'.format(
+          correlation))
+    self._correlation = correlation
+    self._correlation.setflags(write=False)
+
+  @property
+  def correlation(self):
+    return self._correlation
+
+  @property
+  def num_factors(self):
+    return self._correlation.shape[0]
+
+  def sample(self, num_samples=1, rng=None):
+    """Sample copula uniforms.
+
+    Args:
+      num_samples: Int. Number of samples, e.g. one per scene.
+      rng: Random number generator, defaulting to np.random.
+
+    Returns:
+      Array of shape [num_samples, num_factors] with values in [0, 1].
+    """
+    # scipy is slow to import, so it is only imported when needed.
+    from scipy import special  # pylint: disable=g-import-not-at-top
+    rng = _get_rng(rng)
+    gaussian = rng.normal(size=(num_samples, self.num_factors))
+    return special.ndtr(np.dot(gaussian, self._cholesky.T))
+
+
+def generate_sprites(factor_dist, num_sprites=1, copula=None):
   """Create callable that samples sprites from a factor distribution.
   Args:
     factor_dist: The factor distribution from which to sample. Should be an
       instance of factor_distributions.AbstractDistribution.
     num_sprites: Int or callable returning int. Number of sprites to generate
-      per call.
+      per call. If the callable accepts an `rng` argument, the random number
+      generator of the sprite generator is passed to it.
+    copula: None or GaussianCopula. Copula sampling the uniforms shared by the
+      sprites of a scene, used by non-identifiable Beta distributions. Defaults
+      to GaussianCopula().
   Returns:
-    _generate: Callable that returns a list of Sprites.
+    _generate: Callable that returns a list of Sprites. Takes an optional
+      random number generator `rng`, defaulting to np.random.
   """
+  # Compiled once here, so later changes to factor_dist are not picked up.
+  factor_dist = factor_distributions.compile_distribution(factor_dist)
+  if copula is None:
+    copula = GaussianCopula()
+  sample_num_sprites = with_rng(num_sprites) if callable(num_sprites) else None
 
-  def _generate():
-    mean = [0, 0, 0, 0]
-    cov = [[1., 0.7, 0.7, 0.7], 
-    [0.7, 1., 0.7, 0.7],
-    [0.7, 0.7, 1., 0.7], 
-    [0.7, 0.7, 0.7, 1.]] 
-    gaussian = np.random.multivariate_normal(mean, cov, 1)
-    uniform = norm.cdf(gaussian)
-    n = num_sprites() if callable(num_sprites) else num_sprites
-    sprites = [sprite.Sprite(**factor_dist.sample(uniform,n=i)) for i in range(n)]
-
-    return sprites
+  def _generate(rng=None):
+    rng = _get_rng(rng)
+    uniform = copula.sample(rng=rng)
+    if sample_num_sprites is not None:
+      n = sample_num_sprites(rng)
+    else:
+      n = num_sprites
+    # All sprites of a scene share the same copula uniforms.
+    columns = factor_dist.sample_batch(
+        n, rng=rng, uniform=np.repeat(uniform, n, axis=0))
+    return [
+        sprite.Sprite(**{k: v[i] for k, v in six.iteritems(columns)})
+        for i in range(n)
+    ]
 
   return _generate
 
@@ -64,12 +207,15 @@ def chain_generators(*sprite_generators):
   Args:
     *sprite_generators: Callable sprite generators.
   Returns:
-    _generate: Callable returning a list of sprites.
+    _generate: Callable returning a list of sprites. Takes an optional random
+      number generator `rng`, which is passed on to the sprite_generators.
   """
 
-  def _generate():
+  sprite_generators = [with_rng(generator) for generator in sprite_generators]
+
+  def _generate(rng=None):
     return list(
-        itertools.chain(*[generator() for generator in sprite_generators]))
+        itertools.chain(*[generator(rng) for generator in sprite_generators]))
 
   return _generate
 
@@ -87,13 +233,17 @@ def sample_generator(sprite_generators, p=None):
     p: Probabilities associated with each generator. If None, assumes uniform
       distribution.
   Returns:
-    _generate: Callable sprite generator.
+    _generate: Callable sprite generator. Takes an optional random number
+      generator `rng`, defaulting to np.random.
   """
 
-  def _generate():
-    sample_index = np.random.choice(len(sprite_generators), p=p)
+  sprite_generators = [with_rng(generator) for generator in sprite_generators]
+
+  def _generate(rng=None):
+    rng = _get_rng(rng)
+    sample_index = rng.choice(len(sprite_generators), p=p)
     sampled_generator = sprite_generators[sample_index]
-    return sampled_generator()
+    return sampled_generator(rng)
 
   return _generate
 
@@ -112,13 +262,445 @@ def shuffle(sprite_generator):
   Args:
     sprite_generator: Callable return a list of sprites.
   Returns:
-    _generate: Callable sprite generator.
+    _generate: Callable sprite generator. Takes an optional random number
+      generator `rng`, defaulting to np.random.
   """
 
-  def _generate():
-    sprites = sprite_generator()
+  sprite_generator = with_rng(sprite_generator)
+
+  def _generate(rng=None):
+    rng = _get_rng(rng)
+    sprites = sprite_generator(rng)
     order = np.arange(len(sprites))
-    np.random.shuffle(order)
+    rng.shuffle(order)
     return [sprites[i] for i in order]
 
   return _generate
+
+
+def bounding_radius(shape, scale):
+  """Radius of the smallest centered disc containing a sprite, at any angle."""
+  return scale * _SHAPE_RADII[shape]
+
+
+class _SpatialHash(object):
+  """Uniform grid of cells listing the discs that overlap them."""
+
+  def __init__(self, cell_size):
+    self._cell_size = cell_size
+    self._cells = {}
+
+  def _cells_of(self, x, y, radius):
+    low_x, low_y = np.floor((np.array([x, y]) - radius) / self._cell_size)
+    high_x, high_y = np.floor((np.array([x, y]) + radius) / self._cell_size)
+    return itertools.product(range(int(low_x), int(high_x) + 1),
+                             range(int(low_y), int(high_y) + 1))
+
+  def insert(self, x, y, radius):
+    for cell in self._cells_of(x, y, radius):
+      self._cells.setdefault(cell, []).append((x, y, radius))
+
+  def collides(self, x, y, radius, min_gap=0.):
+    """Whether the disc is closer than min_gap to any inserted disc."""
+    for cell in self._cells_of(x, y, radius + min_gap):
+      for other_x, other_y, other_radius in self._cells.get(cell, ()):
+        distance = np.hypot(x - other_x, y - other_y)
+        if distance < radius + other_radius + min_gap:
+          return True
+    return False
+
+
+class NonOverlappingGenerator(object):
+  """Sprite generator placing sprites without overlaps.
+
+  Like generate_sprites(), but sprites are placed one at a time and a sprite
+  colliding with those already placed is resampled on its own, instead of
+  regenerating the whole scene. Sprites are approximated by their bounding
+  discs, see bounding_radius(), which are kept in a spatial hash so that each
+  collision check only looks at nearby sprites.
+
+  Acceptance statistics over all calls are available in self.stats.
+  """
+
+  def __init__(self,
+               factor_dist,
+               num_sprites=1,
+               min_gap=0.,
+               max_tries=1000,
+               max_density=_JAMMING_DENSITY,
+               copula=None):
+    """Construct non-overlapping sprite generator.
+
+    Args:
+      factor_dist: The factor distribution from which to sample. Should be an
+        instance of factor_distributions.AbstractDistribution. Factors missing
+        from it take the default value of sprite.Sprite.
+      num_sprites: Int or callable returning int. Number of sprites to generate
+        per call, as in generate_sprites().
+      min_gap: Float. Minimum distance between the bounding discs of sprites.
+      max_tries: Int. Maximum number of samples per sprite before giving up.
+      max_density: None or float. If the bounding discs of the initial samples
+        of a scene cover more than this fraction of the unit frame, the scene
+        is deemed infeasible and an error is raised at once. Defaults to the
+        jamming density of random sequential placement of equal discs.
+      copula: None or GaussianCopula, as in generate_sprites(). Resampled
+        sprites get fresh copula uniforms on every try.
+    """
+    self._factor_dist = factor_distributions.compile_distribution(factor_dist)
+    self._num_sprites = num_sprites
+    self._sample_num_sprites = (
+        with_rng(num_sprites) if callable(num_sprites) else None)
+    self._min_gap = min_gap
+    self._max_tries = max_tries
+    self._max_density = max_density
+    self._copula = GaussianCopula() if copula is None else copula
+    self._default = sprite.Sprite()
+    self._num_scenes = 0
+    self._num_placed = 0
+    self._num_proposed = 0
+
+  @property
+  def stats(self):
+    """Dictionary of acceptance statistics over all generated scenes."""
+    return {
+        'num_scenes': self._num_scenes,
+        'num_sprites': self._num_placed,
+        'num_proposals': self._num_proposed,
+        'acceptance_rate': self._num_placed / max(self._num_proposed, 1),
+    }
+
+  def _discs(self, columns, n):
+    """Centers and bounding radii of n specs given as columns."""
+    def _column(key):
+      if key in columns:
+        return np.asarray(columns[key])
+      return np.full(n, getattr(self._default, key))
+
+    radii = np.array([
+        bounding_radius(shape, scale)
+        for shape, scale in zip(_column('shape'), _column('scale'))
+    ])
+    return _column('x'), _column('y'), radii
+
+  def __call__(self, rng=None):
+    rng = _get_rng(rng)
+    uniform = self._copula.sample(rng=rng)
+    if self._sample_num_sprites is not None:
+      n = self._sample_num_sprites(rng)
+    else:
+      n = self._num_sprites
+    self._num_scenes += 1
+    if n == 0:
+      return []
+
+    columns = self._factor_dist.sample_batch(
+        n, rng=rng, uniform=np.repeat(uniform, n, axis=0))
+    x, y, radii = self._discs(columns, n)
+    self._num_proposed += n
+    density = np.sum(np.pi * (radii + self._min_gap / 2)**2)
+    if self._max_density is not None and density > self._max_density:
+      raise ValueError(
+          'Cannot place {} non-overlapping sprites: their bounding discs '
+          'cover {:.2f} of the frame, more than max_density {}.'.format(
+              n, density, self._max_density))
+
+    grid = _SpatialHash(cell_size=2 * max(np.max(radii), 1e-3))
+    block_index = _CANDIDATE_BLOCK
+    sprites = []
+    for i in range(n):
+      spec = {k: v[i] for k, v in six.iteritems(columns)}
+      position = (x[i], y[i], radii[i])
+      tries = 1
+      while grid.collides(*position, min_gap=self._min_gap):
+        if tries >= self._max_tries:
+          raise ValueError(
+              'Could not place sprite {} of {} without overlap in {} tries. '
+              'Use fewer or smaller sprites, or a smaller min_gap.'.format(
+                  i + 1, n, self._max_tries))
+        # Resample this sprite only, from a block of candidates. Each
+        # candidate gets fresh copula uniforms, otherwise factors computed
+        # from them, e.g. non-identifiable Beta positions, would not change.
+        if block_index == _CANDIDATE_BLOCK:
+          block = self._factor_dist.sample_batch(
+              _CANDIDATE_BLOCK, rng=rng,
+              uniform=self._copula.sample(_CANDIDATE_BLOCK, rng=rng))
+          block_discs = self._discs(block, _CANDIDATE_BLOCK)
+          block_index = 0
+        spec = {k: v[block_index] for k, v in six.iteritems(block)}
+        position = tuple(d[block_index] for d in block_discs)
+        block_index += 1
+        tries += 1
+        self._num_proposed += 1
+      grid.insert(*position)
+      sprites.append(sprite.Sprite(**spec))
+    self._num_placed += n
+    return sprites
+
+
+class SceneBatch(object):
+  """Batch of scenes as padded struct-of-arrays factors.
+
+  Sprite i of scene b has factors {k: columns[k][b, i]} for i < num_sprites[b].
+  Entries past the sprite count of a scene are padding with unspecified values.
+  As in the sprite lists of the unbatched generators, sprites are ordered back
+  to front.
+  """
+
+  def __init__(self, columns, num_sprites):
+    """Construct scene batch.
+
+    Args:
+      columns: Dictionary from factor names to arrays of shape
+        [batch_size, max_sprites].
+      num_sprites: Int array of shape [batch_size], number of sprites of each
+        scene.
+    """
+    self._columns = columns
+    self._num_sprites = np.asarray(num_sprites, dtype=np.int64)
+
+  @property
+  def columns(self):
+    return self._columns
+
+  @property
+  def num_sprites(self):
+    return self._num_sprites
+
+  @property
+  def batch_size(self):
+    return len(self._num_sprites)
+
+  @property
+  def max_sprites(self):
+    if not self._columns:
+      return int(np.max(self._num_sprites, initial=0))
+    return next(iter(self._columns.values())).shape[1]
+
+  def mask(self):
+    """Bool array of shape [batch_size, max_sprites], True for sprites."""
+    return np.arange(self.max_sprites) < self._num_sprites[:, None]
+
+  def to_array(self, factor_names=sprite.FACTOR_NAMES, dtype=np.float32):
+    """Factors as an array like those of sprite.sprites_to_array().
+
+    Factors missing from the batch take the default value of sprite.Sprite.
+
+    Args:
+      factor_names: Iterable of strings. Factors forming the last axis.
+      dtype: Numpy float dtype of the array.
+
+    Returns:
+      Array of shape [batch_size, max_sprites, len(factor_names)], padded with
+        NaNs.
+    """
+    array = np.full(
+        (self.batch_size, self.max_sprites, len(factor_names)), np.nan,
+        dtype=dtype)
+    mask = self.mask()
+    default = sprite.Sprite()
+    for j, name in enumerate(factor_names):
+      if name in self._columns:
+        values = self._columns[name][mask]
+      else:
+        values = np.full(np.sum(mask), getattr(default, name))
+      if name == 'shape':
+        names, inverse = np.unique(values, return_inverse=True)
+        codes = np.array([constants.ShapeType[n].value for n in names])
+        values = codes[inverse]
+      array[mask, j] = values
+    return array
+
+  def scene(self, index):
+    """List of the sprites of scene index, as made by generate_sprites()."""
+    return [
+        sprite.Sprite(**{k: v[index, i] for k, v in six.iteritems(
+            self._columns)}) for i in range(self._num_sprites[index])
+    ]
+
+  def scenes(self):
+    """List of the sprite lists of all scenes."""
+    return [self.scene(b) for b in range(self.batch_size)]
+
+
+def _empty_batch_columns(batches, batch_size, max_sprites):
+  """Padding-filled columns for the union of the factors of batches."""
+  default = sprite.Sprite()
+  keys = set().union(*[b.columns.keys() for b in batches])
+  columns = {}
+  for k in keys:
+    # Factors missing from some batches take the default value of Sprite.
+    dtypes = [b.columns[k].dtype for b in batches if k in b.columns]
+    if any(k not in b.columns for b in batches):
+      dtypes.append(np.asarray(getattr(default, k)).dtype)
+    columns[k] = np.zeros((batch_size, max_sprites), np.result_type(*dtypes))
+  return columns
+
+
+def _copy_sprites(source, target, scenes, offsets):
+  """Copy the sprites of batch source into the target columns.
+
+  Args:
+    source: SceneBatch.
+    target: Dictionary of columns of shape [batch_size, max_sprites].
+    scenes: Int array of shape [source.batch_size], target scene of each source
+      scene.
+    offsets: Int array of shape [source.batch_size], target slot of the first
+      sprite of each source scene.
+  """
+  scene, slot = np.nonzero(source.mask())
+  target_scene = scenes[scene]
+  target_slot = offsets[scene] + slot
+  default = sprite.Sprite()
+  for k, column in six.iteritems(target):
+    if k in source.columns:
+      column[target_scene, target_slot] = source.columns[k][scene, slot]
+    else:
+      column[target_scene, target_slot] = getattr(default, k)
+
+
+def generate_sprites_batch(factor_dist, num_sprites=1, copula=None,
+                           max_sprites=None):
+  """Create callable that samples batches of scenes from a factor distribution.
+
+  Batch counterpart of generate_sprites(). All sprites of all scenes are
+  sampled with a single call to factor_dist.sample_batch().
+
+  Args:
+    factor_dist: The factor distribution from which to sample. Should be an
+      instance of factor_distributions.AbstractDistribution.
+    num_sprites: Int or callable returning int. Number of sprites per scene. A
+      callable is called once per scene, as in generate_sprites().
+    copula: None or GaussianCopula. Copula sampling the uniforms shared by the
+      sprites of a scene. Defaults to GaussianCopula().
+    max_sprites: None or int. Padded size of the batch. If None, the largest
+      number of sprites in the batch.
+
+  Returns:
+    _generate: Callable taking a batch size and an optional random number
+      generator `rng`, defaulting to np.random, and returning a SceneBatch.
+  """
+  factor_dist = factor_distributions.compile_distribution(factor_dist)
+  if copula is None:
+    copula = GaussianCopula()
+  sample_num_sprites = with_rng(num_sprites) if callable(num_sprites) else None
+
+  def _generate(batch_size, rng=None):
+    rng = _get_rng(rng)
+    uniform = copula.sample(batch_size, rng=rng)
+    if sample_num_sprites is not None:
+      counts = np.array([sample_num_sprites(rng) for _ in range(batch_size)],
+                        dtype=np.int64)
+    else:
+      counts = np.full(batch_size, num_sprites, dtype=np.int64)
+    size = int(np.max(counts, initial=0))
+    if max_sprites is not None:
+      if size > max_sprites:
+        raise ValueError('Cannot fit {} sprites in a batch with max_sprites '
+                         '{}.'.format(size, max_sprites))
+      size = max_sprites
+    values = factor_dist.sample_batch(
+        int(np.sum(counts)), rng=rng,
+        uniform=np.repeat(uniform, counts, axis=0))
+    mask = np.arange(size) < counts[:, None]
+    columns = {}
+    for k, v in six.iteritems(values):
+      columns[k] = np.zeros((batch_size, size), dtype=v.dtype)
+      # Boolean mask assignment fills scenes in order, row-major.
+      columns[k][mask] = v
+    return SceneBatch(columns, counts)
+
+  return _generate
+
+
+def chain_generators_batch(*batch_generators):
+  """Batch counterpart of chain_generators().
+
+  Args:
+    *batch_generators: Callable batch generators, e.g. made by
+      generate_sprites_batch().
+
+  Returns:
+    _generate: Callable taking a batch size and an optional random number
+      generator `rng`, returning a SceneBatch in which the sprites of each
+      scene are those of batch_generators concatenated in order.
+  """
+
+  def _generate(batch_size, rng=None):
+    batches = [g(batch_size, rng=rng) for g in batch_generators]
+    counts = np.zeros(batch_size, dtype=np.int64)
+    for b in batches:
+      counts += b.num_sprites
+    columns = _empty_batch_columns(
+        batches, batch_size, int(np.max(counts, initial=0)))
+    scenes = np.arange(batch_size)
+    offsets = np.zeros(batch_size, dtype=np.int64)
+    for b in batches:
+      _copy_sprites(b, columns, scenes, offsets)
+      offsets += b.num_sprites
+    return SceneBatch(columns, counts)
+
+  return _generate
+
+
+def sample_generator_batch(batch_generators, p=None):
+  """Batch counterpart of sample_generator().
+
+  Scenes are assigned to generators at once, and each generator is called
+  once with the number of scenes assigned to it.
+
+  Args:
+    batch_generators: Iterable of callable batch generators.
+    p: Probabilities associated with each generator. If None, assumes uniform
+      distribution.
+
+  Returns:
+    _generate: Callable taking a batch size and an optional random number
+      generator `rng`, defaulting to np.random, and returning a SceneBatch.
+  """
+  batch_generators = list(batch_generators)
+
+  def _generate(batch_size, rng=None):
+    rng = _get_rng(rng)
+    assignments = rng.choice(len(batch_generators), size=batch_size, p=p)
+    scenes = [np.flatnonzero(assignments == i)
+              for i in range(len(batch_generators))]
+    batches = [g(len(s), rng=rng) for g, s in zip(batch_generators, scenes)]
+    counts = np.zeros(batch_size, dtype=np.int64)
+    for b, s in zip(batches, scenes):
+      counts[s] = b.num_sprites
+    columns = _empty_batch_columns(
+        batches, batch_size, int(np.max(counts, initial=0)))
+    for b, s in zip(batches, scenes):
+      _copy_sprites(b, columns, s, np.zeros(len(s), dtype=np.int64))
+    return SceneBatch(columns, counts)
+
+  return _generate
+
+
+def shuffle_batch(batch_generator):
+  """Batch counterpart of shuffle().
+
+  The sprites of every scene are permuted at once, by sorting random keys with
+  the padding sorted last.
+
+  Args:
+    batch_generator: Callable batch generator.
+
+  Returns:
+    _generate: Callable taking a batch size and an optional random number
+      generator `rng`, defaulting to np.random, and returning a SceneBatch.
+  """
+
+  def _generate(batch_size, rng=None):
+    rng = _get_rng(rng)
+    batch = batch_generator(batch_size, rng=rng)
+    keys = rng.uniform(size=(batch.batch_size, batch.max_sprites))
+    keys[~batch.mask()] = np.inf
+    order = np.argsort(keys, axis=1)
+    columns = {
+        k: np.take_along_axis(v, order, axis=1)
+        for k, v in six.iteritems(batch.columns)
+    }
+    return SceneBatch(columns, batch.num_sprites)
+
+  return _generate
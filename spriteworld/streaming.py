@@ -0,0 +1,114 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Streaming PyTorch dataset generating Spriteworld scenes on the fly."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import torch
+from torch.utils import data
+from spriteworld import datasets
+from spriteworld import sprite as sprite_lib
+from spriteworld import sprite_generators
+
+
+class SceneStream(data.IterableDataset):
+  """Infinite stream of batches of scenes rendered from a task config.
+
+  Scenes are sampled from the config's `init_sprites` and rendered inside each
+  DataLoader worker, so no pregeneration step is needed. Every batch is a dict
+  of fixed-shape tensors:
+    * 'image': uint8 tensor of shape [batch_size, height, width, 3].
+    * 'masks': bool tensor of shape [batch_size, max_sprites, height, width].
+    * 'factors': float32 tensor of shape [batch_size, max_sprites, num_factors],
+        padded with NaN rows, see sprite.sprites_to_array().
+    * 'num_sprites': int32 tensor of shape [batch_size].
+
+  The stream is already batched, so use it with DataLoader(batch_size=None).
+  Each worker draws from its own np.random.Generator seeded with (seed,
+  worker_id), so workers never produce duplicate streams.
+  """
+
+  def __init__(self,
+               config_name,
+               mode='train',
+               batch_size=32,
+               max_sprites=8,
+               renderer_name='image',
+               seed=None,
+               num_batches=None):
+    """Construct scene stream.
+
+    Args:
+      config_name: String. Module name of the task config providing
+        'init_sprites' and 'renderers'. The config is built lazily in each
+        worker, so it does not need to be picklable.
+      mode: String. Mode passed to the config get_config().
+      batch_size: Int. Number of scenes per batch.
+      max_sprites: Int. Maximum number of sprites per scene.
+      renderer_name: String. Key of the config renderer producing the images.
+      seed: None or int. Seed of the stream. If None, the base seed of the
+        DataLoader worker (or of torch in the main process) is used, which
+        changes every epoch.
+      num_batches: None or int. Number of batches per worker. If None, the
+        stream is infinite.
+    """
+    super(SceneStream, self).__init__()
+    self._config_name = config_name
+    self._mode = mode
+    self._batch_size = batch_size
+    self._max_sprites = max_sprites
+    self._renderer_name = renderer_name
+    self._seed = seed
+    self._num_batches = num_batches
+
+  def _make_rng(self):
+    worker_info = data.get_worker_info()
+    worker_id = 0 if worker_info is None else worker_info.id
+    if self._seed is not None:
+      return np.random.default_rng([self._seed, worker_id])
+    if worker_info is None:
+      return np.random.default_rng(torch.initial_seed())
+    # The worker seed already differs between workers and epochs.
+    return np.random.default_rng(worker_info.seed)
+
+  def __iter__(self):
+    config = datasets.load_config(self._config_name, self._mode)
+    init_sprites = sprite_generators.with_rng(config['init_sprites'])
+    renderer = config['renderers'][self._renderer_name]
+    rng = self._make_rng()
+
+    num_batches = 0
+    while self._num_batches is None or num_batches < self._num_batches:
+      images, masks, factors, num_sprites = [], [], [], []
+      for _ in range(self._batch_size):
+        sprites = init_sprites(rng)
+        image, sprite_masks = datasets.render_scene(
+            renderer, sprites, self._max_sprites)
+        images.append(image)
+        masks.append(sprite_masks)
+        factors.append(
+            sprite_lib.sprites_to_array(sprites, num_rows=self._max_sprites))
+        num_sprites.append(len(sprites))
+      yield {
+          'image': torch.from_numpy(np.stack(images)),
+          'masks': torch.from_numpy(np.stack(masks)),
+          'factors': torch.from_numpy(np.stack(factors)),
+          'num_sprites': torch.from_numpy(np.array(num_sprites, np.int32)),
+      }
+      num_batches += 1
@@ -29,7 +29,7 @@ from __future__ import print_function
 import abc
 import numpy as np
 import six
-from sklearn import metrics
+from spriteworld import sprite as sprite_lib
 
 
 @six.add_metaclass(abc.ABCMeta)
@@ -66,6 +66,21 @@ class AbstractTask(object):
         solves the task.
     """
 
+  def evaluate(self, sprites):
+    """Compute both reward and success for the given configuration of sprites.
+
+    The environment calls this once per step and caches the result, so tasks
+    whose reward and success share an expensive computation should override it
+    to perform that computation only once.
+
+    Args:
+      sprites: Iterable of sprite instances.
+
+    Returns:
+      Tuple (reward, success), as returned by self.reward() and self.success().
+    """
+    return self.reward(sprites), self.success(sprites)
+
 
 class NoReward(AbstractTask):
   """Used for environments that have no task. Reward is always 0."""
@@ -131,17 +146,17 @@ class FindGoalPosition(AbstractTask):
 
   def _filtered_sprites_rewards(self, sprites):
     """Returns list of rewards for the filtered sprites."""
-    rewards = [
-        self._single_sprite_reward(s) for s in sprites if
-        self._filter_distrib is None or self._filter_distrib.contains(s.factors)
-    ]
-    return rewards
-
-  def reward(self, sprites):
-    """Calculate total reward summed over filtered sprites."""
+    sprites = list(sprites)
+    if self._filter_distrib is not None:
+      mask = self._filter_distrib.contains_batch(
+          sprite_lib.sprites_to_columns(sprites))
+      sprites = [s for s, contained in zip(sprites, mask) if contained]
+    return [self._single_sprite_reward(s) for s in sprites]
+
+  def _reward_from_rewards(self, rewards):
+    """Calculate total reward from the list of filtered sprites rewards."""
     reward = 0.
 
-    rewards = self._filtered_sprites_rewards(sprites)
     if not rewards:  # No sprites get through the filter, so make reward NaN
       return np.nan
     dense_reward = np.sum(rewards)
@@ -154,9 +169,182 @@ class FindGoalPosition(AbstractTask):
 
     return reward
 
+  def reward(self, sprites):
+    """Calculate total reward summed over filtered sprites."""
+    return self._reward_from_rewards(self._filtered_sprites_rewards(sprites))
+
   def success(self, sprites):
     return all(np.array(self._filtered_sprites_rewards(sprites)) >= 0)
 
+  def evaluate(self, sprites):
+    rewards = self._filtered_sprites_rewards(sprites)
+    return self._reward_from_rewards(rewards), all(np.array(rewards) >= 0)
+
+
+def _davies_bouldin_from_stats(intra_dists, centroid_distances):
+  """Davies-Bouldin index from per-cluster spreads and centroid distances."""
+  if np.allclose(intra_dists, 0) or np.allclose(centroid_distances, 0):
+    return 0.0
+  centroid_distances = np.where(
+      centroid_distances == 0, np.inf, centroid_distances)
+  combined_intra_dists = intra_dists[:, None] + intra_dists[None, :]
+  return np.mean(np.max(combined_intra_dists / centroid_distances, axis=1))
+
+
+class DaviesBouldinStats(object):
+  """Per-cluster statistics of the Davies-Bouldin index, updated in place.
+
+  Keeps the members, count and coordinate sum of each cluster, hence its
+  centroid, the mean distance of its points to the centroid and the distances
+  between centroids. Moving a point, possibly to another cluster, updates the
+  counts and sums in constant time, and only the spreads and centroid
+  distances of the affected clusters are recomputed, so a move costs
+  O(size of the affected clusters + num_clusters) plus O(num_clusters**2) for
+  the score. The mean distance to a centroid has no running form, since every
+  distance changes when the centroid does; a running sum of squared norms would
+  only give the root mean square distance, which is a different index.
+  """
+
+  def __init__(self, positions, labels):
+    """Compute statistics from scratch.
+
+    Args:
+      positions: Array of shape [num_points, num_dimensions].
+      labels: Int array of shape [num_points], cluster of each point. Points
+        with negative labels belong to no cluster and are ignored.
+
+    Raises:
+      ValueError: If there are fewer than 2 clusters, or not fewer clusters
+        than clustered points.
+    """
+    self._positions = np.array(positions, dtype=np.float64)
+    labels = np.asarray(labels)
+    clustered = labels >= 0
+    clusters, inverse = np.unique(labels[clustered], return_inverse=True)
+    num_clusters = len(clusters)
+    self._num_clustered = int(np.sum(clustered))
+    if not 1 < num_clusters < self._num_clustered:
+      raise ValueError('Number of labels is {}. Valid values are 2 to '
+                       'n_samples - 1 (inclusive)'.format(num_clusters))
+    self._clusters = clusters
+    self._labels = -np.ones(len(labels), dtype=np.int64)
+    self._labels[clustered] = inverse
+    self._members = [np.flatnonzero(self._labels == k)
+                     for k in range(num_clusters)]
+    self._counts = np.array([len(m) for m in self._members])
+    self._sums = np.array(
+        [np.sum(self._positions[m], axis=0) for m in self._members])
+    self._intra_dists = np.zeros(num_clusters)
+    self._centroid_distances = np.zeros((num_clusters, num_clusters))
+    for k in range(num_clusters):
+      self._update_cluster(k)
+
+  def _update_cluster(self, k):
+    centroids = self._sums / self._counts[:, None]
+    members = self._positions[self._members[k]]
+    self._intra_dists[k] = np.mean(
+        np.linalg.norm(members - centroids[k], axis=1))
+    distances = np.linalg.norm(centroids - centroids[k], axis=1)
+    self._centroid_distances[k] = distances
+    self._centroid_distances[:, k] = distances
+
+  def _cluster_index(self, label):
+    """Index of the cluster of a label, -1 for no cluster, None if unknown."""
+    if label < 0:
+      return -1
+    k = np.searchsorted(self._clusters, label)
+    if k < len(self._clusters) and self._clusters[k] == label:
+      return int(k)
+    return None
+
+  def can_move(self, index, label):
+    """Whether point index can move to cluster label, keeping the clusters.
+
+    Args:
+      index: Int. Index of the point.
+      label: Int. Label of the new cluster of the point, negative for none.
+
+    Returns:
+      False if the move would add or empty a cluster, or leave no fewer
+        clusters than clustered points, so that the statistics must be
+        recomputed from scratch.
+    """
+    new = self._cluster_index(label)
+    old = int(self._labels[index])
+    if new is None:
+      return False
+    if new == old:
+      return True
+    if old >= 0 and self._counts[old] == 1:
+      return False
+    num_clustered = self._num_clustered + (new >= 0) - (old >= 0)
+    return len(self._clusters) < num_clustered
+
+  def move(self, index, position, label=None):
+    """Move point index to position and, if label is not None, to its cluster.
+
+    Args:
+      index: Int. Index of the point.
+      position: Array of shape [num_dimensions]. New position of the point.
+      label: None or int. Label of the new cluster of the point, negative for
+        none. If None, the point keeps its cluster.
+
+    Raises:
+      ValueError: If not self.can_move(index, label).
+    """
+    position = np.asarray(position, dtype=np.float64)
+    old = int(self._labels[index])
+    new = old
+    if label is not None:
+      if not self.can_move(index, label):
+        raise ValueError('Moving point {} to cluster {} changes the set of '
+                         'clusters.'.format(index, label))
+      new = self._cluster_index(label)
+    if old >= 0:
+      self._counts[old] -= 1
+      self._sums[old] -= self._positions[index]
+    self._positions[index] = position
+    if new >= 0:
+      self._counts[new] += 1
+      self._sums[new] += position
+    if new != old:
+      self._labels[index] = new
+      self._num_clustered += (new >= 0) - (old >= 0)
+      if old >= 0:
+        self._members[old] = self._members[old][self._members[old] != index]
+      if new >= 0:
+        self._members[new] = np.append(self._members[new], index)
+    for k in {old, new}:
+      if k >= 0:
+        self._update_cluster(k)
+
+  def score(self):
+    """Davies-Bouldin index of the current positions."""
+    return _davies_bouldin_from_stats(
+        self._intra_dists, self._centroid_distances)
+
+
+def davies_bouldin_score(positions, labels):
+  """Davies-Bouldin index of a clustering, lower is better.
+
+  Same as sklearn.metrics.davies_bouldin_score(), computed directly with numpy
+  for the handful of sprites and clusters of a scene.
+
+  Args:
+    positions: Array of shape [num_points, num_dimensions].
+    labels: Int array of shape [num_points], cluster of each point.
+
+  Returns:
+    Float. Mean over clusters of the largest ratio of the sum of the mean
+      distances of two clusters to their centroids, over the distance between
+      these centroids.
+
+  Raises:
+    ValueError: If there are fewer than 2 clusters, or not fewer clusters than
+      points.
+  """
+  return DaviesBouldinStats(positions, labels).score()
+
 
 class Clustering(AbstractTask):
   """Task for cluster by color/shape conditions."""
@@ -192,27 +380,89 @@ class Clustering(AbstractTask):
     self._terminate_bonus = terminate_bonus
     self._sparse_reward = sparse_reward
     self._reward_range = reward_range
+    # Cluster assignments only need to be recomputed when the positions
+    # determine them.
+    self._position_dependent = any(
+        k in d.keys for d in cluster_distribs for k in ('x', 'y'))
+    # Other factors the cluster assignments depend on.
+    self._label_keys = sorted(
+        set(k for d in cluster_distribs for k in d.keys) - set(['x', 'y']))
+    self._stats = None
+    self._cached_sprites = None
+    self._cached_factors = None
+    self._cached_positions = None
+    self._cached_metric = None
+
+  def _cluster_assignments(self, columns):
+    """Return index of cluster for all sprites, given their factor columns."""
+    clusters = -np.ones(len(columns['x']), dtype='int')
+    # Iterate in reverse so that sprites in several clusters get the first.
+    for c_i in reversed(range(self._num_clusters)):
+      clusters[self._cluster_distribs[c_i].contains_batch(columns)] = c_i
+    return clusters
 
-  def _cluster_assignments(self, sprites):
-    """Return index of cluster for all sprites."""
-    clusters = -np.ones(len(sprites), dtype='int')
-    for i, sprite in enumerate(sprites):
-      for c_i, distrib in enumerate(self._cluster_distribs):
-        if distrib.contains(sprite.factors):
-          clusters[i] = c_i
-          break
+  def _cluster_assignment(self, sprite):
+    """Return index of cluster of a single sprite, -1 for none."""
+    factors = sprite.factors
+    for c_i, distrib in enumerate(self._cluster_distribs):
+      if distrib.contains(factors):
+        return c_i
+    return -1
 
-    return clusters
+  def _label_factors(self, sprites):
+    return [tuple(getattr(s, k) for k in self._label_keys) for s in sprites]
+
+  def _moved_sprite(self, sprites, positions):
+    """Index of the only sprite moved since the last state, if any.
+
+    Sprites are compared by identity, since the environment moves them in
+    place, and only their positions and the factors the cluster assignments
+    depend on are read.
+
+    Returns:
+      None if the metric must be recomputed from scratch, e.g. after a reset,
+        -1 if no sprite moved, else the index of the moved sprite.
+    """
+    if (self._stats is None or len(sprites) != len(self._cached_sprites) or
+        any(s is not c for s, c in zip(sprites, self._cached_sprites)) or
+        self._label_factors(sprites) != self._cached_factors):
+      return None
+    moved = np.flatnonzero(np.any(positions != self._cached_positions, axis=1))
+    if len(moved) > 1:
+      return None
+    return moved[0] if len(moved) else -1
 
   def _compute_clustering_metric(self, sprites):
-    """Compute the different clustering metrics, higher should be better."""
-    # Get positions of sprites, and their cluster assignments
-    cluster_assignments = self._cluster_assignments(sprites)
-    positions = np.array([sprite.position for sprite in sprites])
-    # Ignore objects unassigned to any cluster
-    positions = positions[cluster_assignments >= 0]
-    cluster_assignments = cluster_assignments[cluster_assignments >= 0]
-    return 1. / metrics.davies_bouldin_score(positions, cluster_assignments)
+    """Compute the different clustering metrics, higher should be better.
+
+    The metric is cached, and when a single sprite moved since the last call,
+    e.g. after a SelectMove step, it is updated incrementally instead of being
+    recomputed from scratch.
+    """
+    sprites = list(sprites)
+    positions = np.array(
+        [s.position for s in sprites], dtype=np.float64).reshape((-1, 2))
+    moved = self._moved_sprite(sprites, positions)
+    label = None
+    if moved is not None and moved >= 0 and self._position_dependent:
+      label = self._cluster_assignment(sprites[moved])
+      if not self._stats.can_move(moved, label):
+        moved = None
+    if moved is None:
+      # Cleared first, so that an error leaves no stale statistics.
+      self._stats = None
+      columns = sprite_lib.sprites_to_columns(sprites)
+      # Objects unassigned to any cluster are ignored.
+      stats = DaviesBouldinStats(positions, self._cluster_assignments(columns))
+      self._stats = stats
+      self._cached_metric = 1. / stats.score()
+      self._cached_sprites = sprites
+      self._cached_factors = self._label_factors(sprites)
+    elif moved >= 0:
+      self._stats.move(moved, positions[moved], label)
+      self._cached_metric = 1. / self._stats.score()
+    self._cached_positions = positions
+    return self._cached_metric
 
   def reward(self, sprites):
     """Calculate reward from sprites.
@@ -225,8 +475,11 @@ class Clustering(AbstractTask):
     Returns:
       Reward, high when clustering is good.
     """
+    return self._reward_from_metric(self._compute_clustering_metric(sprites))
+
+  def _reward_from_metric(self, metric):
+    """Calculate reward from the clustering metric."""
     reward = 0.
-    metric = self._compute_clustering_metric(sprites)
 
     # Low DB index is better clustering
     dense_reward = (metric -
@@ -244,6 +497,11 @@ class Clustering(AbstractTask):
     metric = self._compute_clustering_metric(sprites)
     return metric >= self._termination_threshold
 
+  def evaluate(self, sprites):
+    metric = self._compute_clustering_metric(sprites)
+    return (self._reward_from_metric(metric),
+            metric >= self._termination_threshold)
+
 
 class MetaAggregated(AbstractTask):
   """Combines several tasks together."""
@@ -286,11 +544,18 @@ class MetaAggregated(AbstractTask):
     self._terminate_bonus = terminate_bonus
 
   def reward(self, sprites):
-    rewards = self._reward_aggregator(
-        [task.reward(sprites) for task in self._subtasks])
-    rewards += self._terminate_bonus * self.success(sprites)
-    return rewards
+    return self.evaluate(sprites)[0]
 
   def success(self, sprites):
     return self._termination_criterion(
         [task.success(sprites) for task in self._subtasks])
+
+  def evaluate(self, sprites):
+    """Aggregate reward and success, evaluating each subtask only once."""
+    evaluations = [task.evaluate(sprites) for task in self._subtasks]
+    success = self._termination_criterion(
+        [subtask_success for _, subtask_success in evaluations])
+    reward = self._reward_aggregator(
+        [subtask_reward for subtask_reward, _ in evaluations])
+    reward += self._terminate_bonus * success
+    return reward, success
@@ -0,0 +1,138 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for dataset_index.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import shutil
+import tempfile
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+from spriteworld import constants
+from spriteworld import dataset_index
+from spriteworld import datasets
+from spriteworld import factor_distributions as distribs
+from spriteworld import renderers
+from spriteworld import sprite_generators
+
+_CONFIG_NAME = __name__
+
+
+def get_config(mode):
+  """Small config used to generate test datasets."""
+  del mode
+  factors = distribs.Product([
+      distribs.Continuous('x', 0.1, 0.9),
+      distribs.Continuous('y', 0.1, 0.9),
+      distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+      distribs.Discrete('scale', [0.1, 0.2]),
+      distribs.Continuous('c0', 0., 1.),
+      distribs.Discrete('c1', [1.]),
+      distribs.Discrete('c2', [1.]),
+  ])
+  return {
+      'init_sprites':
+          sprite_generators.generate_sprites(
+              factors, num_sprites=lambda rng: rng.choice([1, 2, 3])),
+      'renderers': {
+          'image':
+              renderers.PILRenderer(
+                  image_size=(8, 8),
+                  color_to_rgb=renderers.color_maps.hsv_to_rgb),
+      },
+  }
+
+
+class DatasetIndexTest(parameterized.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    super(DatasetIndexTest, cls).setUpClass()
+    cls.directory = tempfile.mkdtemp()
+    datasets.generate(
+        cls.directory, _CONFIG_NAME, num_shards=3, shard_size=20,
+        max_sprites=3)
+    cls.num_rows = dataset_index.build_index(
+        cls.directory, max_bitmap_values=4, chunk_size=7)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls.directory)
+    super(DatasetIndexTest, cls).tearDownClass()
+
+  def _brute_force(self, predicate):
+    """Sample indices and slots of the sprites satisfying predicate."""
+    reader = datasets.DatasetReader(self.directory)
+    batch = reader.gather(np.arange(len(reader)))
+    names = reader.factor_names
+    samples, slots = [], []
+    for i in range(len(reader)):
+      for slot in range(batch['num_sprites'][i]):
+        if predicate(dict(zip(names, batch['factors'][i, slot]))):
+          samples.append(i)
+          slots.append(slot)
+    return np.array(samples, np.int64), np.array(slots, np.int64)
+
+  def testNumRows(self):
+    index = dataset_index.DatasetIndex(self.directory)
+    reader = datasets.DatasetReader(self.directory)
+    self.assertLen(index, self.num_rows)
+    self.assertEqual(
+        self.num_rows,
+        np.sum(reader.gather(np.arange(len(reader)))['num_sprites']))
+    np.testing.assert_array_equal(index.query(), np.arange(len(reader)))
+
+  @parameterized.named_parameters(
+      ('ShapeName', {'shape': 'square'},
+       lambda f: f['shape'] == constants.ShapeType.square.value),
+      ('Range', {'x': (0.2, 0.4)}, lambda f: 0.2 <= f['x'] <= 0.4),
+      ('Membership', {'shape': ['circle', 'triangle']},
+       lambda f: f['shape'] != constants.ShapeType.square.value),
+      ('Bitmaps', {'shape': ['circle', 'triangle'], 'scale': 0.2},
+       lambda f: (f['shape'] != constants.ShapeType.square.value and
+                  np.isclose(f['scale'], 0.2))),
+      ('Mixed', {'shape': 'circle', 'x': (0.5, 0.9), 'c0': (0., 0.5)},
+       lambda f: (f['shape'] == constants.ShapeType.circle.value and
+                  0.5 <= f['x'] <= 0.9 and f['c0'] <= 0.5)),
+      ('Empty', {'x': (0.95, 1.)}, lambda f: False),
+  )
+  def testQuery(self, conditions, predicate):
+    index = dataset_index.DatasetIndex(self.directory)
+    samples, slots = self._brute_force(predicate)
+    np.testing.assert_array_equal(
+        index.query(**conditions), np.unique(samples))
+    query_samples, query_slots = index.query(return_slots=True, **conditions)
+    self.assertEqual(
+        sorted(zip(query_samples, query_slots)), sorted(zip(samples, slots)))
+
+  def testUnknownFactor(self):
+    index = dataset_index.DatasetIndex(self.directory)
+    with self.assertRaises(KeyError):
+      index.query(size=1.)
+
+  def testEmptyMembership(self):
+    index = dataset_index.DatasetIndex(self.directory)
+    with self.assertRaises(ValueError):
+      index.rows(x=[])
+    with self.assertRaises(ValueError):
+      index.query(shape=set(), scale=0.2)
+
+
+if __name__ == '__main__':
+  absltest.main()
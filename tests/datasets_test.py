@@ -0,0 +1,241 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for datasets."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from absl.testing import absltest
+import mock
+import numpy as np
+
+from spriteworld import datasets
+from spriteworld import factor_distributions as distribs
+from spriteworld import renderers
+from spriteworld import sprite as sprite_lib
+from spriteworld import sprite_generators
+
+_CONFIG_NAME = __name__
+
+
+def get_config(mode):
+  """Small config used to generate test datasets."""
+  del mode
+  factors = distribs.Product([
+      distribs.Continuous('x', 0.1, 0.9),
+      distribs.Continuous('y', 0.1, 0.9),
+      distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+      distribs.Discrete('scale', [0.2]),
+      distribs.Continuous('c0', 0., 1.),
+      distribs.Discrete('c1', [1.]),
+      distribs.Discrete('c2', [1.]),
+  ])
+  return {
+      'init_sprites':
+          sprite_generators.generate_sprites(
+              factors, num_sprites=lambda rng: rng.choice([1, 2, 3])),
+      'renderers': {
+          'image':
+              renderers.PILRenderer(
+                  image_size=(16, 16),
+                  color_to_rgb=renderers.color_maps.hsv_to_rgb),
+      },
+  }
+
+
+class GenerateTest(absltest.TestCase):
+
+  def _tempdir(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    return directory
+
+  def _generate(self, directory, **kwargs):
+    return datasets.generate(
+        directory, _CONFIG_NAME, num_shards=2, shard_size=5, max_sprites=3,
+        checkpoint_every=2, **kwargs)
+
+  def _load(self, directory, shard_index):
+    return {
+        name: np.load(
+            os.path.join(datasets.shard_dir(directory, shard_index),
+                         name + '.npy')) for name in datasets.FIELDS
+    }
+
+  def _assertDatasetsEqual(self, directory_0, directory_1):
+    for shard_index in range(2):
+      shard_0 = self._load(directory_0, shard_index)
+      shard_1 = self._load(directory_1, shard_index)
+      for name in datasets.FIELDS:
+        np.testing.assert_array_equal(shard_0[name], shard_1[name])
+
+  def testContent(self):
+    directory = self._tempdir()
+    self.assertEqual(self._generate(directory), 10)
+    shard = self._load(directory, 0)
+    self.assertEqual(shard['images'].shape, (5, 16, 16, 3))
+    self.assertEqual(shard['masks'].shape, (5, 3, 16, 16))
+    self.assertEqual(shard['factors'].shape,
+                     (5, 3, len(sprite_lib.FACTOR_NAMES)))
+    for i in range(5):
+      n = shard['num_sprites'][i]
+      self.assertTrue(np.all(shard['masks'][i, :n].any(axis=(1, 2))))
+      self.assertFalse(np.any(shard['masks'][i, n:]))
+      self.assertFalse(np.any(np.isnan(shard['factors'][i, :n])))
+      self.assertTrue(np.all(np.isnan(shard['factors'][i, n:])))
+    with open(os.path.join(directory, datasets.METADATA_FILE)) as f:
+      self.assertEqual(json.load(f)['shard_size'], 5)
+
+    # Shards are seeded differently.
+    self.assertFalse(np.array_equal(
+        shard['factors'], self._load(directory, 1)['factors']))
+    # Everything was generated, so running again is a no-op.
+    self.assertEqual(self._generate(directory), 0)
+
+  def testDeterministicAcrossWorkers(self):
+    directory_0 = self._tempdir()
+    directory_1 = self._tempdir()
+    self._generate(directory_0)
+    self._generate(directory_1, num_workers=2)
+    self._assertDatasetsEqual(directory_0, directory_1)
+
+  def testResume(self):
+    reference_directory = self._tempdir()
+    self._generate(reference_directory)
+
+    directory = self._tempdir()
+    sprites_to_array = sprite_lib.sprites_to_array
+    calls = []
+
+    def _interrupted_sprites_to_array(*args, **kwargs):
+      calls.append(None)
+      if len(calls) == 4:
+        raise RuntimeError('Interrupted.')
+      return sprites_to_array(*args, **kwargs)
+
+    with mock.patch.object(datasets.sprite_lib, 'sprites_to_array',
+                           side_effect=_interrupted_sprites_to_array):
+      with self.assertRaises(RuntimeError):
+        self._generate(directory)
+    # Resume from the checkpoint after 2 samples.
+    self.assertEqual(self._generate(directory), 8)
+    self._assertDatasetsEqual(reference_directory, directory)
+
+  def testRejectsDifferentParameters(self):
+    directory = self._tempdir()
+    self._generate(directory)
+    with self.assertRaises(ValueError):
+      self._generate(directory, seed=1)
+
+
+class DatasetReaderTest(absltest.TestCase):
+
+  def setUp(self):
+    super(DatasetReaderTest, self).setUp()
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    datasets.generate(
+        self.directory, _CONFIG_NAME, num_shards=3, shard_size=4,
+        max_sprites=3)
+    self.shards = [{
+        name: np.load(
+            os.path.join(datasets.shard_dir(self.directory, i), name + '.npy'))
+        for name in datasets.FIELDS
+    } for i in range(3)]
+
+  def testGetItem(self):
+    reader = datasets.DatasetReader(self.directory)
+    self.assertLen(reader, 12)
+    sample = reader[6]
+    for name in datasets.FIELDS:
+      np.testing.assert_array_equal(sample[name], self.shards[1][name][2])
+    self.assertIsInstance(sample['images'].base, np.memmap)
+    with self.assertRaises(IndexError):
+      reader[12]  # pylint: disable=pointless-statement
+
+  def testGather(self):
+    reader = datasets.DatasetReader(self.directory)
+    indices = [11, 0, 5, 4]
+    batch = reader.gather(indices)
+    for name in datasets.FIELDS:
+      expected = np.stack([self.shards[i // 4][name][i % 4] for i in indices])
+      np.testing.assert_array_equal(batch[name], expected)
+
+    out = {'factors': np.zeros((4, 3, len(sprite_lib.FACTOR_NAMES)),
+                               dtype=np.float32)}
+    batch = reader.gather(indices, fields=('factors',), out=out)
+    self.assertIs(batch['factors'], out['factors'])
+    self.assertEqual(list(batch), ['factors'])
+
+  def testContiguous(self):
+    reader = datasets.DatasetReader(self.directory)
+    views = reader.contiguous(5, 8)
+    np.testing.assert_array_equal(views['images'], self.shards[1]['images'][1:])
+    with self.assertRaises(ValueError):
+      reader.contiguous(6, 9)
+
+  def testIncompleteShard(self):
+    progress_path = os.path.join(
+        datasets.shard_dir(self.directory, 1), datasets.PROGRESS_FILE)
+    with open(progress_path) as f:
+      progress = json.load(f)
+    progress['num_done'] = 1
+    with open(progress_path, 'w') as f:
+      json.dump(progress, f)
+    reader = datasets.DatasetReader(self.directory)
+    self.assertLen(reader, 9)
+    np.testing.assert_array_equal(reader[5]['images'],
+                                  self.shards[2]['images'][0])
+    np.testing.assert_array_equal(
+        reader.gather([4, 3])['factors'],
+        np.stack([self.shards[1]['factors'][0], self.shards[0]['factors'][3]]))
+
+  def testEmptySelection(self):
+    reader = datasets.DatasetReader(self.directory)
+    batch = reader.gather([])
+    self.assertEqual(batch['images'].shape, (0, 16, 16, 3))
+    self.assertEqual(batch['masks'].shape, (0, 3, 16, 16))
+    self.assertEqual(batch['factors'].dtype, np.float32)
+
+  def testEmptyDataset(self):
+    for i in range(3):
+      os.remove(os.path.join(
+          datasets.shard_dir(self.directory, i), datasets.PROGRESS_FILE))
+    reader = datasets.DatasetReader(self.directory)
+    self.assertEmpty(reader)
+    batch = reader.gather([])
+    for name in datasets.FIELDS:
+      self.assertEqual(batch[name].shape[1:], self.shards[0][name].shape[1:])
+      self.assertEqual(batch[name].dtype, self.shards[0][name].dtype)
+
+  def testPickle(self):
+    reader = datasets.DatasetReader(self.directory)
+    reader.gather([0, 5])
+    state = reader.__getstate__()
+    self.assertIsNone(state['_arrays'])
+    copied = pickle.loads(pickle.dumps(reader))
+    np.testing.assert_array_equal(
+        copied.gather([7])['images'], self.shards[1]['images'][3:])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -19,15 +19,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import inspect
 from absl.testing import absltest
 from dm_env import test_utils
+import mock
 import numpy as np
 from six.moves import range
 
 from spriteworld import action_spaces
 from spriteworld import environment
+from spriteworld import factor_distributions as distribs
 from spriteworld import renderers
 from spriteworld import sprite
+from spriteworld import sprite_generators
 from spriteworld import tasks
 
 
@@ -87,6 +91,153 @@ class EnvironmentTest(test_utils.EnvironmentTestMixin, absltest.TestCase):
     timestep = env.step(success_action)
     self.assertTrue(timestep.first())
 
+  def testTaskEvaluatedOncePerStep(self):
+    task = mock.Mock(wraps=tasks.NoReward())
+    env = environment.Environment(
+        task=task,
+        action_space=action_spaces.SelectMove(),
+        renderers={'success': renderers.Success()},
+        init_sprites=lambda: [sprite.Sprite(c0=255)])
+    action = np.array([0.5, 0.5, 0.5, 0.5])
+    env.reset()
+    env.step(action)
+    task.reset_mock()
+    for i in range(1, 4):
+      timestep = env.step(action)
+      self.assertFalse(timestep.observation['success'])
+      self.assertEqual(task.evaluate.call_count, i)
+      self.assertEqual(task.success.call_count, 0)
+      self.assertEqual(env.state_version, i + 2)
+
+  def testTerminationCheckedOncePerStep(self):
+    env = self.make_object_under_test()
+    env.reset()
+    with mock.patch.object(
+        sprite.Sprite, 'out_of_frame',
+        new_callable=mock.PropertyMock, return_value=False) as out_of_frame:
+      for i in range(1, 4):
+        env.step(np.array([0.5, 0.5, 0.5, 0.5]))
+        self.assertEqual(out_of_frame.call_count, i)
+
+
+class SeedingTest(absltest.TestCase):
+
+  def make_object_under_test(self, seed=None, **kwargs):
+    factors = distribs.Product([
+        distribs.Continuous('x', 0.1, 0.9),
+        distribs.Continuous('y', 0.1, 0.9),
+        distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+    ])
+    init_sprites = sprite_generators.shuffle(
+        sprite_generators.generate_sprites(factors, num_sprites=3))
+    return environment.Environment(
+        task=tasks.NoReward(),
+        action_space=action_spaces.SelectMove(noise_scale=0.1),
+        renderers={'factors': renderers.SpriteFactors()},
+        init_sprites=init_sprites,
+        seed=seed,
+        **kwargs)
+
+  def _rollout(self, env, seed=None):
+    timestep = env.reset(seed=seed)
+    factors = [timestep.observation['factors']]
+    for _ in range(3):
+      timestep = env.step(np.array([0.5, 0.5, 0.7, 0.7]))
+      factors.append(timestep.observation['factors'])
+      factors.append(env.sample_contained_position())
+    return factors
+
+  def _assertRolloutsEqual(self, rollout_0, rollout_1, equal=True):
+    self.assertEqual(equal, all(
+        np.array_equal(np.asarray(a), np.asarray(b))
+        for a, b in zip(rollout_0, rollout_1)))
+
+  def testSameSeed(self):
+    self._assertRolloutsEqual(
+        self._rollout(self.make_object_under_test(seed=3)),
+        self._rollout(self.make_object_under_test(seed=3)))
+
+  def testDifferentSeed(self):
+    self._assertRolloutsEqual(
+        self._rollout(self.make_object_under_test(seed=3)),
+        self._rollout(self.make_object_under_test(seed=4)),
+        equal=False)
+
+  def testResetSeed(self):
+    env = self.make_object_under_test()
+    self._assertRolloutsEqual(
+        self._rollout(env, seed=5), self._rollout(env, seed=5))
+
+  def testIndependentOfGlobalRNG(self):
+    env_0 = self.make_object_under_test(seed=3)
+    env_1 = self.make_object_under_test(seed=3)
+    np.random.seed(0)
+    rollout_0 = self._rollout(env_0)
+    np.random.seed(1)
+    rollout_1 = self._rollout(env_1)
+    self._assertRolloutsEqual(rollout_0, rollout_1)
+
+  def testSignaturesInspectedOnlyOnConstruction(self):
+    env = self.make_object_under_test(seed=3)
+    with mock.patch.object(
+        inspect, 'signature', wraps=inspect.signature) as signature:
+      self._rollout(env, seed=4)
+    self.assertEqual(signature.call_count, 0)
+
+
+class PrefetchTest(SeedingTest):
+
+  def make_object_under_test(self, seed=None):
+    env = super(PrefetchTest, self).make_object_under_test(
+        seed=seed, prefetch_scenes=2, prerender=('factors',))
+    self.addCleanup(env.close)
+    return env
+
+  def testPrerendered(self):
+    env = self.make_object_under_test(seed=0)
+    timestep = env.reset()
+    self.assertEmpty(timestep.observation.pending)
+    np.testing.assert_equal(
+        timestep.observation['factors'],
+        renderers.SpriteFactors().render(
+            sprites=env.state()['sprites'], global_state={}))
+
+
+class ActionRepeatTest(absltest.TestCase):
+
+  def make_object_under_test(self, task, renderer, action_repeat):
+    return environment.Environment(
+        task=task,
+        action_space=action_spaces.SelectMove(),
+        renderers={'obs': renderer},
+        init_sprites=lambda: [sprite.Sprite(x=0.1, y=0.1, x_vel=0.1, c0=255)],
+        max_episode_length=7,
+        action_repeat=action_repeat)
+
+  def testRepeatsAndRendersOnce(self):
+    renderer = mock.Mock(spec=renderers.AbstractRenderer)
+    env = self.make_object_under_test(tasks.NoReward(), renderer, 3)
+    env.reset()
+    timestep = env.step(np.array([0.5, 0.5, 0.5, 0.5]))
+    self.assertTrue(timestep.mid())
+    self.assertAlmostEqual(env.state()['sprites'][0].x, 0.4)
+    timestep.observation['obs']
+    self.assertEqual(renderer.render.call_count, 1)
+
+  def testEarlyTermination(self):
+    task = tasks.FindGoalPosition(
+        goal_position=(0.3, 0.1), terminate_distance=0.01)
+    env = self.make_object_under_test(task, renderers.Success(), 5)
+    env.reset()
+    timestep = env.step(np.array([0.5, 0.5, 0.5, 0.5]))
+    self.assertTrue(timestep.last())
+    self.assertTrue(timestep.observation['obs'])
+    self.assertAlmostEqual(env.state()['sprites'][0].x, 0.3)
+
+  def testInvalidActionRepeat(self):
+    with self.assertRaises(ValueError):
+      self.make_object_under_test(tasks.NoReward(), renderers.Success(), 0)
+
 
 class EnvironmentRenderersTest(absltest.TestCase):
 
@@ -105,5 +256,65 @@ class EnvironmentRenderersTest(absltest.TestCase):
     self.environment.step(action)
 
 
+class LazyObservationTest(absltest.TestCase):
+
+  def _mock_renderer(self):
+    renderer = mock.Mock(spec=renderers.AbstractRenderer)
+    renderer.render.side_effect = lambda sprites, global_state: sprites[0].x
+    return renderer
+
+  def make_object_under_test(self):
+    self.renderers = {
+        'x': self._mock_renderer(),
+        'unused': self._mock_renderer(),
+    }
+    return environment.Environment(
+        task=tasks.NoReward(),
+        action_space=action_spaces.SelectMove(),
+        renderers=self.renderers,
+        init_sprites=lambda: [sprite.Sprite(x=0.5, y=0.5, c0=255)],
+        max_episode_length=7)
+
+  def testRendersOnlyAccessedKeys(self):
+    env = self.make_object_under_test()
+    timestep = env.reset()
+    self.assertCountEqual(timestep.observation.keys(), ['x', 'unused'])
+    self.assertEqual(self.renderers['x'].render.call_count, 0)
+    self.assertEqual(timestep.observation['x'], 0.5)
+    self.assertEqual(timestep.observation['x'], 0.5)
+    self.assertEqual(self.renderers['x'].render.call_count, 1)
+    self.assertEqual(self.renderers['unused'].render.call_count, 0)
+
+  def testPendingKeysRenderStateOfTheirStep(self):
+    env = self.make_object_under_test()
+    first_timestep = env.reset()
+    env.step(np.array([0.5, 0.5, 0.75, 0.5]))
+    self.assertEqual(env.state()['sprites'][0].x, 0.75)
+    self.assertEqual(first_timestep.observation['x'], 0.5)
+
+  def testPartialReadDoesNotCopySprites(self):
+    env = self.make_object_under_test()
+    first_observation = env.reset().observation
+    self.assertEqual(first_observation['x'], 0.5)
+    with mock.patch.object(
+        sprite.Sprite, '__init__', autospec=True,
+        side_effect=sprite.Sprite.__init__) as init:
+      for _ in range(3):
+        observation = env.step(np.array([0.5, 0.5, 0.75, 0.5])).observation
+        self.assertEqual(observation['x'], 0.75)
+      self.assertEqual(init.call_count, 0)
+      # Pending entries rebuild the sprites of their step when read.
+      self.assertEqual(first_observation['unused'], 0.5)
+      self.assertEqual(init.call_count, 1)
+
+  def testMutable(self):
+    env = self.make_object_under_test()
+    observation = env.reset().observation
+    observation['x'] = 3
+    del observation['unused']
+    self.assertEqual(dict(observation), {'x': 3})
+    self.assertEqual(self.renderers['x'].render.call_count, 0)
+
+
 if __name__ == '__main__':
   absltest.main()
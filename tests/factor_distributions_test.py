@@ -21,8 +21,11 @@ from __future__ import print_function
 
 from absl.testing import absltest
 from absl.testing import parameterized
+import numpy as np
+from scipy import stats
 from six.moves import range
 from spriteworld import factor_distributions as distribs
+import torch
 
 
 def test_sampling_and_containment(test_object, d, contained, not_contained):
@@ -457,5 +460,478 @@ class CompositionTest(parameterized.TestCase):
                                   not_contained)
 
 
+def _rows(columns):
+  n = len(next(iter(columns.values())))
+  return [{k: v[i] for k, v in columns.items()} for i in range(n)]
+
+
+class SampleBatchTest(parameterized.TestCase):
+  """Runs tests for batch sampling of distributions."""
+
+  @parameterized.named_parameters(
+      ('Continuous', distribs.Continuous('x', 0, 2)),
+      ('Discrete', distribs.Discrete('x', ['a', 'b', 'c'])),
+      ('Mixture', distribs.Mixture([
+          distribs.Continuous('x', 0, 1),
+          distribs.Discrete('x', [3, 4]),
+      ], probs=(0.2, 0.8))),
+      ('Product', distribs.Product([
+          distribs.Continuous('x', 0, 1),
+          distribs.Discrete('shape', ['square', 'circle']),
+      ])),
+      ('Intersection', distribs.Intersection([
+          distribs.Continuous('x', 0, 2),
+          distribs.Continuous('x', 1, 3),
+      ])),
+      ('SetMinus', distribs.SetMinus(
+          distribs.Product([
+              distribs.Continuous('x', 0, 1),
+              distribs.Continuous('y', 0, 1),
+          ]),
+          distribs.Product([
+              distribs.Continuous('x', 0.5, 1),
+              distribs.Continuous('y', 0.5, 1),
+          ]))),
+      ('Selection', distribs.Selection(
+          distribs.Product([
+              distribs.Discrete('x', [1, 2]),
+              distribs.Continuous('y', 0, 1),
+          ]),
+          distribs.Discrete('x', [2]))),
+  )
+  def testSampleBatchContainment(self, d):
+    columns = d.sample_batch(500, rng=np.random.default_rng(0))
+    self.assertEqual(set(columns), d.keys)
+    for v in columns.values():
+      self.assertEqual(v.shape, (500,))
+    for spec in _rows(columns):
+      self.assertTrue(d.contains(spec))
+
+  @parameterized.parameters(
+      distribs.Continuous('x', 0, 1),
+      distribs.Mixture([distribs.Discrete('x', [0]),
+                        distribs.Discrete('x', [1])]),
+      distribs.SetMinus(distribs.Continuous('x', 0, 1),
+                        distribs.Continuous('x', 0.5, 1)),
+  )
+  def testEmptyBatch(self, d):
+    columns = d.sample_batch(0)
+    self.assertEqual(columns['x'].shape, (0,))
+
+  def testMixtureProbs(self):
+    d = distribs.Mixture(
+        [distribs.Discrete('x', [0]), distribs.Discrete('x', [1])],
+        probs=(0.25, 0.75))
+    columns = d.sample_batch(20000, rng=np.random.default_rng(0))
+    self.assertAlmostEqual(np.mean(columns['x']), 0.75, delta=0.02)
+
+  def testSetMinusIsUniform(self):
+    # Rejection must not bias the remaining support.
+    d = distribs.SetMinus(
+        distribs.Continuous('x', 0, 1), distribs.Continuous('x', 0, 0.5))
+    columns = d.sample_batch(20000, rng=np.random.default_rng(0))
+    self.assertAlmostEqual(np.mean(columns['x']), 0.75, delta=0.01)
+
+  def testRaisesError(self):
+    d = distribs.Intersection(
+        (distribs.Continuous('x', 0, 1), distribs.Continuous('x', 2, 3)))
+    with self.assertRaises(ValueError):
+      d.sample_batch(2)
+
+  @parameterized.parameters(
+      ('x', 0.2, 0.75),
+      ('y', 0.2, 0.75),
+      ('scale', 0.11, 0.2),
+      ('angle', 0., 360.),
+      ('c0', 0., 1.),
+  )
+  def testBetaRange(self, key, minval, maxval):
+    d = distribs.Beta(key, 2., 5.)
+    out = d.sample_batch(1000, rng=np.random.default_rng(0))[key]
+    self.assertEqual(out.dtype, np.float32)
+    self.assertTrue(np.all(out >= minval))
+    self.assertTrue(np.all(out <= maxval))
+
+  def testBetaNonIdentMatchesSample(self):
+    uniform = np.random.default_rng(0).uniform(size=(6, 4))
+    d = distribs.Beta('y', 2., 3., non_ident=True)
+    batch = d.sample_batch(6, uniform=uniform)['y']
+    for i in range(6):
+      self.assertAlmostEqual(
+          batch[i], d.sample(uniform[i:i + 1])['y'].item(), places=6)
+
+
+class RejectionSamplingTest(absltest.TestCase):
+  """Runs tests for block rejection sampling."""
+
+  def testBlockSizeFollowsAcceptanceRate(self):
+    d = distribs.SetMinus(
+        distribs.Continuous('x', 0, 1), distribs.Continuous('x', 0, 0.25))
+    self.assertEqual(d._block_size(100, 0, 0), 100)
+    self.assertAlmostEqual(d._block_size(750, 10000, 7500), 1200, delta=50)
+
+  def testSameSeedSameSamples(self):
+    # Samples must not depend on the sampling history of the distribution.
+    d = distribs.SetMinus(
+        distribs.Product([
+            distribs.Continuous('x', 0, 1),
+            distribs.Discrete('shape', ['a', 'b', 'c']),
+        ]),
+        distribs.Product([
+            distribs.Continuous('x', 0, 0.5),
+            distribs.Discrete('shape', ['a']),
+        ]))
+    first = d.sample_batch(5, rng=np.random.default_rng(0))
+    d.sample_batch(1000, rng=np.random.default_rng(1))
+    second = d.sample_batch(5, rng=np.random.default_rng(0))
+    for k in d.keys:
+      np.testing.assert_array_equal(first[k], second[k])
+
+  def testRowsKeepTheirUniforms(self):
+    x = distribs.Beta('x', 2., 2., non_ident=True)
+    d = distribs.Selection(
+        distribs.Product([x, distribs.Continuous('y', 0, 1)]),
+        distribs.Continuous('y', 0, 0.3))
+    uniform = np.random.default_rng(0).uniform(size=(200, 4))
+    columns = d.sample_batch(
+        200, rng=np.random.default_rng(1), uniform=uniform)
+    np.testing.assert_allclose(
+        columns['x'], x.sample_batch(200, uniform=uniform)['x'])
+    self.assertTrue(np.all(columns['y'] < 0.3))
+
+  def testSampleMatchesBatchDistribution(self):
+    d = distribs.Selection(
+        distribs.Discrete('x', [0, 1, 2, 3]), distribs.Discrete('x', [1, 3]))
+    rng = np.random.default_rng(0)
+    samples = [d.sample(rng=rng)['x'] for _ in range(4000)]
+    self.assertAlmostEqual(np.mean(np.equal(samples, 3)), 0.5, delta=0.03)
+
+
+class ContainsBatchTest(parameterized.TestCase):
+  """Runs tests for vectorized containment."""
+
+  @parameterized.named_parameters(
+      ('Continuous', distribs.Continuous('x', 0.2, 0.6)),
+      ('Discrete', distribs.Discrete('x', [0.25, 0.5])),
+      ('Mixture', distribs.Mixture([
+          distribs.Continuous('x', 0, 0.3),
+          distribs.Discrete('x', [0.5, 0.75]),
+      ])),
+      ('Intersection', distribs.Intersection([
+          distribs.Continuous('x', 0, 0.6),
+          distribs.Continuous('x', 0.3, 1),
+      ])),
+      ('Product', distribs.Product([
+          distribs.Continuous('x', 0, 0.5),
+          distribs.Discrete('y', [0.25, 0.75]),
+      ])),
+      ('SetMinus', distribs.SetMinus(
+          distribs.Continuous('x', 0, 0.8),
+          distribs.Discrete('x', [0.25, 0.5]))),
+      ('Selection', distribs.Selection(
+          distribs.Product([
+              distribs.Continuous('x', 0, 1),
+              distribs.Discrete('y', [0.25, 0.5, 0.75]),
+          ]),
+          distribs.Discrete('y', [0.5]))),
+  )
+  def testMatchesContains(self, d):
+    # Values on a coarse grid, so that discrete candidates are hit.
+    rng = np.random.default_rng(0)
+    columns = {
+        'x': rng.choice(np.linspace(-0.25, 1., 6), size=200),
+        'y': rng.choice(np.linspace(-0.25, 1., 6), size=200),
+    }
+    mask = d.contains_batch(columns)
+    self.assertEqual(mask.dtype, np.bool_)
+    expected = [d.contains(spec) for spec in _rows(columns)]
+    np.testing.assert_array_equal(mask, expected)
+
+  def testStrings(self):
+    d = distribs.Discrete('shape', ['square', 'triangle'])
+    mask = d.contains_batch(
+        {'shape': np.array(['square', 'circle', 'triangle'])})
+    np.testing.assert_array_equal(mask, [True, False, True])
+
+  def testRaisesKeyError(self):
+    d = distribs.Continuous('x', 0, 1)
+    with self.assertRaises(KeyError):
+      d.contains_batch({'y': np.zeros(3)})
+
+
+def _grid_columns(keys, num_values=9, size=2000):
+  rng = np.random.default_rng(0)
+  return {k: rng.choice(np.linspace(0., 1., num_values), size=size)
+          for k in keys}
+
+
+class CompileTest(parameterized.TestCase):
+  """Runs tests for compilation of distribution trees."""
+
+  def testProductMergesBoxes(self):
+    d = distribs.Product([
+        distribs.Continuous('x', 0, 1),
+        distribs.Product([
+            distribs.Continuous('y', 0.2, 0.4),
+            distribs.Discrete('shape', ['square']),
+        ]),
+    ])
+    compiled = distribs.compile_distribution(d)
+    self.assertIsInstance(compiled, distribs.Product)
+    self.assertLen(compiled.components, 2)
+    box = compiled.components[0]
+    self.assertIsInstance(box, distribs.Box)
+    self.assertEqual(box.bounds, {'x': (0, 1), 'y': (0.2, 0.4)})
+    self.assertEqual(compiled.keys, d.keys)
+
+  @parameterized.named_parameters(
+      ('Box', distribs.Box({'x': (0.1, 0.3), 'y': (0.7, 0.9)})),
+      ('Continuous', distribs.Continuous('x', 0.1, 0.3)),
+  )
+  def testFloat32CastStaysInBounds(self, d):
+    # Float64 samples just below 0.3 round up to it in float32, and 0.7
+    # rounds down below itself.
+    points = np.array([[np.nextafter(1., 0.)] * 2, [0., 0.]])
+    columns = d.transform_batch(points[:, :d.num_dimensions])
+    self.assertTrue(np.all(d.contains_batch(columns)))
+    for i in range(2):
+      self.assertTrue(d.contains({k: v[i] for k, v in columns.items()}))
+
+  def testMixtureIsFlattened(self):
+    d = distribs.Mixture([
+        distribs.Discrete('x', [0]),
+        distribs.Mixture([
+            distribs.Discrete('x', [1]),
+            distribs.Discrete('x', [2]),
+        ], probs=(0.25, 0.75)),
+    ], probs=(0.2, 0.8))
+    compiled = distribs.compile_distribution(d)
+    self.assertLen(compiled.components, 3)
+    np.testing.assert_allclose(compiled.probs, [0.2, 0.2, 0.6])
+
+  def testIntersectionAndSelectionNeedNoRejection(self):
+    intersection = distribs.Intersection([
+        distribs.Continuous('x', 0, 0.6),
+        distribs.Continuous('x', 0.2, 1),
+    ])
+    compiled = distribs.compile_distribution(intersection)
+    self.assertIsInstance(compiled, distribs.Continuous)
+    self.assertEqual((compiled.minval, compiled.maxval), (0.2, 0.6))
+
+    selection = distribs.Selection(
+        distribs.Product([
+            distribs.Continuous('x', 0, 1),
+            distribs.Continuous('y', 0, 1),
+        ]), distribs.Continuous('y', 0.5, 2))
+    compiled = distribs.compile_distribution(selection)
+    self.assertIsInstance(compiled, distribs.Box)
+    self.assertEqual(compiled.bounds, {'x': (0, 1), 'y': (0.5, 1)})
+
+  def testSetMinusIsDecomposed(self):
+    d = distribs.SetMinus(
+        distribs.Product([
+            distribs.Continuous('x', 0.1, 0.9),
+            distribs.Continuous('y', 0.1, 0.9),
+        ]),
+        distribs.Product([
+            distribs.Continuous('x', 0.5, 0.9),
+            distribs.Continuous('y', 0.5, 0.9),
+        ]))
+    compiled = distribs.compile_distribution(d)
+    self.assertIsInstance(compiled, distribs.Mixture)
+    for c in compiled.components:
+      self.assertIsInstance(c, distribs.Box)
+    np.testing.assert_allclose(compiled.probs, [2. / 3, 1. / 3])
+
+  def testEmptySupportStillRaises(self):
+    d = distribs.Intersection(
+        (distribs.Continuous('x', 0, 1), distribs.Continuous('x', 2, 3)))
+    with self.assertRaises(ValueError):
+      distribs.compile_distribution(d).sample_batch(2)
+
+  @parameterized.named_parameters(
+      ('SetMinusInProduct', distribs.Product([
+          distribs.SetMinus(
+              distribs.Product([
+                  distribs.Continuous('x', 0., 1.),
+                  distribs.Continuous('y', 0., 1.),
+              ]),
+              distribs.Continuous('x', 0.25, 0.5)),
+          distribs.Discrete('z', [0.5, 0.75]),
+      ])),
+      ('SelectionOfMixture', distribs.Selection(
+          distribs.Mixture([
+              distribs.Product([
+                  distribs.Continuous('x', 0., 0.5),
+                  distribs.Continuous('y', 0., 1.),
+              ]),
+              distribs.Product([
+                  distribs.Continuous('x', 0.5, 1.),
+                  distribs.Continuous('y', 0.5, 1.),
+              ]),
+          ]),
+          distribs.Continuous('y', 0.25, 0.75))),
+      ('NestedSetMinus', distribs.SetMinus(
+          distribs.SetMinus(
+              distribs.Product([
+                  distribs.Continuous('x', 0., 1.),
+                  distribs.Continuous('y', 0., 1.),
+              ]),
+              distribs.Continuous('y', 0., 0.25)),
+          distribs.Product([
+              distribs.Continuous('x', 0.5, 1.),
+              distribs.Continuous('y', 0.5, 1.),
+          ]))),
+  )
+  def testEquivalence(self, d):
+    compiled = distribs.compile_distribution(d)
+    self.assertEqual(compiled.keys, d.keys)
+    columns = _grid_columns(d.keys)
+    np.testing.assert_array_equal(
+        compiled.contains_batch(columns), d.contains_batch(columns))
+
+    samples = compiled.sample_batch(40000, rng=np.random.default_rng(1))
+    expected = d.sample_batch(40000, rng=np.random.default_rng(2))
+    self.assertTrue(np.all(d.contains_batch(samples)))
+    for k in d.keys:
+      self.assertAlmostEqual(
+          np.mean(samples[k]), np.mean(expected[k]), delta=0.01)
+      self.assertAlmostEqual(
+          np.std(samples[k]), np.std(expected[k]), delta=0.01)
+
+
+class BetaTest(parameterized.TestCase):
+  """Runs tests for the Beta distribution."""
+
+  @parameterized.parameters(
+      ('x', 2., 5., 0.55, 0.2),
+      ('y', 0.5, 0.5, 0.55, 0.2),
+      ('scale', 5., 1., 0.09, 0.11),
+      ('angle', 2., 2., 360., 0.),
+      ('c0', 3., 7., 1., 0.),
+  )
+  def testMatchesTorch(self, key, alpha, beta, scale, offset):
+    torch.manual_seed(0)
+    expected = torch.distributions.Beta(
+        torch.tensor([alpha]), torch.tensor([beta])).sample((5000,))
+    expected = expected.numpy()[:, 0] * scale + offset
+    d = distribs.Beta(key, alpha, beta)
+    samples = d.sample_batch(5000, rng=np.random.default_rng(0))[key]
+    self.assertGreater(stats.ks_2samp(samples, expected).pvalue, 1e-3)
+    # Both must also match the exact Beta distribution.
+    cdf = stats.beta(alpha, beta, loc=offset, scale=scale).cdf
+    self.assertGreater(stats.kstest(samples, cdf).pvalue, 1e-3)
+    self.assertGreater(stats.kstest(expected, cdf).pvalue, 1e-3)
+
+  def testSample(self):
+    d = distribs.Beta('x', 2., 2.)
+    for rng in (None, np.random.default_rng(0), np.random.RandomState(0)):
+      value = d.sample(rng=rng)['x']
+      self.assertEqual(np.shape(value), ())
+      self.assertEqual(value.dtype, np.float32)
+      self.assertTrue(0.2 <= value <= 0.75)
+
+  @parameterized.parameters(
+      (2., 2., 1e-3),
+      (0.5, 0.5, 1e-5),
+      (2., 18., 1e-5),
+      (18., 2., 1e-4),
+      (0.3, 5., 1e-5),
+  )
+  def testInverseCdfTableErrorBound(self, alpha, beta, tolerance):
+    uniform = np.random.default_rng(0).uniform(size=(100000, 4))
+    table = distribs.Beta('c0', alpha, beta, non_ident=True,
+                          dtype='float64', ppf_tolerance=tolerance)
+    exact = distribs.Beta('c0', alpha, beta, non_ident=True,
+                          dtype='float64', ppf_tolerance=None)
+    error = (table.sample_batch(100000, uniform=uniform)['c0'] -
+             exact.sample_batch(100000, uniform=uniform)['c0'])
+    self.assertLess(np.max(np.abs(error)), tolerance)
+
+  def testInverseCdfTableIsMonotoneAndCached(self):
+    d = distribs.Beta('x', 2., 18., non_ident=True)
+    uniform = np.tile(np.linspace(0., 1., 10001)[:, None], (1, 4))
+    out = d.sample_batch(10001, uniform=uniform)['x']
+    self.assertTrue(np.all(np.diff(out) >= 0))
+    self.assertAlmostEqual(out[0], 0.2, places=6)
+    self.assertAlmostEqual(out[-1], 0.75, places=6)
+    self.assertIs(distribs._beta_ppf_table(2., 18., 1e-5),
+                  distribs._beta_ppf_table(2., 18., 1e-5))
+
+  def testReproducible(self):
+    d = distribs.Beta('scale', 2., 3.)
+    np.testing.assert_array_equal(
+        d.sample_batch(10, rng=np.random.default_rng(3))['scale'],
+        d.sample_batch(10, rng=np.random.default_rng(3))['scale'])
+
+
+class QuasiRandomTest(parameterized.TestCase):
+  """Runs tests for quasi-random sampling."""
+
+  def testTransform(self):
+    d = distribs.Product([
+        distribs.Continuous('x', 1., 3.),
+        distribs.Discrete('shape', ['a', 'b'], probs=(0.25, 0.75)),
+    ])
+    self.assertEqual(d.num_dimensions, 2)
+    columns = d.transform_batch(np.array([[0., 0.2], [0.5, 0.3], [0.75, 0.9]]))
+    np.testing.assert_allclose(columns['x'], [1., 2., 2.5])
+    self.assertEqual(list(columns['shape']), ['a', 'b', 'b'])
+
+  @parameterized.parameters('sobol', 'halton')
+  def testCoverage(self, method):
+    d = distribs.Product([
+        distribs.Continuous('x', 0., 1.),
+        distribs.Beta('y', 2., 2.),
+    ])
+    quasi = distribs.sample_quasi_random(d, 1024, method=method)
+    independent = d.sample_batch(1024, rng=np.random.default_rng(0))
+    self.assertTrue(np.all(d.contains_batch(quasi)))
+
+    def max_bin_error(values):
+      counts, _ = np.histogram(values, bins=16, range=(0., 1.))
+      return np.max(np.abs(counts - 64))
+
+    self.assertLess(max_bin_error(quasi['x']), 3)
+    self.assertGreater(max_bin_error(independent['x']), 3)
+
+  def testShardsCoverOneSequence(self):
+    d = distribs.Mixture([
+        distribs.Continuous('x', 0., 1.),
+        distribs.Discrete('x', [2., 3.]),
+    ])
+    full = distribs.sample_quasi_random(d, 1024, seed=3)['x']
+    shards = [
+        distribs.sample_quasi_random(d, 256, start=256 * i, seed=3)['x']
+        for i in range(4)
+    ]
+    np.testing.assert_array_equal(np.concatenate(shards), full)
+
+  def testRejectedRowsAreReplaced(self):
+    d = distribs.SetMinus(
+        distribs.Product([
+            distribs.Continuous('x', 0., 1.),
+            distribs.Discrete('y', [0., 1.]),
+        ]),
+        distribs.Discrete('y', [1.]))
+    columns = distribs.sample_quasi_random(
+        d, 256, rng=np.random.default_rng(0))
+    self.assertTrue(np.all(d.contains_batch(columns)))
+    np.testing.assert_array_equal(columns['y'], 0.)
+
+  def testNonIdentifiableBeta(self):
+    d = distribs.Beta('x', 2., 2., non_ident=True)
+    self.assertEqual(d.num_dimensions, 0)
+    uniform = np.random.default_rng(0).uniform(size=(8, 4))
+    np.testing.assert_array_equal(
+        distribs.sample_quasi_random(d, 8, uniform=uniform)['x'],
+        d.sample_batch(8, uniform=uniform)['x'])
+
+  def testRaisesError(self):
+    with self.assertRaises(ValueError):
+      distribs.sample_quasi_random(
+          distribs.Continuous('x', 0., 1.), 4, method='lattice')
+
+
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,104 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for factor_grid.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+from absl.testing import absltest
+from absl.testing import parameterized
+import numpy as np
+from spriteworld import factor_distributions as distribs
+from spriteworld import factor_grid
+
+
+class FactorGridTest(parameterized.TestCase):
+
+  def testProductOrder(self):
+    d = distribs.Product([
+        distribs.Discrete('shape', ['square', 'circle']),
+        distribs.Continuous('x', 0., 1.),
+        distribs.Discrete('c0', [0.1, 0.2, 0.3]),
+    ])
+    grid = factor_grid.FactorGrid(d, resolution=4)
+    self.assertLen(grid, 24)
+    expected = itertools.product(
+        ['square', 'circle'], [0.125, 0.375, 0.625, 0.875], [0.1, 0.2, 0.3])
+    for i, (shape, x, c0) in enumerate(expected):
+      spec = grid[i]
+      self.assertEqual(spec['shape'], shape)
+      self.assertAlmostEqual(spec['x'], x)
+      self.assertAlmostEqual(spec['c0'], c0)
+      self.assertEqual(grid.index(spec), i)
+
+  @parameterized.named_parameters(
+      ('SetMinus', distribs.SetMinus(
+          distribs.Product([
+              distribs.Continuous('x', 0., 1.),
+              distribs.Continuous('y', 0., 1.),
+              distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+          ]),
+          distribs.Product([
+              distribs.Continuous('x', 0.5, 1.),
+              distribs.Continuous('y', 0.5, 1.),
+          ])), 8 * 8 * 3 * 3 // 4),
+      ('Selection', distribs.Selection(
+          distribs.Product([
+              distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+              distribs.Beta('scale', 2., 2.),
+          ]),
+          distribs.Discrete('shape', ['circle'])), 8),
+      ('Intersection', distribs.Intersection([
+          distribs.Continuous('x', 0., 1.),
+          distribs.Continuous('x', 0.25, 0.75),
+      ]), 4),
+      ('Mixture', distribs.Mixture([
+          distribs.Discrete('x', [0., 1.]),
+          distribs.Product([distribs.Continuous('x', 2., 3.)]),
+      ]), 10),
+  )
+  def testExclusions(self, d, size):
+    grid = factor_grid.FactorGrid(d, resolution=8)
+    self.assertLen(grid, size)
+    indices = np.arange(len(grid))
+    columns = grid.rows(indices)
+    self.assertTrue(np.all(d.contains_batch(columns)))
+    np.testing.assert_array_equal(grid.indices(columns), indices)
+    # All specs are distinct.
+    self.assertLen(set(zip(*[columns[k] for k in sorted(d.keys)])), size)
+
+  def testResolutionPerKey(self):
+    d = distribs.Product([
+        distribs.Continuous('x', 0., 1.),
+        distribs.Continuous('y', 0., 1.),
+    ])
+    grid = factor_grid.FactorGrid(d, resolution={'x': 2, 'y': 5})
+    self.assertLen(grid, 10)
+    with self.assertRaises(ValueError):
+      factor_grid.FactorGrid(d, resolution={'x': 2})
+
+  def testErrors(self):
+    grid = factor_grid.FactorGrid(distribs.Discrete('x', [1, 2]))
+    with self.assertRaises(IndexError):
+      grid.rows([2])
+    with self.assertRaises(KeyError):
+      grid.index({'x': 3})
+
+
+if __name__ == '__main__':
+  absltest.main()
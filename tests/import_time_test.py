@@ -0,0 +1,69 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Import-time budget of spriteworld.environment."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import subprocess
+import sys
+from absl.testing import absltest
+
+# Heavy dependencies that must only be imported by the features using them.
+_HEAVY_MODULES = ('torch', 'sklearn', 'scipy', 'matplotlib',
+                  'matplotlib.pyplot', 'gym')
+
+# Cumulative import time budget of spriteworld.environment, in seconds. The
+# import takes about 0.15s, against 0.6s when scipy and matplotlib were
+# imported eagerly, so the budget fails if either comes back.
+_BUDGET = 0.3
+
+_NUM_RUNS = 3
+
+
+def _run_python(*args):
+  return subprocess.run(
+      [sys.executable] + list(args), stdout=subprocess.PIPE,
+      stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+
+class ImportTimeTest(absltest.TestCase):
+
+  def testHeavyDependenciesNotImported(self):
+    for module in ('spriteworld', 'spriteworld.environment'):
+      output = _run_python(
+          '-c', 'import sys; import {}; '
+          'print(" ".join(sorted(sys.modules)))'.format(module)).stdout
+      modules = set(output.split())
+      self.assertEmpty([m for m in _HEAVY_MODULES if m in modules], module)
+
+  def testImportTimeBudget(self):
+    # The fastest of a few runs, so that the test is robust to system load.
+    seconds = []
+    for _ in range(_NUM_RUNS):
+      stderr = _run_python(
+          '-X', 'importtime', '-c', 'import spriteworld.environment').stderr
+      match = re.search(
+          r'^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*spriteworld\.environment$',
+          stderr, re.MULTILINE)
+      seconds.append(int(match.group(1)) * 1e-6)
+    self.assertLess(min(seconds), _BUDGET)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,144 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for recorder."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+from absl.testing import absltest
+import numpy as np
+from six.moves import range
+
+from spriteworld import action_spaces
+from spriteworld import environment
+from spriteworld import recorder
+from spriteworld import renderers
+from spriteworld import sprite
+from spriteworld import tasks
+
+
+class TrajectoryRecorderTest(absltest.TestCase):
+
+  def _tempdir(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    return directory
+
+  def _run(self, directory, num_steps, chunk_size=4, observation_keys=None):
+    traj_recorder = recorder.TrajectoryRecorder(
+        directory,
+        chunk_size=chunk_size,
+        observation_keys=observation_keys,
+        max_sprites=3)
+    env = environment.Environment(
+        task=tasks.NoReward(),
+        action_space=action_spaces.SelectMove(),
+        renderers={
+            'image': renderers.PILRenderer(image_size=(8, 8)),
+            'success': renderers.Success(),
+            'factors': renderers.SpriteFactors(),
+        },
+        init_sprites=lambda: [sprite.Sprite(x=0.3, c0=255), sprite.Sprite()],
+        max_episode_length=3,
+        recorder=traj_recorder)
+    actions = []
+    timestep = env.reset()
+    for i in range(num_steps - 1):
+      action = np.array([0.3, 0.5, 0.5 + 0.01 * i, 0.5], dtype=np.float32)
+      timestep = env.step(action)
+      actions.append(action if not timestep.first() else np.zeros(4))
+    traj_recorder.close()
+    return actions
+
+  def testRoundTrip(self):
+    directory = self._tempdir()
+    actions = self._run(directory, 10, observation_keys=('image', 'success'))
+    trajectories = recorder.Trajectories(directory)
+
+    self.assertLen(trajectories, 10)
+    self.assertEqual(trajectories.num_episodes, 3)
+    self.assertLen(os.listdir(directory), 4)  # 3 chunks and metadata
+    self.assertEqual(trajectories.fields, [
+        'action', 'discount', 'episode', 'factors', 'num_sprites', 'obs_image',
+        'obs_success', 'reward', 'step_type'
+    ])
+
+    self.assertEqual(
+        list(trajectories.get('episode', 0, 10)), [0] * 4 + [1] * 4 + [2] * 2)
+    episode = trajectories.episode(1)
+    self.assertEqual(list(episode['step_type']), [0, 1, 1, 2])
+    np.testing.assert_array_equal(episode['action'][0], np.zeros(4))
+    np.testing.assert_array_equal(
+        trajectories.get('action', 1, 10), np.stack(actions))
+    self.assertEqual(episode['obs_image'].shape, (4, 8, 8, 3))
+    self.assertEqual(list(episode['num_sprites']), [2] * 4)
+    self.assertLen(trajectories.episode(-1)['step_type'], 2)
+    with self.assertRaises(IndexError):
+      trajectories.episode(3)
+
+    factors = trajectories.get('factors', 9, 10)[0]
+    self.assertTrue(np.all(np.isnan(factors[2])))
+    self.assertAlmostEqual(factors[0, 0], 0.3 + 0.01 * 8, places=5)
+
+  def testVaryingNumberOfSprites(self):
+    directory = self._tempdir()
+    traj_recorder = recorder.TrajectoryRecorder(
+        directory, chunk_size=4, max_sprites=5)
+    env = environment.Environment(
+        task=tasks.NoReward(),
+        action_space=action_spaces.SelectMove(),
+        renderers={'image': renderers.PILRenderer(image_size=(8, 8))},
+        init_sprites=lambda rng: [
+            sprite.Sprite(x=0.1 * i + 0.3, c0=255)
+            for i in range(rng.integers(1, 6))
+        ],
+        max_episode_length=2,
+        recorder=traj_recorder,
+        seed=0)
+    timestep = env.reset()
+    for _ in range(9):
+      timestep = env.step(np.array([0.5, 0.5, 0.5, 0.5]))
+    traj_recorder.close()
+    trajectories = recorder.Trajectories(directory)
+    self.assertGreater(len(set(trajectories.get('num_sprites', 0, 10))), 1)
+    images = trajectories.get('obs_image', 0, 10)
+    self.assertEqual(images.shape, (10, 8, 8, 3))
+    np.testing.assert_array_equal(images[-1], timestep.observation['image'][-1])
+
+  def testEmptyRecording(self):
+    directory = self._tempdir()
+    recorder.TrajectoryRecorder(directory).close()
+    trajectories = recorder.Trajectories(directory)
+    self.assertEmpty(trajectories)
+    self.assertEqual(trajectories.num_episodes, 0)
+
+  def testRejectsObjectObservations(self):
+    with self.assertRaises(ValueError):
+      self._run(self._tempdir(), 2)
+
+  def testRejectsExistingRecording(self):
+    directory = self._tempdir()
+    self._run(directory, 2, observation_keys=())
+    with self.assertRaises(ValueError):
+      recorder.TrajectoryRecorder(directory)
+
+
+if __name__ == '__main__':
+  absltest.main()
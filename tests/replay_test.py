@@ -0,0 +1,129 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for replay."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import mock
+import numpy as np
+from six.moves import range
+
+from spriteworld import action_spaces
+from spriteworld import environment
+from spriteworld import replay
+from spriteworld import renderers
+from spriteworld import sprite
+from spriteworld import tasks
+
+
+class FactorReplayTest(absltest.TestCase):
+
+  def _run(self, buffer, num_steps):
+    """Run environment with buffer as recorder, returning rendered images."""
+    env = environment.Environment(
+        task=tasks.NoReward(),
+        action_space=action_spaces.SelectMove(),
+        renderers={'image': renderers.PILRenderer(image_size=(16, 16))},
+        init_sprites=lambda: [
+            sprite.Sprite(x=0.3, shape='square', c0=255, c1=10, c2=30),
+            sprite.Sprite(x=0.6, angle=30, scale=0.2, c0=20, c1=255, c2=40),
+        ],
+        max_episode_length=4,
+        recorder=buffer)
+    images = [env.reset().observation['image']]
+    for i in range(num_steps - 1):
+      action = np.array([0.3, 0.5, 0.5 + 0.02 * i, 0.5])
+      images.append(env.step(action).observation['image'])
+    return images
+
+  def _make_buffer(self, capacity, **kwargs):
+    return replay.FactorReplay(
+        capacity,
+        renderers={'image': renderers.PILRenderer(image_size=(16, 16))},
+        max_sprites=4,
+        factors_dtype=np.float64,
+        **kwargs)
+
+  def testReconstructsObservations(self):
+    buffer = self._make_buffer(10)
+    images = self._run(buffer, 7)
+    self.assertLen(buffer, 7)
+    observations = buffer.observations(np.arange(7))['image']
+    self.assertEqual(observations.shape, (7, 3, 16, 16, 3))
+    np.testing.assert_array_equal(observations, np.stack(images))
+
+    batch = buffer.get([0, 5])
+    self.assertEqual(list(batch['step_type']), [0, 0])
+    self.assertEqual(list(batch['num_sprites']), [2, 2])
+    np.testing.assert_array_equal(batch['action'][0], np.zeros(4))
+
+  def testOverwritesOldest(self):
+    buffer = self._make_buffer(4)
+    images = self._run(buffer, 7)
+    self.assertLen(buffer, 4)
+    np.testing.assert_array_equal(
+        buffer.observations([0, 3])['image'], np.stack([images[3], images[6]]))
+    with self.assertRaises(IndexError):
+      buffer.get([4])
+
+  def testCache(self):
+    renderer = mock.Mock(spec=renderers.AbstractRenderer)
+    renderer.render.return_value = np.zeros(3)
+    buffer = replay.FactorReplay(
+        4, renderers={'obs': renderer}, cache_size=2, record_success=True)
+    self._run(buffer, 4)
+    buffer.observations([0, 1, 0, 1])
+    self.assertEqual(renderer.render.call_count, 2)
+    buffer.observations([2])
+    buffer.observations([0])
+    self.assertEqual(renderer.render.call_count, 4)
+    self.assertEqual(renderer.render.call_args[1]['global_state'],
+                     {'success': False})
+
+  def testSuccessFromEnvironment(self):
+    task = mock.Mock(wraps=tasks.FindGoalPosition(
+        goal_position=(0.5, 0.5), terminate_distance=0.1))
+    buffer = self._make_buffer(10, record_success=True)
+    env = environment.Environment(
+        task=task,
+        action_space=action_spaces.SelectMove(),
+        renderers={},
+        init_sprites=lambda: [sprite.Sprite(x=0.3, y=0.5, c0=255)],
+        recorder=buffer)
+    env.reset()
+    task.reset_mock()
+    successes = [env.success()]
+    for x in (0.3, 0.4):
+      env.step(np.array([x, 0.5, 0.6, 0.5]))
+      successes.append(env.success())
+    self.assertEqual(task.evaluate.call_count, 2)
+    self.assertEqual(task.success.call_count, 0)
+    self.assertEqual(list(buffer.get(np.arange(3))['success']), successes)
+    self.assertTrue(successes[-1])
+
+  def testSample(self):
+    buffer = self._make_buffer(10)
+    self._run(buffer, 5)
+    batch = buffer.sample(3, rng=np.random.default_rng(0))
+    self.assertEqual(batch['obs_image'].shape, (3, 3, 16, 16, 3))
+    self.assertEqual(batch['factors'].shape, (3, 4, len(sprite.FACTOR_NAMES)))
+
+
+if __name__ == '__main__':
+  absltest.main()
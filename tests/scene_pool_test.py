@@ -0,0 +1,93 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for scene_pool.py."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+from spriteworld import factor_distributions as distribs
+from spriteworld import renderers
+from spriteworld import scene_pool
+from spriteworld import sprite_generators
+
+_FACTORS = distribs.Product([
+    distribs.Continuous('x', 0.1, 0.9),
+    distribs.Continuous('y', 0.1, 0.9),
+    distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+    distribs.Continuous('c0', 0., 1.),
+])
+
+
+def _positions(scene):
+  return [s.position.tolist() for s in scene.sprites]
+
+
+class ScenePoolTest(absltest.TestCase):
+
+  def _pool(self, **kwargs):
+    pool = scene_pool.ScenePool(
+        sprite_generators.generate_sprites(
+            _FACTORS, num_sprites=lambda rng: rng.choice([1, 2, 3])),
+        **kwargs)
+    self.addCleanup(pool.close)
+    return pool
+
+  def testSequenceNumberedSeeds(self):
+    pool_0 = self._pool(capacity=1, seed=3)
+    pool_1 = self._pool(capacity=5, seed=3)
+    for index in range(10):
+      scene_0 = pool_0.get(timeout=10)
+      scene_1 = pool_1.get(timeout=10)
+      self.assertEqual(scene_0.index, index)
+      self.assertEqual(_positions(scene_0), _positions(scene_1))
+    self.assertNotEqual(_positions(pool_0.get()), _positions(pool_0.get()))
+
+  def testRestart(self):
+    pool = self._pool(seed=1)
+    first = [_positions(pool.get(timeout=10)) for _ in range(3)]
+    pool.restart(1)
+    self.assertEqual(first, [_positions(pool.get(timeout=10))
+                             for _ in range(3)])
+    pool.restart(2)
+    self.assertEqual(pool.seed, 2)
+    self.assertNotEqual(first[0], _positions(pool.get(timeout=10)))
+
+  def testPrerender(self):
+    renderer = renderers.PILRenderer(
+        image_size=(16, 16), color_to_rgb=renderers.color_maps.hsv_to_rgb)
+    pool = self._pool(seed=0, renderers={'image': renderer})
+    scene = pool.get(timeout=10)
+    np.testing.assert_array_equal(
+        scene.observations['image'],
+        renderer.render(sprites=scene.sprites, global_state={}))
+
+  def testErrorsAreRaised(self):
+
+    def _init_sprites():
+      raise RuntimeError('No sprites.')
+
+    pool = scene_pool.ScenePool(_init_sprites)
+    self.addCleanup(pool.close)
+    for _ in range(2):
+      with self.assertRaisesRegex(RuntimeError, 'No sprites'):
+        pool.get(timeout=10)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -22,6 +22,7 @@ from __future__ import print_function
 from absl.testing import absltest
 from absl.testing import parameterized
 import numpy as np
+from scipy import stats
 from spriteworld import factor_distributions as distribs
 from spriteworld import sprite
 from spriteworld import sprite_generators
@@ -103,5 +104,233 @@ class ShuffleTest(absltest.TestCase):
     self.assertLen(sprite_list, 5)
 
 
+class RNGTest(absltest.TestCase):
+
+  def _generator(self):
+    factors = distribs.Product([
+        distribs.Continuous('x', 0., 1.),
+        distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+    ])
+    g_0 = sprite_generators.generate_sprites(
+        factors, num_sprites=lambda rng: rng.choice(np.arange(1, 5)))
+    g_1 = sprite_generators.generate_sprites(factors, num_sprites=2)
+    return sprite_generators.shuffle(
+        sprite_generators.chain_generators(
+            sprite_generators.sample_generator((g_0, g_1)), g_1))
+
+  def testDeterministic(self):
+    g = self._generator()
+    sprites_0 = g(rng=np.random.default_rng(1))
+    sprites_1 = g(rng=np.random.default_rng(1))
+    self.assertEqual([s.factors for s in sprites_0],
+                     [s.factors for s in sprites_1])
+
+  def testCallWithRNG(self):
+    rng = np.random.default_rng(0)
+    self.assertEqual(
+        sprite_generators.call_with_rng(lambda: 'no_rng', rng), 'no_rng')
+    self.assertIs(sprite_generators.call_with_rng(lambda rng: rng, rng), rng)
+    self.assertEqual(
+        sprite_generators.call_with_rng(lambda a, **kw: (a, kw), rng, 1),
+        (1, {'rng': rng}))
+
+  def testWithRNG(self):
+    rng = np.random.default_rng(0)
+    self.assertEqual(sprite_generators.with_rng(lambda: 'no_rng')(rng),
+                     'no_rng')
+    self.assertIs(sprite_generators.with_rng(lambda rng: rng)(rng), rng)
+    self.assertEqual(
+        sprite_generators.with_rng(lambda a, **kw: (a, kw))(rng, 1),
+        (1, {'rng': rng}))
+    self.assertFalse(sprite_generators.accepts_rng(len))
+
+
+class GaussianCopulaTest(absltest.TestCase):
+
+  def testDefaultCorrelation(self):
+    copula = sprite_generators.GaussianCopula()
+    np.testing.assert_allclose(copula.correlation, 0.3 * np.eye(4) + 0.7)
+
+  def testSamples(self):
+    correlation = [[1., 0.5, -0.3], [0.5, 1., 0.], [-0.3, 0., 1.]]
+    copula = sprite_generators.GaussianCopula(correlation)
+    uniform = copula.sample(50000, rng=np.random.default_rng(0))
+    self.assertEqual(uniform.shape, (50000, 3))
+    self.assertTrue(np.all((uniform >= 0.) & (uniform <= 1.)))
+    np.testing.assert_allclose(np.mean(uniform, axis=0), 0.5, atol=0.01)
+    # The latent Gaussians have the requested correlation.
+    gaussian = stats.norm.ppf(uniform)
+    np.testing.assert_allclose(
+        np.corrcoef(gaussian.T), correlation, atol=0.02)
+
+  def testRaisesError(self):
+    with self.assertRaises(ValueError):
+      sprite_generators.GaussianCopula([[1., 0.5], [0.4, 1.]])
+    with self.assertRaises(ValueError):
+      sprite_generators.GaussianCopula([[1., 2.], [2., 1.]])
+
+  def testGenerateSpritesUsesCopula(self):
+    factors = distribs.Product([
+        distribs.Beta('x', 2., 2., non_ident=True),
+        distribs.Beta('y', 2., 2., non_ident=True),
+    ])
+    copula = sprite_generators.GaussianCopula([[1., 0.], [0., 1.]])
+    g = sprite_generators.generate_sprites(
+        factors, num_sprites=1, copula=copula)
+    rng = np.random.default_rng(0)
+    positions = np.array([g(rng=rng)[0].position for _ in range(2000)])
+    self.assertLess(abs(np.corrcoef(positions.T)[0, 1]), 0.1)
+
+
+class NonOverlappingGeneratorTest(parameterized.TestCase):
+
+  _factors = distribs.Product([
+      distribs.Continuous('x', 0.1, 0.9),
+      distribs.Continuous('y', 0.1, 0.9),
+      distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+      distribs.Continuous('scale', 0.05, 0.12),
+  ])
+
+  @parameterized.parameters((10, 0.), (5, 0.05))
+  def testNoOverlap(self, num_sprites, min_gap):
+    g = sprite_generators.NonOverlappingGenerator(
+        self._factors, num_sprites=num_sprites, min_gap=min_gap)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+      sprites = g(rng=rng)
+      self.assertLen(sprites, num_sprites)
+      for i, s_0 in enumerate(sprites):
+        self.assertTrue(self._factors.contains(s_0.factors))
+        for s_1 in sprites[i + 1:]:
+          distance = np.linalg.norm(s_0.position - s_1.position)
+          self.assertGreaterEqual(
+              distance,
+              sprite_generators.bounding_radius(s_0.shape, s_0.scale) +
+              sprite_generators.bounding_radius(s_1.shape, s_1.scale) +
+              min_gap)
+    stats = g.stats
+    self.assertEqual(stats['num_scenes'], 20)
+    self.assertEqual(stats['num_sprites'], 20 * num_sprites)
+    self.assertGreater(stats['num_proposals'], stats['num_sprites'])
+    self.assertEqual(stats['acceptance_rate'],
+                     stats['num_sprites'] / stats['num_proposals'])
+
+  def testBoundingRadius(self):
+    s = sprite.Sprite(shape='star_5', scale=0.2, angle=33)
+    radius = np.max(np.linalg.norm(s.vertices - s.position, axis=1))
+    self.assertAlmostEqual(
+        sprite_generators.bounding_radius('star_5', 0.2), radius)
+
+  def testFailsFast(self):
+    # Infeasible density is detected before placing any sprite.
+    g = sprite_generators.NonOverlappingGenerator(self._factors, num_sprites=60)
+    with self.assertRaisesRegex(ValueError, 'max_density'):
+      g()
+    self.assertEqual(g.stats['num_proposals'], 60)
+    # Feasible density but too few tries.
+    factors = distribs.Product([
+        distribs.Continuous('x', 0.4, 0.6),
+        distribs.Continuous('y', 0.4, 0.6),
+        distribs.Discrete('scale', [0.1]),
+    ])
+    g = sprite_generators.NonOverlappingGenerator(
+        factors, num_sprites=5, max_tries=50)
+    with self.assertRaisesRegex(ValueError, 'tries'):
+      g()
+
+  def testRetriesMoveCopulaPositions(self):
+    # Positions computed from the scene's shared copula uniforms start out
+    # identical, so only retries with fresh uniforms can separate them.
+    factors = distribs.Product([
+        distribs.Beta('x', 2., 2., non_ident=True),
+        distribs.Beta('y', 2., 2., non_ident=True),
+        distribs.Discrete('scale', [0.05]),
+    ])
+    g = sprite_generators.NonOverlappingGenerator(
+        factors, num_sprites=4, max_tries=100)
+    sprites = g(rng=np.random.default_rng(0))
+    self.assertLen(set(s.x for s in sprites), 4)
+    for i, s_0 in enumerate(sprites):
+      for s_1 in sprites[i + 1:]:
+        self.assertGreaterEqual(
+            np.linalg.norm(s_0.position - s_1.position),
+            2 * sprite_generators.bounding_radius('circle', 0.05))
+
+
+class BatchTest(absltest.TestCase):
+
+  def _check_scenes(self, batch, num_sprites, distributions):
+    self.assertIsInstance(batch, sprite_generators.SceneBatch)
+    np.testing.assert_array_equal(batch.num_sprites, num_sprites)
+    for b, scene in enumerate(batch.scenes()):
+      self.assertLen(scene, num_sprites[b])
+      for s, distrib in zip(scene, distributions[b]):
+        self.assertTrue(distrib.contains(s.factors))
+
+  def testGenerateSprites(self):
+    g = sprite_generators.generate_sprites_batch(
+        _distrib_0, num_sprites=lambda rng: rng.choice([0, 1, 2]),
+        max_sprites=3)
+    batch = g(100, rng=np.random.default_rng(0))
+    self.assertEqual(batch.max_sprites, 3)
+    self.assertEqual(set(batch.num_sprites), set([0, 1, 2]))
+    self._check_scenes(batch, batch.num_sprites, [[_distrib_0] * 2] * 100)
+    array = batch.to_array()
+    self.assertEqual(array.shape, (100, 3, len(sprite.FACTOR_NAMES)))
+    for b, scene in enumerate(batch.scenes()):
+      np.testing.assert_array_equal(
+          array[b], sprite.sprites_to_array(scene, num_rows=3))
+    with self.assertRaises(ValueError):
+      sprite_generators.generate_sprites_batch(
+          _distrib_0, num_sprites=4, max_sprites=3)(1)
+
+  def testChainGenerators(self):
+    g_0 = sprite_generators.generate_sprites_batch(_distrib_0, num_sprites=1)
+    g_1 = sprite_generators.generate_sprites_batch(
+        _distrib_1, num_sprites=lambda rng: rng.choice([1, 2]))
+    batch = sprite_generators.chain_generators_batch(g_0, g_1)(
+        50, rng=np.random.default_rng(0))
+    self.assertEqual(batch.max_sprites, 3)
+    self._check_scenes(batch, batch.num_sprites,
+                       [[_distrib_0, _distrib_1, _distrib_1]] * 50)
+
+  def testSampleGenerator(self):
+    g_0 = sprite_generators.generate_sprites_batch(_distrib_0, num_sprites=1)
+    g_1 = sprite_generators.generate_sprites_batch(_distrib_1, num_sprites=2)
+    batch = sprite_generators.sample_generator_batch((g_0, g_1))(
+        100, rng=np.random.default_rng(0))
+    distributions = [
+        [_distrib_0] if n == 1 else [_distrib_1] * 2
+        for n in batch.num_sprites
+    ]
+    self.assertEqual(set(batch.num_sprites), set([1, 2]))
+    self._check_scenes(batch, batch.num_sprites, distributions)
+
+  def testShuffle(self):
+    factors = distribs.Product([distribs.Continuous('x', 0., 1.)])
+    g = sprite_generators.generate_sprites_batch(
+        factors, num_sprites=lambda rng: rng.choice([2, 4]))
+    rng = np.random.default_rng(0)
+    batch = g(200, rng=np.random.default_rng(1))
+    shuffled = sprite_generators.shuffle_batch(
+        lambda batch_size, rng: batch)(200, rng=rng)
+    np.testing.assert_array_equal(shuffled.num_sprites, batch.num_sprites)
+    mask = batch.mask()
+    for b in range(200):
+      np.testing.assert_array_equal(
+          np.sort(shuffled.columns['x'][b][mask[b]]),
+          np.sort(batch.columns['x'][b][mask[b]]))
+    # The first sprite of a scene moves with probability 1 - 1 / num_sprites.
+    moved = shuffled.columns['x'][:, 0] != batch.columns['x'][:, 0]
+    self.assertGreater(np.mean(moved), 0.5)
+
+  def testDeterministic(self):
+    g = sprite_generators.shuffle_batch(
+        sprite_generators.generate_sprites_batch(_distrib_1, num_sprites=3))
+    batch_0 = g(10, rng=np.random.default_rng(1))
+    batch_1 = g(10, rng=np.random.default_rng(1))
+    np.testing.assert_array_equal(batch_0.to_array(), batch_1.to_array())
+
+
 if __name__ == '__main__':
   absltest.main()
@@ -173,5 +173,37 @@ class SpriteTest(parameterized.TestCase):
     self.assertSequenceAlmostEqual(
         np.ravel(s.vertices), np.ravel(scaled_vertices), delta=1e-3)
 
+class FactorArrayTest(absltest.TestCase):
+
+  def testRoundTrip(self):
+    sprites = [
+        sprite.Sprite(x=0.2, y=0.8, shape='triangle', angle=45, scale=0.3,
+                      c0=0.5, c1=0.2, c2=0.1, x_vel=-0.2, y_vel=0.1),
+        sprite.Sprite(shape='star_5'),
+    ]
+    array = sprite.sprites_to_array(sprites, num_rows=3)
+    self.assertEqual(array.shape, (3, len(sprite.FACTOR_NAMES)))
+    self.assertTrue(np.all(np.isnan(array[2])))
+    reconstructed = sprite.array_to_sprites(array)
+    self.assertLen(reconstructed, 2)
+    for s, r in zip(sprites, reconstructed):
+      self.assertEqual(s.shape, r.shape)
+      self.assertSequenceAlmostEqual(
+          [s.factors[k] for k in sprite.FACTOR_NAMES if k != 'shape'],
+          [r.factors[k] for k in sprite.FACTOR_NAMES if k != 'shape'],
+          delta=1e-6)
+
+  def testTooManySprites(self):
+    with self.assertRaises(ValueError):
+      sprite.sprites_to_array([sprite.Sprite()] * 3, num_rows=2)
+
+  def testColumns(self):
+    sprites = [sprite.Sprite(x=0.2, shape='triangle'), sprite.Sprite(x=0.7)]
+    columns = sprite.sprites_to_columns(sprites, factor_names=('x', 'shape'))
+    self.assertEqual(set(columns), {'x', 'shape'})
+    np.testing.assert_allclose(columns['x'], [0.2, 0.7])
+    self.assertEqual(list(columns['shape']), ['triangle', 'circle'])
+
+
 if __name__ == '__main__':
   absltest.main()
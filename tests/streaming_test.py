@@ -0,0 +1,97 @@
+# Copyright 2019 DeepMind Technologies Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ============================================================================
+# python2 python3
+"""Tests for streaming."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from absl.testing import absltest
+import numpy as np
+import torch
+from torch.utils import data
+
+from spriteworld import factor_distributions as distribs
+from spriteworld import renderers
+from spriteworld import sprite as sprite_lib
+from spriteworld import sprite_generators
+from spriteworld import streaming
+
+_CONFIG_NAME = __name__
+
+
+def get_config(mode):
+  """Small config used to stream test scenes."""
+  del mode
+  factors = distribs.Product([
+      distribs.Continuous('x', 0.1, 0.9),
+      distribs.Continuous('y', 0.1, 0.9),
+      distribs.Discrete('shape', ['square', 'triangle', 'circle']),
+      distribs.Discrete('scale', [0.2]),
+      distribs.Continuous('c0', 0., 1.),
+      distribs.Discrete('c1', [1.]),
+      distribs.Discrete('c2', [1.]),
+  ])
+  return {
+      'init_sprites':
+          sprite_generators.generate_sprites(
+              factors, num_sprites=lambda rng: rng.choice([1, 2, 3])),
+      'renderers': {
+          'image':
+              renderers.PILRenderer(
+                  image_size=(16, 16),
+                  color_to_rgb=renderers.color_maps.hsv_to_rgb),
+      },
+  }
+
+
+class SceneStreamTest(absltest.TestCase):
+
+  def _stream(self, **kwargs):
+    return streaming.SceneStream(
+        _CONFIG_NAME, batch_size=4, max_sprites=3, num_batches=2, **kwargs)
+
+  def testShapes(self):
+    batches = list(self._stream(seed=0))
+    self.assertLen(batches, 2)
+    batch = batches[0]
+    self.assertEqual(batch['image'].shape, (4, 16, 16, 3))
+    self.assertEqual(batch['image'].dtype, torch.uint8)
+    self.assertEqual(batch['masks'].shape, (4, 3, 16, 16))
+    self.assertEqual(batch['masks'].dtype, torch.bool)
+    self.assertEqual(batch['factors'].shape,
+                     (4, 3, len(sprite_lib.FACTOR_NAMES)))
+    self.assertEqual(batch['num_sprites'].dtype, torch.int32)
+
+  def testSeed(self):
+    batches_0 = list(self._stream(seed=0))
+    batches_1 = list(self._stream(seed=0))
+    batches_2 = list(self._stream(seed=1))
+    for b_0, b_1, b_2 in zip(batches_0, batches_1, batches_2):
+      self.assertTrue(torch.equal(b_0['image'], b_1['image']))
+      self.assertFalse(torch.equal(b_0['image'], b_2['image']))
+
+  def testWorkersDoNotDuplicate(self):
+    loader = data.DataLoader(self._stream(seed=0), batch_size=None,
+                             num_workers=2)
+    factors = [b['factors'].numpy() for b in loader]
+    self.assertLen(factors, 4)
+    x = np.concatenate([f[:, 0, 0] for f in factors])
+    self.assertLen(np.unique(x), len(x))
+
+
+if __name__ == '__main__':
+  absltest.main()
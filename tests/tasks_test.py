@@ -24,6 +24,8 @@ from absl.testing import parameterized
 import mock
 import numpy as np
 
+from spriteworld import action_spaces
+from spriteworld import environment
 from spriteworld import factor_distributions as distribs
 from spriteworld import sprite
 from spriteworld import tasks
@@ -51,6 +53,8 @@ class GoalPositionTest(parameterized.TestCase):
         goal_position=goal_position, terminate_distance=0.1)
     self.assertAlmostEqual(task.reward(sprites), reward, delta=0.1)
     self.assertEqual(task.success(sprites), success)
+    self.assertEqual(task.evaluate(sprites),
+                     (task.reward(sprites), task.success(sprites)))
 
   @parameterized.parameters(
       ([np.array([0.4, 0.6])], 0.15, 0.4, True),
@@ -206,6 +210,9 @@ class ClusteringTest(parameterized.TestCase):
     task = tasks.Clustering(cluster_distribs=cluster_distribs)
     self.assertAlmostEqual(task.reward(sprites), reward, delta=0.1)
     self.assertEqual(task.success(sprites), success)
+    evaluated_reward, evaluated_success = task.evaluate(sprites)
+    self.assertAlmostEqual(evaluated_reward, reward, delta=0.1)
+    self.assertEqual(evaluated_success, success)
 
   @parameterized.parameters(
       ([[0.2, 0.2], [0.3, 0.3]], [[0.8, 0.8], [0.8, 0.9], [0.9, 0.9]], 18.7),
@@ -293,6 +300,117 @@ class ClusteringTest(parameterized.TestCase):
         termination_threshold=termination_threshold)
     self.assertAlmostEqual(task.reward(self.sprites), reward, delta=0.1)
 
+  def testCacheFollowsSprites(self):
+    task = tasks.Clustering(cluster_distribs=self.cluster_distribs)
+    self.assertAlmostEqual(task.reward(self.sprites), 17.5, delta=0.1)
+    self.assertTrue(task.success(self.sprites))
+    self.sprites[0].move(np.array([0.5, 0.6]))
+    self.assertLess(task.reward(self.sprites), 0.)
+    self.assertFalse(task.success(self.sprites))
+
+  @parameterized.parameters(
+      (distribs.Continuous('c0', 190, 256),),
+      # Assignments depending on positions are recomputed on every move.
+      (distribs.Product([
+          distribs.Continuous('c0', 190, 256),
+          distribs.Continuous('x', 0.5, 1.)]),),
+  )
+  def testIncrementalMetric(self, second_cluster):
+    cluster_distribs = [self.cluster_distribs[0], second_cluster]
+    task = tasks.Clustering(cluster_distribs=cluster_distribs)
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+      self.sprites[rng.randint(len(self.sprites))].move(
+          rng.uniform(-0.05, 0.05, size=2))
+      expected = tasks.Clustering(cluster_distribs=cluster_distribs)
+      self.assertAlmostEqual(
+          task.reward(self.sprites), expected.reward(self.sprites))
+    # A new scene is recomputed from scratch.
+    self.sprites[0].move(np.array([0.1, 0.1]))
+    self.sprites[1].move(np.array([0.1, 0.1]))
+    self.assertAlmostEqual(
+        task.reward(self.sprites),
+        tasks.Clustering(cluster_distribs=cluster_distribs).reward(
+            self.sprites))
+
+  def testIncrementalRelabel(self):
+    cluster_distribs = [
+        distribs.Continuous('x', 0., 0.5),
+        distribs.Continuous('x', 0.5, 1.),
+    ]
+    sprites = self.sprites + [sprite.Sprite(x=0.25, y=0.3, c0=64)]
+    task = tasks.Clustering(cluster_distribs=cluster_distribs)
+    task.reward(sprites)
+    # The last sprite changes cluster, then moves within it and back.
+    for motion in ([0.45, 0.], [0., 0.1], [-0.45, 0.]):
+      sprites[4].move(np.array(motion))
+      with mock.patch.object(
+          tasks, 'DaviesBouldinStats',
+          wraps=tasks.DaviesBouldinStats) as stats, mock.patch.object(
+              tasks.sprite_lib, 'sprites_to_columns') as sprites_to_columns:
+        reward = task.reward(sprites)
+      stats.assert_not_called()
+      sprites_to_columns.assert_not_called()
+      self.assertAlmostEqual(
+          reward,
+          tasks.Clustering(cluster_distribs=cluster_distribs).reward(sprites))
+
+
+class DaviesBouldinScoreTest(absltest.TestCase):
+
+  def testValue(self):
+    positions = [[0., 0.], [0., 2.], [10., 0.], [10., 2.], [10., 1.]]
+    labels = [3, 3, 1, 1, 1]
+    # Mean distances to centroids are 1 and 2/3, centroids are 10 apart.
+    self.assertAlmostEqual(
+        tasks.davies_bouldin_score(positions, labels), (1. + 2. / 3) / 10.)
+
+  def testCoincidentPoints(self):
+    positions = [[0., 0.], [0., 0.], [1., 1.]]
+    self.assertEqual(tasks.davies_bouldin_score(positions, [0, 0, 1]), 0.)
+
+  def testStatsMove(self):
+    rng = np.random.RandomState(0)
+    positions = rng.uniform(size=(8, 2))
+    labels = np.array([0, 0, 0, 1, 1, 2, 2, -1])
+    stats = tasks.DaviesBouldinStats(positions, labels)
+    for index in [0, 4, 7, 5, 0]:
+      positions[index] = rng.uniform(size=2)
+      stats.move(index, positions[index])
+      self.assertAlmostEqual(
+          stats.score(),
+          tasks.davies_bouldin_score(positions[:7], labels[:7]))
+
+  def testStatsRelabel(self):
+    rng = np.random.RandomState(0)
+    positions = rng.uniform(size=(8, 2))
+    labels = np.array([0, 0, 0, 1, 1, 2, 2, -1])
+    stats = tasks.DaviesBouldinStats(positions, labels)
+    for index, label in [(0, 1), (7, 2), (4, -1), (1, 0)]:
+      positions[index] = rng.uniform(size=2)
+      labels[index] = label
+      stats.move(index, positions[index], label)
+      clustered = labels >= 0
+      self.assertAlmostEqual(
+          stats.score(),
+          tasks.davies_bouldin_score(positions[clustered], labels[clustered]))
+
+  def testStatsCannotChangeClusters(self):
+    stats = tasks.DaviesBouldinStats(
+        [[0., 0.], [0., 1.], [1., 1.], [1., 0.]], [0, 0, 1, -1])
+    self.assertTrue(stats.can_move(3, 1))
+    self.assertFalse(stats.can_move(3, 2))  # New cluster.
+    self.assertFalse(stats.can_move(2, 0))  # Empties cluster 1.
+    self.assertFalse(stats.can_move(0, -1))  # As many clusters as points.
+    with self.assertRaises(ValueError):
+      stats.move(2, [1., 1.], 0)
+
+  def testInvalidNumberOfClusters(self):
+    with self.assertRaises(ValueError):
+      tasks.davies_bouldin_score([[0., 0.], [1., 1.]], [0, 0])
+    with self.assertRaises(ValueError):
+      tasks.davies_bouldin_score([[0., 0.], [1., 1.]], [0, 1])
+
 
 class MetaAggregatedTest(parameterized.TestCase):
 
@@ -354,6 +472,8 @@ class MetaAggregatedTest(parameterized.TestCase):
     sprites, reward_list = self._get_sprites_and_reward_list(successes)
     self.assertAlmostEqual(task.reward(sprites), sum(reward_list), delta=0.1)
     self.assertEqual(task.success(sprites), success)
+    self.assertEqual(task.evaluate(sprites),
+                     (task.reward(sprites), task.success(sprites)))
 
   @parameterized.parameters(
       ((True, True, True),),
@@ -408,6 +528,31 @@ class MetaAggregatedTest(parameterized.TestCase):
     sprites, _ = self._get_sprites_and_reward_list(successes)
     self.assertAlmostEqual(task.reward(sprites), reward, delta=0.1)
 
+  def testSubtasksEvaluatedOncePerStep(self):
+    subtasks = [
+        mock.Mock(wraps=tasks.Clustering(
+            cluster_distribs=[
+                distribs.Continuous('c0', 0, 100),
+                distribs.Continuous('c0', 100, 256),
+            ])),
+        mock.Mock(wraps=self.subtasks[0]),
+    ]
+    env = environment.Environment(
+        task=tasks.MetaAggregated(subtasks, terminate_bonus=1.),
+        action_space=action_spaces.SelectMove(),
+        renderers={},
+        init_sprites=lambda: [
+            sprite.Sprite(x=0.1 * i + 0.2, y=0.3, c0=50 + 100 * (i % 2))
+            for i in range(4)
+        ])
+    env.reset()
+    for i in range(1, 4):
+      env.step(np.array([0.5, 0.5, 0.5, 0.5]))
+      for subtask in subtasks:
+        self.assertEqual(subtask.evaluate.call_count, i)
+        self.assertEqual(subtask.reward.call_count, 0)
+        self.assertEqual(subtask.success.call_count, 0)
+
 
 if __name__ == '__main__':
   absltest.main()